@@ -1,19 +1,66 @@
 import os
+import asyncio
 import logging
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, status, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, EmailStr, Field, validator
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from supabase import create_client, Client
-import httpx
 from dotenv import load_dotenv
-import uvicorn
+import orjson
+
+from models import (
+    UserRegister,
+    UserLogin,
+    UserResponse,
+    TokenResponse,
+    RefreshRequest,
+    AccessTokenResponse,
+    StreamTicketResponse,
+    LogoutRequest,
+    TransactionCreate,
+    TransactionResponse,
+    TransactionBatchCreate,
+    TransactionBatchItemResult,
+    TransactionBatchResponse,
+    KYCUpdateRequest,
+    BitcoinPriceResponse,
+    PriceCandles,
+    OrderBookDepth,
+    PlatformStats,
+)
+from audit import AuditLog
+from auth import ACCESS, REFRESH, STREAM, InvalidToken, TokenAuthority, parse_keys
+from cache import LRUCache, SWRCache
+from cache_sync import CacheInvalidations
+from compression import CompressionMiddleware, compression_counters, parse_levels
+from escrow_scheduler import EscrowExpiryScheduler
+from idempotency import IdempotencyMiddleware, IdempotencyStore
+from metrics import Counter, Gauge, MetricsMiddleware, registry, span
+from order_book import MatchingEngine
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from passwords import PasswordHasher, PasswordPoolBusy
+from price_history import CANDLE_INTERVALS, PriceHistory
+from price_service import PRICE_CACHE_KEY, PriceService
+from price_sources import PRICE_SOURCES, PriceAggregator
+from rate_limit import (
+    InMemoryBucketBackend,
+    RateLimitMiddleware,
+    RatePolicy,
+    RedisBucketBackend,
+    RouteRule,
+    client_ip,
+    rate_limit_counters,
+)
+from repository import AlreadyExists, Database
+from response_cache import CachedResponse, ResponseCache, make_etag
+from serialization import RowSerializer
+from stats_engine import StatsEngine
+from streaming import PRICE_TOPIC, Broadcaster, Event, TooManySubscribers, transactions_topic
 
 # Load environment variables
 load_dotenv()
@@ -28,115 +75,361 @@ logger = logging.getLogger(__name__)
 # Configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_HOURS = 24
-BITCOIN_API_URL = "https://api.coingecko.com/api/v3/simple/price"
+# Signing keys by key id, e.g. "2026-10:secret,2026-07:older-secret"; JWT_SECRET_KEY alone when unset
+JWT_KEYS = parse_keys(os.getenv("JWT_KEYS", "")) or {"default": JWT_SECRET_KEY}
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID") or next(iter(JWT_KEYS))
+JWT_ACCESS_TTL_SECONDS = float(os.getenv("JWT_ACCESS_TTL_SECONDS", "900"))
+JWT_REFRESH_TTL_SECONDS = float(os.getenv("JWT_REFRESH_TTL_SECONDS", str(30 * 86400)))
+JWT_VERIFIED_CACHE_SIZE = int(os.getenv("JWT_VERIFIED_CACHE_SIZE", "10000"))
+JWT_REVOCATION_SYNC_SECONDS = float(os.getenv("JWT_REVOCATION_SYNC_SECONDS", "5"))
+# When enabled, kyc_level and is_admin are embedded in access tokens so that
+# endpoints which only need those claims can skip the user lookup. A KYC change
+# then only reaches those endpoints once the user gets a new token.
+JWT_EMBED_USER_CLAIMS = os.getenv("JWT_EMBED_USER_CLAIMS", "false").lower() == "true"
+TRANSACTIONS_MAX_PAGE_SIZE = int(os.getenv("TRANSACTIONS_MAX_PAGE_SIZE", "200"))
+TRANSACTIONS_EXPORT_BATCH_SIZE = int(os.getenv("TRANSACTIONS_EXPORT_BATCH_SIZE", "1000"))
+STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", "15"))
+STATS_RECONCILE_SECONDS = float(os.getenv("STATS_RECONCILE_SECONDS", "300"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_DURABLE = os.getenv("IDEMPOTENCY_DURABLE", "false").lower() == "true"
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_AUTH = os.getenv("RATE_LIMIT_AUTH", "10/60")
+RATE_LIMIT_PRICE = os.getenv("RATE_LIMIT_PRICE", "600/60")
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "300/60")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "false").lower() == "true"
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", "4"))
+PASSWORD_POOL_MAX_PENDING = int(os.getenv("PASSWORD_POOL_MAX_PENDING", "64"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "10"))
+CACHE_SYNC_SECONDS = float(os.getenv("CACHE_SYNC_SECONDS", "1"))
+BITCOIN_PRICE_SOURCES = [s.strip() for s in os.getenv("BITCOIN_PRICE_SOURCES", "coingecko,binance,mercadobitcoin").split(",") if s.strip()]
+BITCOIN_PRICE_AGGREGATION = os.getenv("BITCOIN_PRICE_AGGREGATION", "median")
+BITCOIN_PRICE_QUORUM = int(os.getenv("BITCOIN_PRICE_QUORUM", "2"))
+BITCOIN_PRICE_SOURCE_TIMEOUT_SECONDS = float(os.getenv("BITCOIN_PRICE_SOURCE_TIMEOUT_SECONDS", "2"))
+BITCOIN_PRICE_HEDGE_DELAY_SECONDS = float(os.getenv("BITCOIN_PRICE_HEDGE_DELAY_SECONDS", "0.3"))
+BITCOIN_PRICE_BREAKER_FAILURES = int(os.getenv("BITCOIN_PRICE_BREAKER_FAILURES", "3"))
+BITCOIN_PRICE_BREAKER_RESET_SECONDS = float(os.getenv("BITCOIN_PRICE_BREAKER_RESET_SECONDS", "30"))
+BITCOIN_PRICE_REFRESH_SECONDS = float(os.getenv("BITCOIN_PRICE_REFRESH_SECONDS", "30"))
+BITCOIN_PRICE_TTL_SECONDS = float(os.getenv("BITCOIN_PRICE_TTL_SECONDS", "60"))
+BITCOIN_PRICE_STALE_SECONDS = float(os.getenv("BITCOIN_PRICE_STALE_SECONDS", "300"))
+PRICE_HISTORY_ENABLED = os.getenv("PRICE_HISTORY_ENABLED", "true").lower() == "true"
+PRICE_HISTORY_FLUSH_SECONDS = float(os.getenv("PRICE_HISTORY_FLUSH_SECONDS", "60"))
+PRICE_HISTORY_BATCH_SIZE = int(os.getenv("PRICE_HISTORY_BATCH_SIZE", "500"))
+CANDLES_MAX_COUNT = int(os.getenv("CANDLES_MAX_COUNT", "1000"))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", "10000"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+STREAM_TICKET_TTL_SECONDS = float(os.getenv("STREAM_TICKET_TTL_SECONDS", "30"))
+ORDER_MATCHING_ENABLED = os.getenv("ORDER_MATCHING_ENABLED", "true").lower() == "true"
+ORDER_MATCHING_FLUSH_SECONDS = float(os.getenv("ORDER_MATCHING_FLUSH_SECONDS", "1"))
+ORDER_MATCHING_BATCH_SIZE = int(os.getenv("ORDER_MATCHING_BATCH_SIZE", "500"))
+ORDER_MATCHING_SYNC_SECONDS = float(os.getenv("ORDER_MATCHING_SYNC_SECONDS", "1"))
+ORDER_MATCHING_MAX_PENDING = int(os.getenv("ORDER_MATCHING_MAX_PENDING", "10000"))
+ORDER_MATCHING_MAX_ATTEMPTS = int(os.getenv("ORDER_MATCHING_MAX_ATTEMPTS", "3"))
+ESCROW_TTL_SECONDS = float(os.getenv("ESCROW_TTL_SECONDS", "1800"))
+ORDER_BOOK_MAX_DEPTH = int(os.getenv("ORDER_BOOK_MAX_DEPTH", "100"))
+ESCROW_EXPIRY_ENABLED = os.getenv("ESCROW_EXPIRY_ENABLED", "true").lower() == "true"
+ESCROW_EXPIRY_LOOKAHEAD_SECONDS = float(os.getenv("ESCROW_EXPIRY_LOOKAHEAD_SECONDS", "300"))
+ESCROW_EXPIRY_REFRESH_SECONDS = float(os.getenv("ESCROW_EXPIRY_REFRESH_SECONDS", "30"))
+ESCROW_EXPIRY_BATCH_SIZE = int(os.getenv("ESCROW_EXPIRY_BATCH_SIZE", "500"))
+JSON_DIRECT_SERIALIZATION = os.getenv("JSON_DIRECT_SERIALIZATION", "true").lower() == "true"
+AUDIT_DATABASE_ENABLED = os.getenv("AUDIT_DATABASE_ENABLED", "true").lower() == "true"
+AUDIT_LOG_ENABLED = os.getenv("AUDIT_LOG_ENABLED", "true").lower() == "true"
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_MAX_PENDING = int(os.getenv("AUDIT_MAX_PENDING", "10000"))
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+COMPRESSION_LEVELS = os.getenv(
+    "COMPRESSION_LEVELS",
+    "application/json=zstd:1,br:1,gzip:1;application/x-ndjson=zstd:1,br:1,gzip:1;text/plain=zstd:3,br:4,gzip:6",
+)
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Supabase data access, connected in lifespan
+db = Database(
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    max_connections=SUPABASE_MAX_CONNECTIONS,
+    max_keepalive_connections=SUPABASE_MAX_CONNECTIONS // 2,
+    timeout=SUPABASE_TIMEOUT_SECONDS,
+    idempotency_ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+)
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing, run on a bounded thread pool
+password_hasher = PasswordHasher(
+    rounds=BCRYPT_ROUNDS,
+    max_workers=PASSWORD_POOL_WORKERS,
+    max_pending=PASSWORD_POOL_MAX_PENDING,
+)
+
+# KYC limits in BRL (example values): per transaction, and cumulative across one batch request
+KYC_TRANSACTION_LIMITS = {
+    1: 1000.0,    # R$ 1,000 per transaction
+    2: 10000.0,   # R$ 10,000 per transaction
+    3: 100000.0   # R$ 100,000 per transaction
+}
+KYC_BATCH_LIMITS = {
+    1: 5000.0,
+    2: 50000.0,
+    3: 1000000.0
+}
 
 # Security
 security = HTTPBearer()
 
-# Pydantic models
-class UserRegister(BaseModel):
-    email: EmailStr
-    password: str = Field(..., min_length=8)
-    full_name: str = Field(..., min_length=2, max_length=100)
-    cpf: str = Field(..., regex="^[0-9]{11}$")
-    phone: str = Field(..., regex="^[0-9]{10,11}$")
-    
-    @validator('password')
-    def validate_password(cls, v):
-        if not any(char.isdigit() for char in v):
-            raise ValueError('Password must contain at least one digit')
-        if not any(char.isupper() for char in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        if not any(char.islower() for char in v):
-            raise ValueError('Password must contain at least one lowercase letter')
-        return v
-
-class UserLogin(BaseModel):
-    email: EmailStr
-    password: str
-
-class UserResponse(BaseModel):
-    id: str
-    email: str
-    full_name: str
-    cpf: str
-    phone: str
-    kyc_level: int
-    is_admin: bool
-    created_at: datetime
-
-class TokenResponse(BaseModel):
-    access_token: str
-    token_type: str = "bearer"
-    user: UserResponse
-
-class TransactionCreate(BaseModel):
-    type: str = Field(..., regex="^(buy|sell)$")
-    amount_brl: float = Field(..., gt=0)
-    amount_btc: float = Field(..., gt=0)
-    price_per_btc: float = Field(..., gt=0)
-    payment_method: str = Field(..., regex="^(pix|bank_transfer)$")
-    description: Optional[str] = None
-
-class TransactionResponse(BaseModel):
-    id: str
-    user_id: str
-    type: str
-    amount_brl: float
-    amount_btc: float
-    price_per_btc: float
-    payment_method: str
-    status: str
-    description: Optional[str]
-    created_at: datetime
-    updated_at: datetime
-
-class KYCUpdateRequest(BaseModel):
-    user_id: str
-    kyc_level: int = Field(..., ge=1, le=3)
-
-class BitcoinPriceResponse(BaseModel):
-    price_brl: float
-    price_usd: float
-    last_updated: datetime
-    change_24h: float
-    volume_24h: float
-
-class PlatformStats(BaseModel):
-    total_users: int
-    total_transactions: int
-    total_volume_brl: float
-    total_volume_btc: float
-    active_users_24h: int
-    transactions_24h: int
-    average_transaction_brl: float
+# Access and refresh tokens: verified tokens are cached, revocations are shared between workers
+token_authority = TokenAuthority(
+    JWT_KEYS,
+    JWT_ACTIVE_KID,
+    access_ttl=JWT_ACCESS_TTL_SECONDS,
+    refresh_ttl=JWT_REFRESH_TTL_SECONDS,
+    cache_size=JWT_VERIFIED_CACHE_SIZE,
+    sync_interval=JWT_REVOCATION_SYNC_SECONDS,
+    algorithm=JWT_ALGORITHM,
+)
+
+# Response bodies written straight from database rows, skipping per-row model instances
+token_serializer = RowSerializer(TokenResponse, direct=JSON_DIRECT_SERIALIZATION)
+user_serializer = RowSerializer(UserResponse, direct=JSON_DIRECT_SERIALIZATION)
+transaction_serializer = RowSerializer(TransactionResponse, direct=JSON_DIRECT_SERIALIZATION)
+transaction_page_serializer = RowSerializer(TransactionResponse, many=True, direct=JSON_DIRECT_SERIALIZATION)
+
+# Rate limiting; swapped for the shared Redis backend in lifespan when configured
+rate_limit_backend = InMemoryBucketBackend(max_keys=RATE_LIMIT_MAX_KEYS)
+
+# Authenticated user records, keyed by user id
+user_cache: LRUCache[Dict[str, Any]] = LRUCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+# Serialized read responses and their ETags, scoped by user or transaction id and
+# invalidated by the writes that change them
+response_cache = ResponseCache(max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL_SECONDS)
+# Invalidations of both caches reach the other workers within about two CACHE_SYNC_SECONDS
+cache_invalidations = CacheInvalidations(sync_interval=CACHE_SYNC_SECONDS)
+cache_invalidations.register("user", user_cache.invalidate)
+cache_invalidations.register("response", response_cache.invalidate)
+# Per-user bodies may be stored by the browser but must be revalidated, and never by shared caches
+PRIVATE_CACHE_HEADERS = {"Cache-Control": "private, no-cache"}
+
+# Admin dashboard statistics: maintained incrementally, with the SQL
+# aggregate (cached) as a fallback until the first reconciliation succeeds
+stats_cache: SWRCache[PlatformStats] = SWRCache(ttl=STATS_CACHE_TTL_SECONDS)
+stats_engine = StatsEngine(
+    windows={"1h": 3600, "24h": 86400, "7d": 7 * 86400},
+    reconcile_interval=STATS_RECONCILE_SECONDS,
+)
+
+# Bitcoin price cache, refreshed in the background while the app is running
+price_service = PriceService(
+    PriceAggregator(
+        [PRICE_SOURCES[name]() for name in BITCOIN_PRICE_SOURCES],
+        timeout=BITCOIN_PRICE_SOURCE_TIMEOUT_SECONDS,
+        hedge_delay=BITCOIN_PRICE_HEDGE_DELAY_SECONDS,
+        quorum=BITCOIN_PRICE_QUORUM,
+        method=BITCOIN_PRICE_AGGREGATION,
+        failure_threshold=BITCOIN_PRICE_BREAKER_FAILURES,
+        reset_timeout=BITCOIN_PRICE_BREAKER_RESET_SECONDS,
+    ),
+    refresh_interval=BITCOIN_PRICE_REFRESH_SECONDS,
+    ttl=BITCOIN_PRICE_TTL_SECONDS,
+    stale_ttl=BITCOIN_PRICE_STALE_SECONDS,
+)
+
+# Fetched quotes are written to crypto_prices in batches and aggregated into candles
+price_history = PriceHistory(
+    flush_interval=PRICE_HISTORY_FLUSH_SECONDS,
+    batch_size=PRICE_HISTORY_BATCH_SIZE,
+    persist=PRICE_HISTORY_ENABLED,
+)
+price_service.add_listener(price_history.record)
+
+# Live price and transaction updates for SSE/WebSocket subscribers, fed by the
+# price refresh loop and by transaction writes instead of client polling
+broadcaster = Broadcaster(queue_size=STREAM_QUEUE_SIZE, max_subscribers=STREAM_MAX_SUBSCRIBERS)
+price_service.add_listener(lambda price: broadcaster.publish(PRICE_TOPIC, "price", price))
+
+# Pending buy/sell transactions are matched in memory by price-time priority;
+# fills and their escrows are written in batches. Transactions created by other
+# workers are picked up from the database every ORDER_MATCHING_SYNC_SECONDS.
+matching_engine = MatchingEngine(
+    escrow_ttl=ESCROW_TTL_SECONDS,
+    flush_interval=ORDER_MATCHING_FLUSH_SECONDS,
+    batch_size=ORDER_MATCHING_BATCH_SIZE,
+    sync_interval=ORDER_MATCHING_SYNC_SECONDS,
+    max_pending=ORDER_MATCHING_MAX_PENDING,
+    max_attempts=ORDER_MATCHING_MAX_ATTEMPTS,
+)
+# Depth from the database, for workers that do not run the matching engine
+order_book_cache: SWRCache[OrderBookDepth] = SWRCache(ttl=ORDER_MATCHING_FLUSH_SECONDS)
+matching_engine.add_listener(
+    lambda row: broadcaster.publish(transactions_topic(row["user_id"]), "transaction", TransactionResponse(**row))
+)
+
+def invalidate_matched_orders(orders: List[Dict[str, Any]]) -> None:
+    # Only once the fills are stored, or a read in between would cache the unfilled rows again
+    for order in orders:
+        cache_invalidations.invalidate("response", order["id"])
+        cache_invalidations.invalidate("response", order["user_id"])
+
+matching_engine.add_flush_listener(invalidate_matched_orders)
+
+# Escrows still awaiting payment are cancelled when they expire; buyer and seller are notified
+escrow_scheduler = EscrowExpiryScheduler(
+    lookahead=ESCROW_EXPIRY_LOOKAHEAD_SECONDS,
+    refresh_interval=ESCROW_EXPIRY_REFRESH_SECONDS,
+    batch_size=ESCROW_EXPIRY_BATCH_SIZE,
+)
+
+def publish_expired_escrows(escrows: List[Dict[str, Any]]) -> None:
+    for escrow in escrows:
+        for user_id in {escrow["seller_id"], escrow["buyer_id"]}:
+            broadcaster.publish(transactions_topic(user_id), "escrow_expired", escrow)
+
+escrow_scheduler.add_listener(publish_expired_escrows)
+
+# Audit events from the handlers, stored in audit_events and logged as JSON by a background flush
+audit_log = AuditLog(
+    flush_interval=AUDIT_FLUSH_SECONDS,
+    batch_size=AUDIT_BATCH_SIZE,
+    max_pending=AUDIT_MAX_PENDING,
+    persist=AUDIT_DATABASE_ENABLED,
+    event_logger=logging.getLogger("audit") if AUDIT_LOG_ENABLED else None,
+)
+
+def is_primary_worker() -> bool:
+    """Whether this process runs the work that must happen once per deployment.
+
+    ``server.py`` numbers its workers through ``SERVER_WORKER_INDEX``; worker 0
+    matches orders, expires escrows and persists price ticks. A process started
+    any other way is taken to be the only worker.
+    """
+    return os.getenv("SERVER_WORKER_INDEX", "0") == "0"
+
+def check_settings() -> None:
+    """Fail startup, rather than import, when required settings are missing."""
+    missing = [name for name, value in (("SUPABASE_URL", SUPABASE_URL), ("SUPABASE_KEY", SUPABASE_KEY)) if not value]
+    if missing:
+        raise RuntimeError(f"Missing required settings: {', '.join(missing)}")
+
+async def start_price_feed() -> None:
+    await price_history.start(db.prices)
+    await price_service.start()
 
 # Lifespan context manager for startup/shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up FastAPI application...")
+    started = time.perf_counter()
+    check_settings()
+    # Everything holding connections, threads or tasks is created here, after
+    # the server has forked, so each worker gets its own
+    primary = is_primary_worker()
+    price_history.persist = PRICE_HISTORY_ENABLED and primary
+    global rate_limit_backend
+    if RATE_LIMIT_ENABLED and RATE_LIMIT_REDIS_URL:
+        rate_limit_backend = RedisBucketBackend(RATE_LIMIT_REDIS_URL)
+    await db.connect()
+    # The loads below are independent, so they share one round of waiting;
+    # price history goes first in its chain because it records the first quote
+    startup = [
+        password_hasher.warm_up(),
+        start_price_feed(),
+        stats_engine.start(db.stats),
+        token_authority.start(db.tokens),
+        cache_invalidations.start(db.invalidations),
+    ]
+    if ORDER_MATCHING_ENABLED and primary:
+        startup.append(matching_engine.start(db.orders))
+    if ESCROW_EXPIRY_ENABLED and primary:
+        startup.append(escrow_scheduler.start(db.escrows))
+    await asyncio.gather(*startup)
+    audit_log.start(db.audit)
+    token_authority.warm_up()
+    logger.info(f"Startup finished in {(time.perf_counter() - started) * 1000:.0f} ms")
     yield
     # Shutdown
     logger.info("Shutting down FastAPI application...")
+    broadcaster.close()
+    await price_service.stop()
+    await price_history.stop()
+    await escrow_scheduler.stop()
+    await matching_engine.stop()
+    await stats_engine.stop()
+    await token_authority.stop()
+    await cache_invalidations.stop()
+    # Last, so events recorded by requests that were still finishing are stored
+    await audit_log.stop()
+    password_hasher.stop()
+    await rate_limit_backend.close()
+    await db.close()
 
 # Create FastAPI app
 app = FastAPI(
     title="RioPortoP2P API",
     description="Backend API for P2P Bitcoin trading platform",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
+def request_subject(scope: dict) -> Optional[str]:
+    """The user id of a valid bearer access token on the request, if any."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    return decode_access_token(token)["sub"]
+                except HTTPException:
+                    pass
+            break
+    return None
+
+# Replay responses for retried POST/PATCH requests carrying an Idempotency-Key.
+# Keys belong to the user rather than the token, so retries survive a refresh.
+def idempotency_identity(scope: dict) -> str:
+    subject = request_subject(scope)
+    return f"user:{subject}" if subject is not None else "anonymous"
+
+idempotency_store = IdempotencyStore(max_entries=IDEMPOTENCY_MAX_KEYS, ttl=IDEMPOTENCY_TTL_SECONDS)
+app.add_middleware(
+    IdempotencyMiddleware,
+    store=idempotency_store,
+    repository_getter=lambda: db.idempotency if IDEMPOTENCY_DURABLE else None,
+    identify=idempotency_identity,
+)
+
+# Token-bucket rate limiting per user (or client IP when unauthenticated)
+def rate_limit_identity(scope: dict) -> str:
+    subject = request_subject(scope)
+    if subject is not None:
+        return f"user:{subject}"
+    return f"ip:{client_ip(scope, trust_proxy=RATE_LIMIT_TRUST_PROXY)}"
+
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        rules=[
+            RouteRule(RatePolicy.parse("auth", RATE_LIMIT_AUTH), "/api/auth/", frozenset({"POST"})),
+            RouteRule(RatePolicy.parse("price", RATE_LIMIT_PRICE), "/api/bitcoin/"),
+        ],
+        default_policy=RatePolicy.parse("default", RATE_LIMIT_DEFAULT),
+        backend_getter=lambda: rate_limit_backend,
+        identify=rate_limit_identity,
+    )
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -144,49 +437,104 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Negotiated gzip/brotli/zstd response compression; event streams are not listed and pass through
+if COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        levels=parse_levels(COMPRESSION_LEVELS),
+        minimum_size=COMPRESSION_MINIMUM_SIZE,
+    )
+
+# Request latency histograms and in-flight gauge, outermost so every response is counted
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, server_timing=METRICS_SERVER_TIMING)
+
 # Helper functions
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def password_pool_busy(exc: PasswordPoolBusy) -> HTTPException:
+    logger.warning("Password hashing pool saturated, rejecting request")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server busy, please retry",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Return whether the password matches and, if the hash is outdated, a new hash."""
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordPoolBusy as e:
+        raise password_pool_busy(e)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordPoolBusy as e:
+        raise password_pool_busy(e)
+
+def user_token_data(user: Dict[str, Any]) -> Dict[str, Any]:
+    data = {"sub": user["id"]}
+    if JWT_EMBED_USER_CLAIMS:
+        data["kyc_level"] = user.get("kyc_level", 1)
+        data["is_admin"] = user.get("is_admin", False)
+    return data
 
 def create_access_token(data: dict) -> str:
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
-    return encoded_jwt
+    with span("jwt", "encode"):
+        return token_authority.issue(data)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
-    token = credentials.credentials
+def create_refresh_token(user_id: str) -> str:
+    with span("jwt", "encode"):
+        return token_authority.issue({"sub": user_id}, REFRESH)
+
+def token_response(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Body of the register and login responses: a token pair and the user."""
+    return {
+        "access_token": create_access_token(user_token_data(user)),
+        "expires_in": int(JWT_ACCESS_TTL_SECONDS),
+        "refresh_token": create_refresh_token(user["id"]),
+        "user": user,
+    }
+
+def decode_access_token(token: str, token_type: str = ACCESS) -> Dict[str, Any]:
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    except JWTError:
+        with span("jwt", "decode"):
+            return token_authority.verify(token, token_type)
+    except InvalidToken:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+async def load_user(user_id: str) -> Dict[str, Any]:
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
     
     # Get user from database
-    response = supabase.table("users").select("*").eq("id", user_id).single().execute()
-    if not response.data:
+    user = await db.users.get_by_id(user_id)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    return response.data
+    user_cache.set(user_id, user)
+    return user
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+    payload = decode_access_token(credentials.credentials)
+    return await load_user(payload["sub"])
+
+async def get_current_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+    """Return id, kyc_level and is_admin, from the token itself when it carries them."""
+    payload = decode_access_token(credentials.credentials)
+    if JWT_EMBED_USER_CLAIMS and "kyc_level" in payload and "is_admin" in payload:
+        return {"id": payload["sub"], "kyc_level": payload["kyc_level"], "is_admin": payload["is_admin"]}
+    return await load_user(payload["sub"])
 
 async def get_admin_user(current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
     if not current_user.get("is_admin", False):
@@ -196,32 +544,37 @@ async def get_admin_user(current_user: Dict[str, Any] = Depends(get_current_user
         )
     return current_user
 
+async def get_admin_claims(claims: Dict[str, Any] = Depends(get_current_claims)) -> Dict[str, Any]:
+    if not claims.get("is_admin", False):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return claims
+
 # Endpoints
 @app.get("/")
 async def root():
     return {"message": "RioPortoP2P API is running", "version": "1.0.0"}
 
+def already_registered(column: Optional[str]) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="CPF already registered" if column == "cpf" else "Email already registered"
+    )
+
 @app.post("/api/auth/register", response_model=TokenResponse)
 async def register(user_data: UserRegister):
+    # CPF check digits and phone format were validated with the body, before any I/O
     try:
-        # Check if user already exists
-        existing_user = supabase.table("users").select("*").eq("email", user_data.email).execute()
-        if existing_user.data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        
-        # Check if CPF already exists
-        existing_cpf = supabase.table("users").select("*").eq("cpf", user_data.cpf).execute()
-        if existing_cpf.data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="CPF already registered"
-            )
+        # Email and CPF uniqueness in one round trip, so bcrypt only runs for sign-ups that can succeed
+        existing = await db.users.find_registered(user_data.email, user_data.cpf)
+        if existing:
+            email_taken = any(row["email"] == user_data.email for row in existing)
+            raise already_registered("email" if email_taken else "cpf")
         
         # Hash password
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await get_password_hash(user_data.password)
         
         # Create user
         user_dict = user_data.dict()
@@ -230,34 +583,23 @@ async def register(user_data: UserRegister):
         user_dict["is_admin"] = False
         user_dict["created_at"] = datetime.now(timezone.utc).isoformat()
         
-        response = supabase.table("users").insert(user_dict).execute()
+        try:
+            user = await db.users.create(user_dict)
+        except AlreadyExists as e:
+            # Registered concurrently, after the check above; the unique constraints decide
+            raise already_registered(e.column)
         
-        if not response.data:
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create user"
             )
         
-        user = response.data[0]
-        
-        # Create access token
-        access_token = create_access_token(data={"sub": user["id"]})
-        
-        # Prepare user response
-        user_response = UserResponse(
-            id=user["id"],
-            email=user["email"],
-            full_name=user["full_name"],
-            cpf=user["cpf"],
-            phone=user["phone"],
-            kyc_level=user["kyc_level"],
-            is_admin=user["is_admin"],
-            created_at=user["created_at"]
-        )
+        stats_engine.record_user()
         
-        logger.info(f"New user registered: {user['email']}")
+        audit_log.record("user.registered", user["id"], user["id"], critical=True)
         
-        return TokenResponse(access_token=access_token, user=user_response)
+        return token_serializer.response(token_response(user))
         
     except HTTPException:
         raise
@@ -272,41 +614,33 @@ async def register(user_data: UserRegister):
 async def login(credentials: UserLogin):
     try:
         # Get user by email
-        response = supabase.table("users").select("*").eq("email", credentials.email).execute()
+        user = await db.users.get_by_email(credentials.email)
         
-        if not response.data:
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
         
-        user = response.data[0]
-        
         # Verify password
-        if not verify_password(credentials.password, user["password"]):
+        valid, new_hash = await verify_password(credentials.password, user["password"])
+        if not valid:
+            audit_log.record("user.login_failed", None, user["id"], critical=True)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
         
-        # Create access token
-        access_token = create_access_token(data={"sub": user["id"]})
-        
-        # Prepare user response
-        user_response = UserResponse(
-            id=user["id"],
-            email=user["email"],
-            full_name=user["full_name"],
-            cpf=user["cpf"],
-            phone=user["phone"],
-            kyc_level=user["kyc_level"],
-            is_admin=user["is_admin"],
-            created_at=user["created_at"]
-        )
+        # Rehash transparently when BCRYPT_ROUNDS has changed
+        if new_hash:
+            try:
+                await db.users.update_password(user["id"], new_hash)
+            except Exception as e:
+                logger.warning(f"Password rehash failed for user {user['id']}: {str(e)}")
         
-        logger.info(f"User logged in: {user['email']}")
+        audit_log.record("user.login", user["id"], user["id"], critical=True)
         
-        return TokenResponse(access_token=access_token, user=user_response)
+        return token_serializer.response(token_response(user))
         
     except HTTPException:
         raise
@@ -317,54 +651,171 @@ async def login(credentials: UserLogin):
             detail="Login failed"
         )
 
-@app.get("/api/bitcoin/price", response_model=BitcoinPriceResponse)
-async def get_bitcoin_price():
+@app.post("/api/auth/refresh", response_model=AccessTokenResponse)
+async def refresh_access_token(body: RefreshRequest):
+    payload = decode_access_token(body.refresh_token, REFRESH)
     try:
-        # Fetch from CoinGecko API
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                BITCOIN_API_URL,
-                params={
-                    "ids": "bitcoin",
-                    "vs_currencies": "brl,usd",
-                    "include_24hr_change": "true",
-                    "include_24hr_vol": "true"
-                }
-            )
-            
-        if response.status_code != 200:
-            # Return mock data if API fails
-            logger.warning("Bitcoin API failed, returning mock data")
-            return BitcoinPriceResponse(
-                price_brl=250000.0,
-                price_usd=50000.0,
-                last_updated=datetime.now(timezone.utc),
-                change_24h=2.5,
-                volume_24h=1000000000.0
+        # Fresh claims, so a KYC change reaches embedded-claim tokens at the next refresh
+        user = await load_user(payload["sub"])
+    except HTTPException as e:
+        if e.status_code != status.HTTP_404_NOT_FOUND:
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {
+        "access_token": create_access_token(user_token_data(user)),
+        "expires_in": int(JWT_ACCESS_TTL_SECONDS),
+    }
+
+@app.post("/api/auth/logout")
+async def logout(
+    body: Optional[LogoutRequest] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    payload = decode_access_token(credentials.credentials)
+    revoked = [payload]
+    if body is not None and body.refresh_token:
+        refresh = decode_access_token(body.refresh_token, REFRESH)
+        if refresh["sub"] != payload["sub"]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Refresh token belongs to another user"
             )
+        revoked.append(refresh)
+    try:
+        for claims in revoked:
+            await token_authority.revoke(claims)
+    except Exception as e:
+        logger.error(f"Logout error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Logout failed"
+        )
+    audit_log.record("user.logout", payload["sub"], payload["sub"], critical=True, tokens=len(revoked))
+    return {"message": "Logged out"}
+
+@app.get("/api/bitcoin/price", response_model=BitcoinPriceResponse)
+async def get_bitcoin_price(request: Request):
+    try:
+        price, age = await price_service.get_price()
+    except Exception as e:
+        logger.error(f"Bitcoin price fetch error: {str(e)}")
+        # No quote has ever been fetched; never serve a made-up price
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Bitcoin price is temporarily unavailable",
+            headers={"Retry-After": str(int(BITCOIN_PRICE_REFRESH_SECONDS))},
+        )
+    
+    # Each refresh of the price cache stamps a new last_updated, so it identifies the cache generation
+    generation = (price.last_updated, price.stale)
+    cache_key = response_cache.key(PRICE_CACHE_KEY, generation)
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        cached = CachedResponse(price.model_dump_json().encode(), make_etag("price", *generation))
+        response_cache.set(cache_key, cached)
+    return response_cache.respond(cached, request.headers.get("if-none-match"), {"Age": str(int(age))})
+
+@app.get("/api/bitcoin/candles", response_model=PriceCandles)
+async def get_bitcoin_candles(
+    interval: str = Query("1h", pattern="^(1m|1h|1d)$"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to")
+):
+    bucket_seconds = CANDLE_INTERVALS[interval]
+    end_ts = (end.replace(tzinfo=end.tzinfo or timezone.utc) if end else datetime.now(timezone.utc)).timestamp()
+    start_ts = start.replace(tzinfo=start.tzinfo or timezone.utc).timestamp() if start else end_ts - 100 * bucket_seconds
+    
+    if start_ts >= end_ts:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'from' must be before 'to'"
+        )
+    if (end_ts - start_ts) / bucket_seconds > CANDLES_MAX_COUNT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range spans more than {CANDLES_MAX_COUNT} {interval} candles"
+        )
+    
+    try:
+        candles = await price_history.candles(interval, start_ts, end_ts)
+        return PriceCandles(symbol=price_history.symbol, interval=interval, candles=candles)
         
-        data = response.json()
-        bitcoin_data = data.get("bitcoin", {})
-        
-        return BitcoinPriceResponse(
-            price_brl=bitcoin_data.get("brl", 250000.0),
-            price_usd=bitcoin_data.get("usd", 50000.0),
-            last_updated=datetime.now(timezone.utc),
-            change_24h=bitcoin_data.get("brl_24h_change", 0.0),
-            volume_24h=bitcoin_data.get("brl_24h_vol", 0.0)
+    except Exception as e:
+        logger.error(f"Bitcoin candles error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch price candles"
+        )
+
+@app.get("/api/bitcoin/orderbook", response_model=OrderBookDepth)
+async def get_order_book(depth: int = Query(20, ge=1, le=ORDER_BOOK_MAX_DEPTH)):
+    if not ORDER_MATCHING_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Order matching is disabled on this server"
         )
+    if matching_engine.running:
+        return matching_engine.depth(depth)
+    
+    try:
+        entry = await order_book_cache.get(depth, lambda: stored_order_book_depth(depth))
+        return entry.value
         
     except Exception as e:
-        logger.error(f"Bitcoin price fetch error: {str(e)}")
-        # Return mock data on error
-        return BitcoinPriceResponse(
-            price_brl=250000.0,
-            price_usd=50000.0,
-            last_updated=datetime.now(timezone.utc),
-            change_24h=2.5,
-            volume_24h=1000000000.0
+        logger.error(f"Order book depth error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch order book"
         )
 
+async def stored_order_book_depth(depth: int) -> OrderBookDepth:
+    levels = await db.orders.depth(depth)
+    # Only the matching worker numbers book changes
+    return OrderBookDepth(pair=matching_engine.book.pair, sequence=0, **levels)
+
+def transaction_row(transaction: TransactionCreate, user_id: str, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc).isoformat()
+    row = {
+        "user_id": user_id,
+        "type": transaction.type,
+        "amount_brl": transaction.amount_brl,
+        "amount_btc": transaction.amount_btc,
+        "price_per_btc": transaction.price_per_btc,
+        "payment_method": transaction.payment_method,
+        "status": "pending",
+        "description": transaction.description,
+        "created_at": now,
+        "updated_at": now
+    }
+    if idempotency_key is not None:
+        row["idempotency_key"] = idempotency_key
+    return row
+
+def audit_transaction(row: Dict[str, Any], **metadata: Any) -> None:
+    audit_log.record(
+        "transaction.created",
+        row["user_id"],
+        row["id"],
+        type=row["type"],
+        amount_brl=row["amount_brl"],
+        amount_btc=row["amount_btc"],
+        price_per_btc=row["price_per_btc"],
+        payment_method=row["payment_method"],
+        **metadata,
+    )
+
+async def current_kyc_level(user: Dict[str, Any]) -> int:
+    """The user's KYC level as stored now; the cached user may predate a change made on another worker."""
+    kyc_level = await db.kyc.get_level(user["id"])
+    return kyc_level if kyc_level is not None else user.get("kyc_level", 1)
+
+def publish_transaction(transaction: TransactionResponse) -> None:
+    broadcaster.publish(transactions_topic(transaction.user_id), "transaction", transaction)
+
 @app.post("/api/transactions", response_model=TransactionResponse)
 async def create_transaction(
     transaction: TransactionCreate,
@@ -372,49 +823,41 @@ async def create_transaction(
 ):
     try:
         # Check KYC level limits
-        kyc_level = current_user.get("kyc_level", 1)
-        amount_brl = transaction.amount_brl
-        
-        # KYC limits (example values)
-        kyc_limits = {
-            1: 1000.0,    # R$ 1,000 per transaction
-            2: 10000.0,   # R$ 10,000 per transaction
-            3: 100000.0   # R$ 100,000 per transaction
-        }
+        kyc_level = await current_kyc_level(current_user)
         
-        if amount_brl > kyc_limits.get(kyc_level, 1000.0):
+        if transaction.amount_brl > KYC_TRANSACTION_LIMITS.get(kyc_level, 1000.0):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Transaction amount exceeds KYC level {kyc_level} limit"
             )
         
         # Create transaction
-        transaction_data = {
-            "user_id": current_user["id"],
-            "type": transaction.type,
-            "amount_brl": transaction.amount_brl,
-            "amount_btc": transaction.amount_btc,
-            "price_per_btc": transaction.price_per_btc,
-            "payment_method": transaction.payment_method,
-            "status": "pending",
-            "description": transaction.description,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }
+        transaction_data = transaction_row(transaction, current_user["id"])
         
-        response = supabase.table("transactions").insert(transaction_data).execute()
+        created_transaction = await db.transactions.create(transaction_data)
         
-        if not response.data:
+        if not created_transaction:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create transaction"
             )
         
-        created_transaction = response.data[0]
+        stats_engine.record_transaction(
+            current_user["id"],
+            created_transaction["amount_brl"],
+            created_transaction["amount_btc"],
+            created_transaction.get("created_at"),
+        )
+        
+        audit_transaction(created_transaction)
         
-        logger.info(f"Transaction created: {created_transaction['id']} by user {current_user['email']}")
+        if matching_engine.running:
+            matching_engine.submit(created_transaction)
+        cache_invalidations.invalidate("response", current_user["id"])
         
-        return TransactionResponse(**created_transaction)
+        transaction_response = TransactionResponse(**created_transaction)
+        publish_transaction(transaction_response)
+        return transaction_response
         
     except HTTPException:
         raise
@@ -425,25 +868,150 @@ async def create_transaction(
             detail="Failed to create transaction"
         )
 
+@app.post("/api/transactions/batch", response_model=TransactionBatchResponse)
+async def create_transactions_batch(
+    batch: TransactionBatchCreate,
+    current_user: Dict[str, Any] = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, max_length=200)
+):
+    kyc_level = await current_kyc_level(current_user)
+    per_transaction_limit = KYC_TRANSACTION_LIMITS.get(kyc_level, 1000.0)
+    batch_limit = KYC_BATCH_LIMITS.get(kyc_level, 5000.0)
+    
+    # Validate every item first, accepting in order until the cumulative limit is reached
+    results: List[TransactionBatchItemResult] = []
+    accepted: List[Tuple[int, Dict[str, Any]]] = []
+    cumulative_brl = 0.0
+    for index, transaction in enumerate(batch.transactions):
+        if transaction.amount_brl > per_transaction_limit:
+            error = f"Transaction amount exceeds KYC level {kyc_level} limit"
+        elif cumulative_brl + transaction.amount_brl > batch_limit:
+            error = f"Batch total exceeds KYC level {kyc_level} batch limit"
+        else:
+            cumulative_brl += transaction.amount_brl
+            item_key = f"{idempotency_key}:{index}" if idempotency_key else None
+            accepted.append((index, transaction_row(transaction, current_user["id"], item_key)))
+            continue
+        results.append(TransactionBatchItemResult(index=index, status="rejected", error=error))
+    
+    try:
+        rows = [row for _, row in accepted]
+        created = await db.transactions.create_many(rows, idempotent=bool(idempotency_key)) if rows else []
+        
+        if idempotency_key:
+            # Rows skipped as duplicates were created by an earlier attempt of this batch
+            created_keys = {t["idempotency_key"] for t in created}
+            missing_keys = [row["idempotency_key"] for row in rows if row["idempotency_key"] not in created_keys]
+            existing = await db.transactions.get_by_idempotency_keys(current_user["id"], missing_keys) if missing_keys else []
+            by_key = {t["idempotency_key"]: (t, "existing") for t in existing}
+            by_key.update({t["idempotency_key"]: (t, "created") for t in created})
+            stored = [by_key.get(row["idempotency_key"]) for row in rows]
+        else:
+            # PostgREST returns bulk-inserted rows in request order
+            stored = [(t, "created") for t in created]
+        
+        if len(stored) != len(accepted) or None in stored:
+            raise RuntimeError("Bulk insert returned an unexpected number of rows")
+        
+    except Exception as e:
+        logger.error(f"Batch transaction creation error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create transactions"
+        )
+    
+    for (index, _), (row, item_status) in zip(accepted, stored):
+        if item_status == "created" and matching_engine.running:
+            matching_engine.submit(row)
+        transaction_response = TransactionResponse(**row)
+        if item_status == "created":
+            stats_engine.record_transaction(current_user["id"], row["amount_brl"], row["amount_btc"], row.get("created_at"))
+            audit_transaction(row, batch=True)
+            publish_transaction(transaction_response)
+        results.append(TransactionBatchItemResult(index=index, status=item_status, transaction=transaction_response))
+    results.sort(key=lambda r: r.index)
+    if created:
+        cache_invalidations.invalidate("response", current_user["id"])
+    
+    counts = {"created": 0, "existing": 0, "rejected": 0}
+    for result in results:
+        counts[result.status] += 1
+    
+    audit_log.record("transaction.batch", current_user["id"], None, **counts)
+    
+    return TransactionBatchResponse(results=results, **counts)
+
+TRANSACTION_FIELDS = set(TransactionResponse.model_fields)
+
+def transaction_columns(fields: Optional[str]) -> Optional[List[str]]:
+    """Validate a ``fields=`` projection; id and created_at are always included for paging."""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in TRANSACTION_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown transaction fields: {', '.join(unknown)}"
+        )
+    return list(dict.fromkeys(["id", "created_at", *requested]))
+
+def transaction_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    try:
+        return decode_cursor(cursor)
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @app.get("/api/transactions", response_model=List[TransactionResponse])
 async def get_transactions(
-    current_user: Dict[str, Any] = Depends(get_current_user),
-    limit: int = 50,
-    offset: int = 0
+    request: Request,
+    current_user: Dict[str, Any] = Depends(get_current_claims),
+    limit: int = Query(50, ge=1, le=TRANSACTIONS_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, deprecated=True),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
 ):
+    columns = transaction_columns(fields)
+    before = transaction_cursor(cursor)
+    if_none_match = request.headers.get("if-none-match")
+    
+    page = ("transactions", limit, 0 if before else offset, cursor, fields)
+    cache_key = response_cache.key(current_user["id"], page)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return response_cache.respond(cached, if_none_match)
+    
     try:
-        # Get user's transactions
-        response = supabase.table("transactions")\
-            .select("*")\
-            .eq("user_id", current_user["id"])\
-            .order("created_at", desc=True)\
-            .limit(limit)\
-            .offset(offset)\
-            .execute()
+        # Get user's transactions, newest first
+        transactions = await db.transactions.list_for_user(
+            current_user["id"],
+            limit,
+            offset=0 if before else offset,
+            columns=",".join(columns) if columns else "*",
+            before=before,
+        )
+        
+        # A full page means there may be more; hand back where it ended
+        headers = dict(PRIVATE_CACHE_HEADERS)
+        if len(transactions) == limit:
+            last = transactions[-1]
+            headers["X-Next-Cursor"] = encode_cursor(last["created_at"], last["id"])
         
-        transactions = response.data or []
+        if columns:
+            body = orjson.dumps(transactions)
+        else:
+            body = transaction_page_serializer.dumps(transactions)
         
-        return [TransactionResponse(**t) for t in transactions]
+        if columns and "updated_at" not in columns:
+            etag = make_etag(page, body)
+        else:
+            etag = make_etag(page, [(t["id"], t["updated_at"]) for t in transactions])
+        cached = CachedResponse(body, etag, headers)
+        response_cache.set(cache_key, cached)
+        return response_cache.respond(cached, if_none_match)
         
     except Exception as e:
         logger.error(f"Get transactions error: {str(e)}")
@@ -452,35 +1020,53 @@ async def get_transactions(
             detail="Failed to fetch transactions"
         )
 
-@app.get("/api/transactions/{transaction_id}", response_model=TransactionResponse)
-async def get_transaction(
-    transaction_id: str,
-    current_user: Dict[str, Any] = Depends(get_current_user)
+@app.get("/api/transactions/export")
+async def export_transactions(
+    current_user: Dict[str, Any] = Depends(get_current_claims),
+    fields: Optional[str] = None
 ):
+    columns = transaction_columns(fields)
+    select = ",".join(columns) if columns else "*"
+    user_id = current_user["id"]
+    
+    async def ndjson_lines():
+        before = None
+        while True:
+            page = await db.transactions.list_for_user(
+                user_id,
+                TRANSACTIONS_EXPORT_BATCH_SIZE,
+                columns=select,
+                before=before,
+            )
+            if page:
+                yield b"".join(orjson.dumps(t, default=str, option=orjson.OPT_APPEND_NEWLINE) for t in page)
+            if len(page) < TRANSACTIONS_EXPORT_BATCH_SIZE:
+                break
+            before = (page[-1]["created_at"], page[-1]["id"])
+    
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="transactions.ndjson"'},
+    )
+
+async def load_transaction_response(transaction_id: str) -> CachedResponse:
     try:
         # Get transaction
-        response = supabase.table("transactions")\
-            .select("*")\
-            .eq("id", transaction_id)\
-            .single()\
-            .execute()
+        transaction = await db.transactions.get(transaction_id)
         
-        if not response.data:
+        if not transaction:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Transaction not found"
             )
         
-        transaction = response.data
-        
-        # Check if user owns the transaction or is admin
-        if transaction["user_id"] != current_user["id"] and not current_user.get("is_admin", False):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
-        
-        return TransactionResponse(**transaction)
+        return CachedResponse(
+            transaction_serializer.dumps(transaction),
+            make_etag("transaction", transaction["id"], transaction["updated_at"]),
+            dict(PRIVATE_CACHE_HEADERS),
+            owner=transaction["user_id"],
+        )
         
     except HTTPException:
         raise
@@ -491,6 +1077,27 @@ async def get_transaction(
             detail="Failed to fetch transaction"
         )
 
+@app.get("/api/transactions/{transaction_id}", response_model=TransactionResponse)
+async def get_transaction(
+    transaction_id: str,
+    request: Request,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    cache_key = response_cache.key(transaction_id, "transaction")
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        cached = await load_transaction_response(transaction_id)
+        response_cache.set(cache_key, cached)
+    
+    # Check if user owns the transaction or is admin
+    if cached.owner != current_user["id"] and not current_user.get("is_admin", False):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    return response_cache.respond(cached, request.headers.get("if-none-match"))
+
 @app.patch("/api/admin/kyc", response_model=Dict[str, str])
 async def update_kyc_level(
     kyc_update: KYCUpdateRequest,
@@ -498,18 +1105,26 @@ async def update_kyc_level(
 ):
     try:
         # Update user's KYC level
-        response = supabase.table("users")\
-            .update({"kyc_level": kyc_update.kyc_level})\
-            .eq("id", kyc_update.user_id)\
-            .execute()
+        updated_user = await db.kyc.update_level(kyc_update.user_id, kyc_update.kyc_level)
         
-        if not response.data:
+        if not updated_user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
-        logger.info(f"KYC level updated for user {kyc_update.user_id} to level {kyc_update.kyc_level} by admin {admin_user['email']}")
+        # Drop the cached record on every worker so the new level applies on the next request
+        cache_invalidations.invalidate("user", kyc_update.user_id)
+        cache_invalidations.invalidate("response", kyc_update.user_id)
+        try:
+            await cache_invalidations.flush()
+        except Exception as e:
+            # Published again with the next sync
+            logger.warning(f"Publishing the KYC cache invalidation failed: {str(e)}")
+        
+        audit_log.record(
+            "kyc.level_updated", admin_user["id"], kyc_update.user_id, critical=True, kyc_level=kyc_update.kyc_level
+        )
         
         return {"message": f"KYC level updated to {kyc_update.kyc_level}"}
         
@@ -522,54 +1137,51 @@ async def update_kyc_level(
             detail="Failed to update KYC level"
         )
 
+async def compute_platform_stats() -> PlatformStats:
+    yesterday = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
+    stats = await db.stats.platform_stats(since=yesterday)
+    
+    total_transactions = stats.get("total_transactions") or 0
+    total_volume_brl = float(stats.get("total_volume_brl") or 0)
+    
+    # Calculate average transaction
+    average_transaction_brl = total_volume_brl / total_transactions if total_transactions > 0 else 0
+    
+    return PlatformStats(
+        total_users=stats.get("total_users") or 0,
+        total_transactions=total_transactions,
+        total_volume_brl=total_volume_brl,
+        total_volume_btc=float(stats.get("total_volume_btc") or 0),
+        active_users_24h=stats.get("active_users_24h") or 0,
+        transactions_24h=stats.get("transactions_24h") or 0,
+        average_transaction_brl=average_transaction_brl
+    )
+
+def engine_platform_stats() -> PlatformStats:
+    window = stats_engine.window("24h")
+    total_transactions = stats_engine.total_transactions
+    total_volume_brl = stats_engine.total_volume_brl
+    
+    return PlatformStats(
+        total_users=stats_engine.total_users,
+        total_transactions=total_transactions,
+        total_volume_brl=total_volume_brl,
+        total_volume_btc=stats_engine.total_volume_btc,
+        active_users_24h=window["active_users"],
+        transactions_24h=window["transactions"],
+        average_transaction_brl=total_volume_brl / total_transactions if total_transactions > 0 else 0
+    )
+
 @app.get("/api/admin/stats", response_model=PlatformStats)
 async def get_platform_stats(
-    admin_user: Dict[str, Any] = Depends(get_admin_user)
+    admin_user: Dict[str, Any] = Depends(get_admin_claims)
 ):
     try:
-        # Get total users
-        users_response = supabase.table("users").select("*", count="exact").execute()
-        total_users = users_response.count or 0
-        
-        # Get total transactions
-        transactions_response = supabase.table("transactions").select("*", count="exact").execute()
-        total_transactions = transactions_response.count or 0
-        
-        # Get all transactions for volume calculation
-        all_transactions = supabase.table("transactions").select("amount_brl, amount_btc").execute()
-        
-        total_volume_brl = sum(t["amount_brl"] for t in all_transactions.data or [])
-        total_volume_btc = sum(t["amount_btc"] for t in all_transactions.data or [])
-        
-        # Get 24h stats
-        yesterday = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
-        
-        # Active users in last 24h (based on transactions)
-        active_users_response = supabase.table("transactions")\
-            .select("user_id", count="exact")\
-            .gte("created_at", yesterday)\
-            .execute()
-        active_users_24h = len(set(t["user_id"] for t in active_users_response.data or []))
-        
-        # Transactions in last 24h
-        transactions_24h_response = supabase.table("transactions")\
-            .select("*", count="exact")\
-            .gte("created_at", yesterday)\
-            .execute()
-        transactions_24h = transactions_24h_response.count or 0
-        
-        # Calculate average transaction
-        average_transaction_brl = total_volume_brl / total_transactions if total_transactions > 0 else 0
-        
-        return PlatformStats(
-            total_users=total_users,
-            total_transactions=total_transactions,
-            total_volume_brl=total_volume_brl,
-            total_volume_btc=total_volume_btc,
-            active_users_24h=active_users_24h,
-            transactions_24h=transactions_24h,
-            average_transaction_brl=average_transaction_brl
-        )
+        if stats_engine.ready:
+            return engine_platform_stats()
+        
+        entry = await stats_cache.get("platform", compute_platform_stats)
+        return entry.value
         
     except Exception as e:
         logger.error(f"Platform stats error: {str(e)}")
@@ -578,25 +1190,321 @@ async def get_platform_stats(
             detail="Failed to fetch platform statistics"
         )
 
+@app.get("/api/admin/stats/windows", response_model=Dict[str, Any])
+async def get_platform_stats_windows(
+    admin_user: Dict[str, Any] = Depends(get_admin_claims)
+):
+    if not stats_engine.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Statistics are not available yet"
+        )
+    return stats_engine.snapshot()
+
+@app.get("/api/admin/rate-limits", response_model=Dict[str, Dict[str, int]])
+async def get_rate_limit_counters(
+    admin_user: Dict[str, Any] = Depends(get_admin_claims)
+):
+    return rate_limit_counters
+
 @app.get("/api/user/profile", response_model=UserResponse)
-async def get_user_profile(current_user: Dict[str, Any] = Depends(get_current_user)):
-    return UserResponse(
-        id=current_user["id"],
-        email=current_user["email"],
-        full_name=current_user["full_name"],
-        cpf=current_user["cpf"],
-        phone=current_user["phone"],
-        kyc_level=current_user["kyc_level"],
-        is_admin=current_user.get("is_admin", False),
-        created_at=current_user["created_at"]
+async def get_user_profile(request: Request, current_user: Dict[str, Any] = Depends(get_current_user)):
+    cache_key = response_cache.key(current_user["id"], "profile")
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        cached = CachedResponse(
+            user_serializer.dumps({"is_admin": False, **current_user}),
+            make_etag("profile", current_user["id"], current_user.get("updated_at"), current_user.get("kyc_level")),
+            dict(PRIVATE_CACHE_HEADERS),
+        )
+        response_cache.set(cache_key, cached)
+    return response_cache.respond(cached, request.headers.get("if-none-match"))
+
+# Streaming
+STREAM_TOPICS = {"price", "transactions"}
+
+@app.post("/api/stream/ticket", response_model=StreamTicketResponse)
+async def create_stream_ticket(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """A single-use ticket for opening a stream from clients that cannot set the Authorization header."""
+    payload = decode_access_token(credentials.credentials)
+    return {
+        "ticket": token_authority.issue({"sub": payload["sub"]}, STREAM, ttl=STREAM_TICKET_TTL_SECONDS),
+        "expires_in": int(STREAM_TICKET_TTL_SECONDS),
+    }
+
+async def stream_user_id(authorization: Optional[str], ticket: Optional[str]) -> Optional[str]:
+    """The caller, from a bearer token in the Authorization header or from a stream ticket, which is used up here.
+
+    Access tokens are never read from the URL, where they would end up in access and proxy logs.
+    """
+    if authorization:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() == "bearer" and token:
+            return decode_access_token(token)["sub"]
+    if not ticket:
+        return None
+    payload = decode_access_token(ticket, STREAM)
+    try:
+        await token_authority.revoke(payload)
+    except Exception as e:
+        # Already refused by this worker; other workers may accept it until it expires
+        logger.warning(f"Storing a used stream ticket failed: {str(e)}")
+    return payload["sub"]
+
+def stream_topics(topics: Optional[str], user_id: Optional[str]) -> List[str]:
+    """Resolve ``topics=price,transactions``; the transactions topic is the caller's own and needs authentication."""
+    requested = [t.strip() for t in (topics or ("price,transactions" if user_id else "price")).split(",") if t.strip()]
+    unknown = [t for t in requested if t not in STREAM_TOPICS]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown stream topics: {', '.join(unknown)}" if unknown else "No stream topics requested"
+        )
+    resolved = []
+    for topic in requested:
+        if topic == "price":
+            resolved.append(PRICE_TOPIC)
+            continue
+        if not user_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Authentication required for transaction updates",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        resolved.append(transactions_topic(user_id))
+    return resolved
+
+def open_stream(topics: List[str]):
+    subscription = broadcaster.subscribe(topics)
+    # Start price subscribers from the cached quote instead of waiting for the next refresh
+    entry = price_service.cache.peek(PRICE_CACHE_KEY) if PRICE_TOPIC in topics else None
+    if entry is not None:
+        subscription.offer(Event.build(PRICE_TOPIC, "price", entry.value))
+    return subscription
+
+@app.get("/api/stream/events")
+async def stream_events(
+    request: Request,
+    topics: Optional[str] = None,
+    ticket: Optional[str] = None
+):
+    user_id = await stream_user_id(request.headers.get("authorization"), ticket)
+    try:
+        subscription = open_stream(stream_topics(topics, user_id))
+    except TooManySubscribers:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open streams, please retry",
+            headers={"Retry-After": "5"},
+        )
+    
+    async def sse_events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event.sse
+        finally:
+            broadcaster.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        sse_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+@app.websocket("/api/stream/ws")
+async def stream_websocket(
+    websocket: WebSocket,
+    topics: Optional[str] = None,
+    ticket: Optional[str] = None
+):
+    try:
+        user_id = await stream_user_id(websocket.headers.get("authorization"), ticket)
+        subscription = open_stream(stream_topics(topics, user_id))
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    except TooManySubscribers:
+        await websocket.close(code=1013)
+        return
+    
+    await websocket.accept()
+    
+    async def forward():
+        while True:
+            event = await subscription.get()
+            if event is None:
+                return
+            await websocket.send_text(event.text)
+    
+    async def wait_for_disconnect():
+        # Client messages are not used; reading them is how a disconnect is noticed
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    
+    sender = asyncio.create_task(forward())
+    receiver = asyncio.create_task(wait_for_disconnect())
+    try:
+        done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+    finally:
+        broadcaster.unsubscribe(subscription)
+    
+    if receiver not in done:
+        # Dropped as a slow consumer, or the server is shutting down
+        try:
+            await websocket.close(code=1013 if sender.exception() is None else 1011)
+        except Exception:
+            pass
+
+# Metrics
+def collect_runtime_metrics():
+    cache_lookups = Counter("app_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+    cache_entries = Gauge("app_cache_entries", "Entries held by each in-process cache", ("cache",))
+    for name, cache in (
+        ("user", user_cache), ("price", price_service.cache), ("stats", stats_cache), ("token", token_authority.verified),
+    ):
+        cache_stats = cache.stats()
+        cache_entries.set(cache_stats["entries"], name)
+        cache_lookups.set(cache_stats["hits"], name, "hit")
+        cache_lookups.set(cache_stats["misses"], name, "miss")
+        if "stale_hits" in cache_stats:
+            cache_lookups.set(cache_stats["stale_hits"], name, "stale")
+    response_cache_stats = response_cache.stats()
+    cache_entries.set(response_cache_stats["entries"], "response")
+    cache_lookups.set(response_cache_stats["hits"], "response", "hit")
+    cache_lookups.set(response_cache_stats["misses"], "response", "miss")
+    not_modified = Counter("app_responses_not_modified_total", "Conditional GETs answered with 304 Not Modified")
+    not_modified.set(response_cache_stats["not_modified"])
+    cache_entries.set(len(idempotency_store), "idempotency")
+    cache_lookups.set(idempotency_store.replays, "idempotency", "hit")
+    
+    pools = Gauge("app_pool_capacity", "Configured size of worker pools", ("pool",))
+    pools.set(db.limits.max_connections, "supabase_connections")
+    pools.set(password_hasher.max_workers, "bcrypt_workers")
+    pools.set(password_hasher.max_pending, "bcrypt_queue")
+    bcrypt_pending = Gauge("app_bcrypt_pending", "bcrypt operations running or queued")
+    bcrypt_pending.set(password_hasher.pending)
+    bcrypt_rejected = Counter("app_bcrypt_rejected_total", "bcrypt operations rejected because the queue was full")
+    bcrypt_rejected.set(password_hasher.rejected)
+    
+    token_stats = token_authority.stats()
+    tokens_revoked = Gauge("app_revoked_tokens", "Revoked tokens that have not expired yet")
+    tokens_revoked.set(token_stats["revoked"])
+    tokens_rejected = Counter("app_tokens_rejected_total", "Tokens rejected as invalid, expired or revoked")
+    tokens_rejected.set(token_stats["rejected"])
+    
+    rate_limited = Counter("app_rate_limit_requests_total", "Requests seen by the rate limiter", ("policy", "outcome"))
+    for policy, counts in rate_limit_counters.items():
+        rate_limited.set(counts["allowed"], policy, "allowed")
+        rate_limited.set(counts["rejected"], policy, "rejected")
+    
+    breaker_open = Gauge("app_price_source_circuit_open", "1 when a price source's circuit breaker is not closed", ("source",))
+    for name, source_stats in price_service.aggregator.stats().items():
+        breaker_open.set(0 if source_stats["state"] == "closed" else 1, name)
+    
+    history_stats = price_history.stats()
+    price_ticks = Counter("app_price_ticks_total", "Bitcoin price ticks by persistence outcome", ("outcome",))
+    price_ticks.set(history_stats["written"], "written")
+    price_ticks.set(history_stats["dropped"], "dropped")
+    price_ticks_pending = Gauge("app_price_ticks_pending", "Bitcoin price ticks waiting for the next bulk insert")
+    price_ticks_pending.set(history_stats["pending"])
+    
+    stream_stats = broadcaster.stats()
+    stream_subscribers = Gauge("app_stream_subscribers", "Open SSE and WebSocket subscriptions")
+    stream_subscribers.set(stream_stats["subscribers"])
+    stream_events = Counter("app_stream_events_total", "Streaming events published, and deliveries to subscribers", ("outcome",))
+    stream_events.set(stream_stats["published"], "published")
+    stream_events.set(stream_stats["delivered"], "delivered")
+    stream_dropped = Counter("app_stream_dropped_subscribers_total", "Subscribers disconnected for falling behind")
+    stream_dropped.set(stream_stats["dropped"])
+    
+    matching_stats = matching_engine.stats()
+    order_book_levels = Gauge("app_order_book_levels", "Price levels in the order book", ("side",))
+    order_book_levels.set(matching_stats["bids"], "buy")
+    order_book_levels.set(matching_stats["asks"], "sell")
+    order_book_orders = Gauge("app_order_book_orders", "Open orders resting in the order book")
+    order_book_orders.set(matching_stats["orders"])
+    order_fills = Counter("app_order_fills_total", "Order fills by persistence outcome", ("outcome",))
+    order_fills.set(matching_stats["fills"], "matched")
+    order_fills.set(matching_stats["written"], "written")
+    order_fills.set(matching_stats["dropped"], "dropped")
+    order_fills_pending = Gauge("app_order_fills_pending", "Order fills waiting for the next batch write")
+    order_fills_pending.set(matching_stats["pending"])
+    orders_synced = Counter("app_orders_synced_total", "Orders created by other workers and picked up from the database")
+    orders_synced.set(matching_stats["synced"])
+    orders_deferred = Counter("app_orders_deferred_total", "Orders left unmatched until the order fill backlog was written")
+    orders_deferred.set(matching_stats["deferred"])
+    
+    escrow_stats = escrow_scheduler.stats()
+    escrows_scheduled = Gauge("app_escrow_expiries_scheduled", "Open escrows whose expiry this worker is tracking")
+    escrows_scheduled.set(escrow_stats["scheduled"])
+    escrows_expired = Counter("app_escrows_expired_total", "Escrows cancelled by this worker because they expired")
+    escrows_expired.set(escrow_stats["expired"])
+    escrow_lock_misses = Counter("app_escrow_expiry_lock_misses_total", "Expiry batches deferred because another worker held the lock")
+    escrow_lock_misses.set(escrow_stats["lock_misses"])
+    
+    audit_stats = audit_log.stats()
+    audit_events = Counter("app_audit_events_total", "Audit events by outcome", ("outcome",))
+    audit_events.set(audit_stats["recorded"], "recorded")
+    audit_events.set(audit_stats["written"], "written")
+    audit_events.set(audit_stats["dropped"], "dropped")
+    audit_events_pending = Gauge("app_audit_events_pending", "Audit events queued in memory and not stored yet")
+    audit_events_pending.set(audit_stats["pending"])
+    audit_flush_failures = Counter("app_audit_flush_failures_total", "Failed bulk inserts of audit events")
+    audit_flush_failures.set(audit_stats["flush_failures"])
+    
+    invalidation_stats = cache_invalidations.stats()
+    cache_invalidations_total = Counter(
+        "app_cache_invalidations_total", "Cache invalidations published to or applied from other workers", ("outcome",)
+    )
+    cache_invalidations_total.set(invalidation_stats["published"], "published")
+    cache_invalidations_total.set(invalidation_stats["applied"], "applied")
+    cache_invalidations_total.set(invalidation_stats["dropped"], "dropped")
+    cache_sync_failures = Counter("app_cache_sync_failures_total", "Failed syncs of cache invalidations")
+    cache_sync_failures.set(invalidation_stats["sync_failures"])
+    
+    compressed = Counter("app_compressed_responses_total", "Responses compressed, by encoding", ("encoding",))
+    compression_bytes = Counter("app_compression_bytes_total", "Body bytes before and after compression", ("encoding", "direction"))
+    for encoding, counts in compression_counters.items():
+        compressed.set(counts["responses"], encoding)
+        compression_bytes.set(counts["bytes_in"], encoding, "in")
+        compression_bytes.set(counts["bytes_out"], encoding, "out")
+    
+    return [
+        cache_lookups, cache_entries, not_modified, pools, bcrypt_pending, bcrypt_rejected,
+        tokens_revoked, tokens_rejected, rate_limited,
+        breaker_open, price_ticks, price_ticks_pending, stream_subscribers, stream_events, stream_dropped,
+        order_book_levels, order_book_orders, order_fills, order_fills_pending, orders_synced, orders_deferred,
+        escrows_scheduled, escrows_expired, escrow_lock_misses,
+        audit_events, audit_events_pending, audit_flush_failures,
+        cache_invalidations_total, cache_sync_failures, compressed, compression_bytes,
+    ]
+
+registry.add_collector(collect_runtime_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found"
+        )
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     try:
         # Check Supabase connection
-        supabase.table("users").select("id").limit(1).execute()
+        await db.users.ping()
         supabase_status = "healthy"
     except:
         supabase_status = "unhealthy"
@@ -614,30 +1522,40 @@ async def health_check():
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     logger.error(f"HTTP error: {exc.status_code} - {exc.detail}")
-    return {
-        "error": {
-            "code": exc.status_code,
-            "message": exc.detail,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-    }
+    return ORJSONResponse(
+        status_code=exc.status_code,
+        content={
+            "error": {
+                "code": exc.status_code,
+                "message": exc.detail,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+        },
+        headers=exc.headers,
+    )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logger.error(f"Unhandled error: {str(exc)}", exc_info=True)
-    return {
-        "error": {
-            "code": 500,
-            "message": "Internal server error",
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-    }
+    return ORJSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={
+            "error": {
+                "code": 500,
+                "message": "Internal server error",
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+        },
+    )
 
 if __name__ == "__main__":
+    import uvicorn
+
+    # Development server with auto-reload; use server.py in production
     uvicorn.run(
         "app:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=os.getenv("ENVIRONMENT", "development") == "development",
         log_level="info"
     )
\ No newline at end of file
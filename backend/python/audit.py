@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLog:
+    """Structured audit events, written in the background instead of on the request path.
+
+    ``record`` only appends the event to an in-memory queue. Every
+    ``flush_interval`` seconds, or as soon as ``batch_size`` events are
+    queued, the queue is written to ``audit_events`` in one insert and each
+    event is logged as a JSON line on ``event_logger``. Events are logged
+    when first flushed, so the log keeps them even while the database is
+    unreachable; the insert is retried with the next flush.
+
+    At most ``max_pending`` events wait in memory. Beyond that, new events
+    are refused and counted as dropped, so an unreachable database never
+    makes requests wait or grows the queue without bound; each flush logs
+    how many were dropped since the last one. Events recorded with
+    ``critical`` (logins, KYC changes) are queued even then: they are rare
+    and rate limited, and the trail must not lose them. ``stop`` flushes
+    whatever is left.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        max_pending: int = 10000,
+        persist: bool = True,
+        event_logger: Optional[logging.Logger] = None,
+    ):
+        self.repository = None
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.persist = persist
+        self.event_logger = event_logger
+        # Recorded and not flushed yet
+        self.pending: List[Dict[str, Any]] = []
+        # Flushed (and logged) but not stored, because the insert failed
+        self.unwritten: List[Dict[str, Any]] = []
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        # Dropped since the last flush logged them
+        self._dropped_unlogged = 0
+        self.flush_failures = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def start(self, repository) -> None:
+        """Write events to ``repository`` (an AuditRepository) from now on."""
+        self.repository = repository
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        if self.unwritten:
+            logger.error(f"{len(self.unwritten)} audit events were not stored (they are in the audit log)")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def record(
+        self,
+        event: str,
+        actor_id: Optional[str] = None,
+        subject_id: Optional[str] = None,
+        critical: bool = False,
+        **metadata: Any,
+    ) -> bool:
+        """Queue an event; returns False when it was dropped because the queue is full."""
+        if len(self.pending) + len(self.unwritten) >= self.max_pending and not critical:
+            self.dropped += 1
+            self._dropped_unlogged += 1
+            return False
+        self.pending.append({
+            "event": event,
+            "actor_id": actor_id,
+            "subject_id": subject_id,
+            "metadata": metadata,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+        self.recorded += 1
+        if len(self.pending) >= self.batch_size and self._task is not None and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            self._flush_task = asyncio.create_task(self.flush())
+        return True
+
+    async def flush(self) -> int:
+        """Log the queued events and store them, with any left over, in one insert; returns the number stored."""
+        async with self._lock:
+            if self._dropped_unlogged:
+                logger.error(f"Dropped {self._dropped_unlogged} audit events because {self.max_pending} were waiting to be stored")
+                self._dropped_unlogged = 0
+            events, self.pending = self.pending, []
+            if self.event_logger is not None:
+                for event in events:
+                    self.event_logger.info(orjson.dumps(event, default=str).decode())
+            if not self.persist:
+                self.written += len(events)
+                return len(events)
+            rows, self.unwritten = self.unwritten + events, []
+            if not rows or self.repository is None:
+                self.unwritten = rows
+                return 0
+            try:
+                await self.repository.insert(rows)
+            except Exception as e:
+                self.flush_failures += 1
+                logger.warning(f"Writing {len(rows)} audit events failed: {str(e)}")
+                self.unwritten = rows
+                return 0
+            self.written += len(rows)
+            return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending) + len(self.unwritten),
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flush_failures": self.flush_failures,
+        }
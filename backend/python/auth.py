@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from jose import JWTError, jwt
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+ACCESS = "access"
+REFRESH = "refresh"
+# Short-lived and single-use, for stream URLs where an access token would end up in logs
+STREAM = "stream"
+
+
+class InvalidToken(Exception):
+    """The token is malformed, expired, revoked, of the wrong type or signed with an unknown key."""
+
+
+def _timestamp(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _isoformat(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def parse_keys(spec: str) -> Dict[str, str]:
+    """Parse ``kid1:secret1,kid2:secret2`` into signing secrets by key id."""
+    keys: Dict[str, str] = {}
+    for item in spec.split(","):
+        kid, _, secret = item.strip().partition(":")
+        if not kid:
+            continue
+        if not secret:
+            raise ValueError(f"JWT key {kid} has no secret")
+        keys[kid] = secret
+    return keys
+
+
+class TokenAuthority:
+    """Issues and verifies signed JWTs, remembering the tokens it already verified.
+
+    Each token names the key that signed it in its ``kid`` header, so several
+    keys can be accepted at once. To rotate, add a key, make it ``active_kid``
+    so new tokens use it, and drop the old key once the tokens it signed have
+    expired. Tokens without a ``kid`` are checked against the active key.
+
+    Verified payloads are cached by the whole token string, so a token seen
+    before skips the signature check and JSON parsing; only its expiry, type
+    and revocation are checked again. (Caching by signature alone would let a
+    forged payload ride on a genuine signature.)
+
+    Revoked token ids are kept in memory until the tokens they name expire, so
+    the set only holds revocations made within one token lifetime and a check
+    is one dict lookup. Given a repository (a TokenRepository) in ``start``,
+    revocations are also stored, and every ``sync_interval`` seconds each
+    worker loads the ones made elsewhere.
+    """
+
+    def __init__(
+        self,
+        keys: Dict[str, str],
+        active_kid: str,
+        access_ttl: float = 900.0,
+        refresh_ttl: float = 30 * 86400.0,
+        cache_size: int = 10000,
+        sync_interval: float = 5.0,
+        load_page_size: int = 1000,
+        algorithm: str = "HS256",
+    ):
+        if active_kid not in keys:
+            raise ValueError(f"Active JWT key {active_kid!r} is not among the configured keys")
+        self.keys = keys
+        self.active_kid = active_kid
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.sync_interval = sync_interval
+        self.load_page_size = load_page_size
+        self.algorithm = algorithm
+        self.verified: LRUCache[Dict[str, Any]] = LRUCache(max_size=cache_size, ttl=access_ttl)
+        # Expiry per revoked token id; entries are dropped once the token would have expired anyway
+        self.revoked: Dict[str, float] = {}
+        self.repository = None
+        self.synced_until: Optional[float] = None
+        self.rejected = 0
+        self.sync_failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, repository) -> None:
+        """Load the unexpired revocations from ``repository`` and keep syncing them."""
+        self.repository = repository
+        try:
+            await self.sync()
+        except Exception as e:
+            self.sync_failures += 1
+            logger.warning(f"Loading revoked tokens failed: {str(e)}")
+        self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def warm_up(self) -> None:
+        # python-jose sets up its signing backend on first use; pay for it before the first request
+        token = jwt.encode({"sub": "warm-up"}, self.keys[self.active_kid], algorithm=self.algorithm)
+        jwt.decode(token, self.keys[self.active_kid], algorithms=[self.algorithm])
+
+    def issue(self, claims: Dict[str, Any], token_type: str = ACCESS, ttl: Optional[float] = None) -> str:
+        now = time.time()
+        if ttl is None:
+            ttl = self.refresh_ttl if token_type == REFRESH else self.access_ttl
+        payload = {
+            **claims,
+            "typ": token_type,
+            "jti": uuid.uuid4().hex,
+            "iat": int(now),
+            "exp": int(now + ttl),
+        }
+        token = jwt.encode(
+            payload, self.keys[self.active_kid], algorithm=self.algorithm, headers={"kid": self.active_kid}
+        )
+        # The client will present it next; no need to verify our own signature then
+        self.verified.set(token, payload)
+        return token
+
+    def verify(self, token: str, token_type: str = ACCESS) -> Dict[str, Any]:
+        """The token's claims, or :class:`InvalidToken`."""
+        payload = self.verified.get(token)
+        if payload is None:
+            payload = self._decode(token)
+            self.verified.set(token, payload)
+        elif payload["exp"] <= time.time():
+            self.verified.invalidate(token)
+            self.rejected += 1
+            raise InvalidToken("Token has expired")
+        if payload.get("typ", ACCESS) != token_type:
+            self.rejected += 1
+            raise InvalidToken(f"Not an {token_type} token")
+        if payload.get("jti") in self.revoked:
+            self.rejected += 1
+            raise InvalidToken("Token has been revoked")
+        return payload
+
+    def _decode(self, token: str) -> Dict[str, Any]:
+        try:
+            kid = jwt.get_unverified_header(token).get("kid", self.active_kid)
+            key = self.keys.get(kid)
+            if key is None:
+                raise InvalidToken(f"Unknown signing key {kid!r}")
+            payload = jwt.decode(token, key, algorithms=[self.algorithm])
+        except JWTError as e:
+            self.rejected += 1
+            raise InvalidToken(str(e))
+        except InvalidToken:
+            self.rejected += 1
+            raise
+        # Tokens without an expiry could never leave the cache or the revocation set
+        if payload.get("sub") is None or not isinstance(payload.get("exp"), (int, float)):
+            self.rejected += 1
+            raise InvalidToken("Token lacks a subject or expiry")
+        return payload
+
+    async def revoke(self, payload: Dict[str, Any]) -> None:
+        """Reject the token with these verified claims from now on, on every worker."""
+        jti = payload.get("jti")
+        if jti is None or payload["exp"] <= time.time():
+            return
+        self.revoked[jti] = payload["exp"]
+        if self.repository is not None:
+            await self.repository.revoke(jti, payload["sub"], _isoformat(payload["exp"]))
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                self.sync_failures += 1
+                logger.warning(f"Loading revoked tokens failed: {str(e)}")
+
+    async def sync(self) -> int:
+        """Load revocations stored since the last sync; returns how many."""
+        started = time.time()
+        # Overlap by one interval so revocations committed while the last sync ran are not missed
+        since = _isoformat(self.synced_until - self.sync_interval) if self.synced_until is not None else None
+        loaded = 0
+        after = None
+        while True:
+            rows = await self.repository.revocations(since, limit=self.load_page_size, after=after)
+            for row in rows:
+                self.revoked[row["jti"]] = _timestamp(row["expires_at"])
+            loaded += len(rows)
+            if len(rows) < self.load_page_size:
+                break
+            after = (rows[-1]["revoked_at"], rows[-1]["jti"])
+        self.synced_until = started
+        self.revoked = {jti: expires_at for jti, expires_at in self.revoked.items() if expires_at > started}
+        return loaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self.keys),
+            "revoked": len(self.revoked),
+            "rejected": self.rejected,
+            "sync_failures": self.sync_failures,
+            "verified": self.verified.stats(),
+        }
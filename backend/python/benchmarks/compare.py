@@ -0,0 +1,62 @@
+"""Compare two result files written by ``benchmarks.run``.
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import json
+from typing import Any, Dict, Optional
+
+
+def _change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def compare_load(before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    print(f"{'scenario':<20} {'c':>4} {'req/s':>20} {'p95 ms':>22} {'p99 ms':>22}")
+    for scenario, levels in after.items():
+        if scenario.startswith("_") or scenario not in before:
+            continue
+        for concurrency, new in levels.items():
+            old: Optional[Dict[str, Any]] = before[scenario].get(concurrency)
+            if old is None:
+                continue
+            print(
+                f"{scenario:<20} {concurrency:>4} "
+                f"{old['throughput_rps']:>8.1f}->{new['throughput_rps']:<8.1f}{_change(old['throughput_rps'], new['throughput_rps']):>4} "
+                f"{old['latency_ms']['p95']:>7.2f}->{new['latency_ms']['p95']:<7.2f}{_change(old['latency_ms']['p95'], new['latency_ms']['p95']):>6} "
+                f"{old['latency_ms']['p99']:>7.2f}->{new['latency_ms']['p99']:<7.2f}{_change(old['latency_ms']['p99'], new['latency_ms']['p99']):>6}"
+            )
+
+
+def compare_micro(before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    print(f"{'micro-benchmark':<28} {'us/op':>28}")
+    for name, new in after.items():
+        old = before.get(name)
+        if old is None:
+            continue
+        print(f"{name:<28} {old['us_per_op']:>10.2f}->{new['us_per_op']:<10.2f}{_change(old['us_per_op'], new['us_per_op']):>8}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"before: {before['meta'].get('commit')}  after: {after['meta'].get('commit')}\n")
+    if "load" in before and "load" in after:
+        compare_load(before["load"], after["load"])
+        print()
+    if "micro" in before and "micro" in after:
+        compare_micro(before["micro"], after["micro"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Micro-benchmarks for per-request CPU work that is not I/O bound.
+
+``run_micro`` expects the already-imported ``app`` module, so the numbers use
+the same JWT settings and models as the running API.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+
+def _summary(iterations: int, elapsed: float) -> Dict[str, float]:
+    return {
+        "iterations": iterations,
+        "us_per_op": elapsed / iterations * 1e6,
+        "ops_per_sec": iterations / elapsed if elapsed else 0.0,
+    }
+
+
+def bench(func: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    for _ in range(min(iterations // 10, 1000)):
+        func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return _summary(iterations, time.perf_counter() - start)
+
+
+async def bench_async(func: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    for _ in range(min(iterations // 10, 1000)):
+        await func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return _summary(iterations, time.perf_counter() - start)
+
+
+def sample_user() -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "email": "micro@example.com",
+        "password": "not-a-real-hash",
+        "full_name": "Micro Benchmark",
+        "cpf": "52998224725",
+        "phone": "11987654321",
+        "kyc_level": 2,
+        "is_admin": False,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def sample_transactions(user_id: str, count: int) -> list:
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "type": "buy",
+            "amount_brl": 500.0,
+            "amount_btc": 0.0015,
+            "price_per_btc": 333333.33,
+            "payment_method": "pix",
+            "status": "pending",
+            "description": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for _ in range(count)
+    ]
+
+
+def serialization_benchmarks(user_id: str, iterations: int) -> Dict[str, Dict[str, float]]:
+    """A transaction page serialized the way FastAPI does with ``response_model``, and directly from the rows."""
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    from models import TransactionResponse
+    from serialization import RowSerializer
+
+    field = create_response_field(name="transactions", type_=List[TransactionResponse])
+    serializer = RowSerializer(TransactionResponse, many=True)
+    results = {}
+    for size in (50, 500, 5000):
+        page = sample_transactions(user_id, size)
+
+        async def models() -> bytes:
+            content = await serialize_response(
+                field=field,
+                response_content=[TransactionResponse(**t) for t in page],
+                is_coroutine=True,
+            )
+            return json.dumps(content).encode()
+
+        # Pages per run shrink with their size so each case takes similar time
+        pages = max(iterations // size, 3)
+        results[f"transaction_page_{size}_models"] = asyncio.run(bench_async(models, pages))
+        results[f"transaction_page_{size}_direct"] = bench(lambda: serializer.dumps(page), pages)
+    return results
+
+
+def typical_transactions(user_id: str, count: int) -> list:
+    """Transaction rows with the spread of amounts, prices, statuses and timestamps of a real history."""
+    rng = random.Random(count)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+    rows = []
+    for i in range(count):
+        price = round(rng.uniform(300000, 400000), 2)
+        amount_btc = round(rng.uniform(0.0001, 0.05), 8)
+        created = datetime.fromtimestamp(start + i * rng.uniform(60, 7200), tz=timezone.utc).isoformat()
+        rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "user_id": user_id,
+            "type": rng.choice(("buy", "sell")),
+            "amount_brl": round(amount_btc * price, 2),
+            "amount_btc": amount_btc,
+            "price_per_btc": price,
+            "payment_method": rng.choice(("pix", "pix", "bank_transfer")),
+            "status": rng.choice(("pending", "matched", "completed", "completed", "cancelled")),
+            "description": rng.choice((None, None, "Compra via PIX", "Venda parcial")),
+            "filled_btc": 0.0,
+            "created_at": created,
+            "updated_at": created,
+        })
+    return rows
+
+
+def compression_benchmarks(user_id: str, iterations: int) -> Dict[str, Dict[str, float]]:
+    """Each encoding and level on transaction pages of 50 and 200 rows, with the CPU cost per byte saved."""
+    from compression import ENCODERS, compress
+    from models import TransactionResponse
+    from serialization import RowSerializer
+
+    serializer = RowSerializer(TransactionResponse, many=True)
+    levels = {"gzip": (1, 6, 9), "br": (1, 4, 6), "zstd": (1, 3, 9)}
+    results = {}
+    for size in (50, 200):
+        body = serializer.dumps(typical_transactions(user_id, size))
+        pages = max(iterations // size, 3)
+        for encoding in ENCODERS:
+            for level in levels[encoding]:
+                result = bench(lambda: compress(encoding, level, body), pages)
+                compressed = len(compress(encoding, level, body))
+                saved = len(body) - compressed
+                result.update({
+                    "bytes_in": len(body),
+                    "bytes_out": compressed,
+                    "ratio": len(body) / compressed,
+                    "ns_per_saved_byte": result["us_per_op"] * 1000 / saved if saved > 0 else float("inf"),
+                })
+                results[f"compress_page_{size}_{encoding}_{level}"] = result
+    return results
+
+
+def order_book_benchmarks(iterations: int) -> Dict[str, Dict[str, float]]:
+    """Order insertion into a book with 1000 price levels per side, and a rest-then-fill round trip."""
+    from order_book import Order, OrderBook
+
+    book = OrderBook("BTC-BRL")
+    sequence = itertools.count()
+
+    def order(side: str, price: int, user_id: str) -> Order:
+        order_id = str(next(sequence))
+        return Order(id=order_id, user_id=user_id, side=side, price=price, remaining=100_000, row={})
+
+    def insert() -> None:
+        n = next(sequence)
+        if n % 2:
+            book.submit(order("buy", 30_000_000 - n % 1000 * 100, "buyer"))
+        else:
+            book.submit(order("sell", 40_000_000 + n % 1000 * 100, "seller"))
+
+    def match() -> None:
+        book.submit(order("sell", 35_000_000, "seller"))
+        book.submit(order("buy", 35_000_000, "buyer"))
+
+    return {
+        "order_book_insert": bench(insert, iterations),
+        "order_book_match": bench(match, iterations),
+    }
+
+
+def audit_benchmarks(user_id: str, iterations: int) -> Dict[str, Dict[str, float]]:
+    """Queueing one audit event on the request path, and the JSON encoding its flush does later."""
+    import orjson
+
+    from audit import AuditLog
+
+    # Unbounded and never started, so every event is queued and none is flushed
+    audit = AuditLog(max_pending=2 * iterations + 1000)
+    audit.record("transaction.created", user_id, user_id, type="buy", amount_brl=100.0, payment_method="pix")
+    event = audit.pending[0]
+    return {
+        "audit_record": bench(
+            lambda: audit.record("transaction.created", user_id, user_id, type="buy", amount_brl=100.0, payment_method="pix"),
+            iterations,
+        ),
+        "audit_event_json": bench(lambda: orjson.dumps(event, default=str).decode(), iterations),
+    }
+
+
+def decode_uncached(app_module, token: str) -> Dict[str, Any]:
+    app_module.token_authority.verified.invalidate(token)
+    return app_module.decode_access_token(token)
+
+
+def run_micro(app_module, iterations: int = 20000) -> Dict[str, Dict[str, float]]:
+    user = sample_user()
+    token = app_module.create_access_token(app_module.user_token_data(user))
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    results = {
+        "create_access_token": bench(lambda: app_module.create_access_token(app_module.user_token_data(user)), iterations),
+        # Verified-token cache hit, as for every request after a token's first
+        "decode_access_token": bench(lambda: app_module.decode_access_token(token), iterations),
+        "decode_access_token_uncached": bench(lambda: decode_uncached(app_module, token), iterations),
+        # Response bodies as register/login and the profile endpoint build them
+        "user_response": bench(lambda: app_module.user_serializer.dumps(user), iterations),
+        "token_response": bench(
+            lambda: app_module.token_serializer.dumps({"access_token": token, "user": user}),
+            iterations,
+        ),
+    }
+    results.update(serialization_benchmarks(user["id"], iterations))
+    results.update(compression_benchmarks(user["id"], iterations))
+    results.update(order_book_benchmarks(iterations))
+    results.update(audit_benchmarks(user["id"], iterations))
+
+    # Full auth dependency with the user record already cached, as on a warm worker
+    app_module.user_cache.set(user["id"], user)
+    results["get_current_user_cached"] = asyncio.run(
+        bench_async(lambda: app_module.get_current_user(credentials), iterations)
+    )
+    app_module.user_cache.invalidate(user["id"])
+    return results
@@ -0,0 +1,326 @@
+"""Load and micro-benchmarks for the API, run in-process and offline.
+
+The FastAPI app is driven through ``httpx.ASGITransport`` with its Supabase
+and price feed clients pointed at the stubs in ``benchmarks/stubs.py``, so the
+numbers cover the full middleware, validation, auth and repository path but
+no real network. Results are written as JSON for ``benchmarks/compare.py``.
+
+Run from ``backend/python``::
+
+    python -m benchmarks.run --concurrency 1,16,64 --requests 2000
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.micro import run_micro
+from benchmarks.stubs import PostgrestStub, PriceFeedStub, make_cpf, seed
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+PASSWORD = "Benchmark-Passw0rd"
+
+SCENARIOS = [
+    "get_bitcoin_price", "get_order_book", "login", "register", "register_duplicate", "register_invalid_cpf",
+    "get_transactions", "create_transaction", "match_transactions", "get_platform_stats",
+]
+# Scenarios bound by bcrypt, which get --auth-requests instead of --requests
+AUTH_SCENARIOS = {"login", "register"}
+
+RequestSpec = Tuple[str, str, Dict[str, Any]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    build: Callable[[int], RequestSpec]
+    expected_status: int = 200
+
+
+class Context:
+    """Seeded users and their tokens, shared by the scenario request builders."""
+
+    def __init__(self, app_module, users: List[Dict[str, Any]]):
+        self.users = users
+        self.admin_headers = self._auth(app_module, users[0])
+        self.headers = [self._auth(app_module, user) for user in users]
+        self.sequence = itertools.count(len(users) + 1)
+
+    @staticmethod
+    def _auth(app_module, user: Dict[str, Any]) -> Dict[str, str]:
+        token = app_module.create_access_token(app_module.user_token_data(user))
+        return {"Authorization": f"Bearer {token}"}
+
+    def user_headers(self, i: int) -> Dict[str, str]:
+        # Skip the admin so regular-user scenarios hit regular KYC limits
+        return self.headers[1 + i % (len(self.headers) - 1)] if len(self.headers) > 1 else self.headers[0]
+
+
+def build_scenarios(ctx: Context) -> Dict[str, Scenario]:
+    def login(i: int) -> RequestSpec:
+        user = ctx.users[i % len(ctx.users)]
+        return "POST", "/api/auth/login", {"json": {"email": user["email"], "password": PASSWORD}}
+
+    def register(i: int) -> RequestSpec:
+        n = next(ctx.sequence)
+        return "POST", "/api/auth/register", {"json": {
+            "email": f"new-{n}@example.com",
+            "password": PASSWORD,
+            "full_name": f"New User {n}",
+            "cpf": make_cpf(n),
+            "phone": "11987654321",
+        }}
+
+    def register_duplicate(i: int) -> RequestSpec:
+        # A seeded user's email with a fresh CPF: rejected by the uniqueness check, before bcrypt
+        n = next(ctx.sequence)
+        return "POST", "/api/auth/register", {"json": {
+            "email": ctx.users[i % len(ctx.users)]["email"],
+            "password": PASSWORD,
+            "full_name": f"New User {n}",
+            "cpf": make_cpf(n),
+            "phone": "11987654321",
+        }}
+
+    def register_invalid_cpf(i: int) -> RequestSpec:
+        # Wrong last check digit: rejected while validating the body, before any I/O
+        n = next(ctx.sequence)
+        cpf = make_cpf(n)
+        return "POST", "/api/auth/register", {"json": {
+            "email": f"new-{n}@example.com",
+            "password": PASSWORD,
+            "full_name": f"New User {n}",
+            "cpf": cpf[:10] + str((int(cpf[10]) + 1) % 10),
+            "phone": "11987654321",
+        }}
+
+    def get_transactions(i: int) -> RequestSpec:
+        return "GET", "/api/transactions?limit=50", {"headers": ctx.user_headers(i)}
+
+    def create_transaction(i: int) -> RequestSpec:
+        return "POST", "/api/transactions", {"headers": ctx.user_headers(i), "json": {
+            "type": "buy",
+            "amount_brl": 100.0,
+            "amount_btc": 0.0003,
+            "price_per_btc": 333333.33,
+            "payment_method": "pix",
+        }}
+
+    def match_transactions(i: int) -> RequestSpec:
+        # Alternate sells and buys at one price from different users, so every buy fills the sell before it
+        return "POST", "/api/transactions", {"headers": ctx.user_headers(i), "json": {
+            "type": "buy" if i % 2 else "sell",
+            "amount_brl": 100.0,
+            "amount_btc": 0.0003,
+            "price_per_btc": 333333.33,
+            "payment_method": "pix",
+        }}
+
+    def get_order_book(i: int) -> RequestSpec:
+        return "GET", "/api/bitcoin/orderbook?depth=20", {}
+
+    def get_platform_stats(i: int) -> RequestSpec:
+        return "GET", "/api/admin/stats", {"headers": ctx.admin_headers}
+
+    def get_bitcoin_price(i: int) -> RequestSpec:
+        return "GET", "/api/bitcoin/price", {}
+
+    builders = {
+        "login": login,
+        "register": register,
+        "register_duplicate": register_duplicate,
+        "register_invalid_cpf": register_invalid_cpf,
+        "get_transactions": get_transactions,
+        "create_transaction": create_transaction,
+        "match_transactions": match_transactions,
+        "get_order_book": get_order_book,
+        "get_platform_stats": get_platform_stats,
+        "get_bitcoin_price": get_bitcoin_price,
+    }
+    expected_status = {"register_duplicate": 400, "register_invalid_cpf": 422}
+    return {name: Scenario(name, build, expected_status.get(name, 200)) for name, build in builders.items()}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def drive(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, requests: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    indexes = iter(range(requests))
+
+    async def worker():
+        for i in indexes:
+            method, url, kwargs = scenario.build(i)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            key = str(response.status_code)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+        "statuses": statuses,
+        "errors": requests - statuses.get(str(scenario.expected_status), 0),
+    }
+
+
+async def run_load(app_module, args) -> Dict[str, Any]:
+    postgrest = PostgrestStub(latency=args.db_latency_ms / 1000)
+    price_feeds = PriceFeedStub(latency=args.api_latency_ms / 1000)
+    app_module.db.transport = postgrest.transport()
+    app_module.price_service.transport = price_feeds.transport()
+
+    password_hash = app_module.password_hasher.context.hash(PASSWORD)
+    users = seed(postgrest, args.users, args.transactions_per_user, password_hash)
+
+    results: Dict[str, Any] = {}
+    async with app_module.app.router.lifespan_context(app_module.app):
+        ctx = Context(app_module, users)
+        scenarios = build_scenarios(ctx)
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for name in args.scenarios:
+                scenario = scenarios[name]
+                requests = args.auth_requests if name in AUTH_SCENARIOS else args.requests
+                results[name] = {}
+                for concurrency in args.concurrency:
+                    warmup = min(requests // 10, 100)
+                    if warmup:
+                        await drive(client, scenario, concurrency, warmup)
+                    gc.collect()
+                    result = await drive(client, scenario, concurrency, requests)
+                    results[name][str(concurrency)] = result
+                    print(
+                        f"{name:<20} c={concurrency:<4} {result['throughput_rps']:>9.1f} req/s  "
+                        f"p50={result['latency_ms']['p50']:.2f}ms p95={result['latency_ms']['p95']:.2f}ms "
+                        f"p99={result['latency_ms']['p99']:.2f}ms errors={result['errors']}",
+                        file=sys.stderr,
+                    )
+    results["_stubs"] = {"postgrest_requests": postgrest.requests, "price_feed_requests": price_feeds.requests}
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(args) -> None:
+    """Point the app at the stubs; anything already set in the environment wins."""
+    defaults = {
+        "SUPABASE_URL": "http://supabase.benchmark",
+        "SUPABASE_KEY": "benchmark-service-key",
+        "JWT_SECRET_KEY": "benchmark-secret",
+        "RATE_LIMIT_ENABLED": "false",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,16,64", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per scenario and level")
+    parser.add_argument("--auth-requests", type=int, default=100, help="measured requests for login and register")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=200, help="seeded users (the first is an admin)")
+    parser.add_argument("--transactions-per-user", type=int, default=200)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated round trip per PostgREST request")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="simulated round trip per price feed request")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="BCRYPT_ROUNDS, unless set in the environment")
+    parser.add_argument("--micro-iterations", type=int, default=20000)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO logging")
+    parser.add_argument("--output", help="JSON results path (default: benchmarks/results/<time>-<commit>.json)")
+    args = parser.parse_args(argv)
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    configure_environment(args)
+
+    import app as app_module
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    started_at = datetime.now(timezone.utc)
+    commit = git_commit()
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": commit,
+            "started_at": started_at.isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "bcrypt_rounds": app_module.BCRYPT_ROUNDS,
+            "args": {k: v for k, v in vars(args).items() if k != "output"},
+        },
+    }
+    if not args.skip_load:
+        report["load"] = asyncio.run(run_load(app_module, args))
+    if not args.skip_micro:
+        report["micro"] = run_micro(app_module, args.micro_iterations)
+        for name, result in report["micro"].items():
+            line = f"{name:<28} {result['us_per_op']:>10.2f} us/op"
+            if "ns_per_saved_byte" in result:
+                line += f"  {result['bytes_in']}->{result['bytes_out']} bytes, {result['ns_per_saved_byte']:.2f} ns/saved byte"
+            print(line, file=sys.stderr)
+
+    output = Path(args.output) if args.output else (
+        BENCHMARK_DIR / "results" / f"{started_at:%Y%m%dT%H%M%S}-{commit or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Cold start cost: import time of ``app`` and latency of each worker's first requests.
+
+Every sample runs in a fresh interpreter, the way a new worker or an
+autoscaled container starts. The import phase runs ``python -X importtime -c
+"import app"`` and reports the total and the slowest top-level modules; with
+``--budget-ms`` the run fails when the median import takes longer. The
+startup phase imports the app in a child process, runs its ``lifespan``
+against the stubs in ``benchmarks/stubs.py``, and times the first and a
+later request of each scenario through ``httpx.ASGITransport``. ``ready_ms``
+is the time from spawning that process to the end of startup, when a worker
+would start accepting connections.
+
+Run from ``backend/python``::
+
+    python -m benchmarks.startup --samples 5 --budget-ms 1500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.run import BENCHMARK_DIR, PASSWORD, configure_environment, git_commit
+
+# One request each, in this order; login comes first so its bcrypt work is not hidden behind the others
+SCENARIOS = ["login", "get_transactions", "get_bitcoin_price", "get_order_book", "create_transaction"]
+
+
+def import_times(runs: int) -> Dict[str, Any]:
+    """Median ``-X importtime`` results over ``runs`` fresh interpreters."""
+    totals: List[float] = []
+    modules: Dict[str, List[float]] = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import app"],
+            cwd=BENCHMARK_DIR.parent, capture_output=True, text=True, check=True,
+        )
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if not cumulative.strip().isdigit():
+                continue
+            name = name.rstrip()
+            # Two spaces of indent per nesting level; depth 1 is what app (or site) imports directly
+            depth = (len(name) - len(name.lstrip())) // 2
+            name = name.strip()
+            if name == "app":
+                totals.append(int(cumulative) / 1000)
+            elif depth == 1:
+                modules.setdefault(name, []).append(int(cumulative) / 1000)
+    slowest = sorted(((name, statistics.median(ms)) for name, ms in modules.items()), key=lambda m: -m[1])
+    return {
+        "total_ms": statistics.median(totals),
+        "samples_ms": totals,
+        "slowest_ms": dict(slowest[:15]),
+    }
+
+
+async def _child_startup(args) -> Dict[str, Any]:
+    import httpx
+
+    import app as app_module
+    from benchmarks.run import Context, build_scenarios
+    from benchmarks.stubs import PostgrestStub, PriceFeedStub, seed
+
+    result: Dict[str, Any] = {}
+    postgrest = PostgrestStub(latency=args.db_latency_ms / 1000)
+    app_module.db.transport = postgrest.transport()
+    app_module.price_service.transport = PriceFeedStub(latency=args.api_latency_ms / 1000).transport()
+    # Hashed by the parent, so the app's own hasher stays cold
+    users = seed(postgrest, 20, 50, args.password_hash)
+
+    started = time.perf_counter()
+    async with app_module.app.router.lifespan_context(app_module.app):
+        result["lifespan_ms"] = (time.perf_counter() - started) * 1000
+        result["ready_at"] = time.time()
+        scenarios = build_scenarios(Context(app_module, users))
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for attempt in ("first", "later"):
+                for name in SCENARIOS:
+                    method, url, kwargs = scenarios[name].build(1 if attempt == "first" else 2)
+                    started = time.perf_counter()
+                    response = await client.request(method, url, **kwargs)
+                    result[f"{name}_{attempt}_ms"] = (time.perf_counter() - started) * 1000
+                    if response.status_code >= 400:
+                        raise RuntimeError(f"{name} returned {response.status_code}")
+    return result
+
+
+def startup_times(args) -> Dict[str, Any]:
+    from passlib.context import CryptContext
+
+    password_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.bcrypt_rounds).hash(PASSWORD)
+    samples = []
+    for _ in range(args.samples):
+        spawned_at = time.time()
+        result = subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.startup", "--child",
+                "--db-latency-ms", str(args.db_latency_ms), "--api-latency-ms", str(args.api_latency_ms),
+                "--bcrypt-rounds", str(args.bcrypt_rounds), "--password-hash", password_hash,
+            ],
+            cwd=BENCHMARK_DIR.parent, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Startup sample failed:\n{result.stderr}")
+        sample = json.loads(result.stdout.splitlines()[-1])
+        sample["ready_ms"] = (sample.pop("ready_at") - spawned_at) * 1000
+        samples.append(sample)
+    names = ["ready_ms"] + [name for name in samples[0] if name != "ready_ms"]
+    return {name: statistics.median(sample[name] for sample in samples) for name in names}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=5, help="fresh interpreters per phase")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail when the median import of app takes longer")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated round trip per PostgREST request")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="simulated round trip per price feed request")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="BCRYPT_ROUNDS, unless set in the environment")
+    parser.add_argument("--output", help="JSON results path (default: benchmarks/results/<time>-<commit>-startup.json)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--password-hash", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    configure_environment(args)
+    if args.child:
+        import logging
+        logging.disable(logging.WARNING)
+        print(json.dumps(asyncio.run(_child_startup(args))))
+        return
+
+    started_at = datetime.now(timezone.utc)
+    commit = git_commit()
+    imports = import_times(args.samples)
+    print(f"{'import app':<32} {imports['total_ms']:>9.1f} ms", file=sys.stderr)
+    for name, ms in imports["slowest_ms"].items():
+        print(f"  {name:<30} {ms:>9.1f} ms", file=sys.stderr)
+    startup = startup_times(args)
+    for name, ms in startup.items():
+        print(f"{name:<32} {ms:>9.1f} ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": commit,
+            "started_at": started_at.isoformat(),
+            "python": sys.version.split()[0],
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "child", "password_hash")},
+        },
+        "import": imports,
+        "startup": startup,
+    }
+    output = Path(args.output) if args.output else (
+        BENCHMARK_DIR / "results" / f"{started_at:%Y%m%dT%H%M%S}-{commit or 'nogit'}-startup.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.budget_ms is not None and imports["total_ms"] > args.budget_ms:
+        print(f"import app took {imports['total_ms']:.1f} ms, over the {args.budget_ms:.0f} ms budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
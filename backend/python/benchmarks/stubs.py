@@ -0,0 +1,561 @@
+"""In-process stand-ins for the Supabase REST API (PostgREST) and the price feeds.
+
+Both are ``httpx`` transports, so the app reaches them through its real
+clients and repository code. The PostgREST stand-in implements the subset of
+the query language the repositories use, keeps tables in memory with hash
+indexes on the columns the app filters by, and runs the SQL functions in
+``migrations/`` in Python. An optional per-request delay approximates the
+network round trip to a real database.
+"""
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+
+Row = Dict[str, Any]
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+class StubError(Exception):
+    """Raised by a stubbed SQL function; answered like the PostgREST error for it."""
+
+    def __init__(self, status_code: int, message: str, code: str, details: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.details = details
+
+
+class Table:
+    def __init__(self, indexed: Sequence[str] = ("id",), unique: Sequence[str] = ("id",)):
+        self.rows: List[Row] = []
+        self.unique = tuple(unique)
+        self.indexes: Dict[str, Dict[Any, List[Row]]] = {column: {} for column in indexed}
+
+    def insert(self, row: Row) -> None:
+        self.rows.append(row)
+        for column, index in self.indexes.items():
+            index.setdefault(row.get(column), []).append(row)
+
+    def reindex(self, row: Row, old: Row) -> None:
+        for column, index in self.indexes.items():
+            if old.get(column) != row.get(column):
+                index[old.get(column)].remove(row)
+                index.setdefault(row.get(column), []).append(row)
+
+    def lookup(self, column: str, value: Any) -> Optional[List[Row]]:
+        index = self.indexes.get(column)
+        if index is None:
+            return None
+        return index.get(value, [])
+
+    def conflicts(self, row: Row) -> Optional[str]:
+        for column in self.unique:
+            if row.get(column) is not None and self.lookup(column, row.get(column)):
+                return column
+        return None
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Split ``a,b,and(c,d)`` on commas outside parentheses and quotes."""
+    parts, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def _coerce(value: Any, literal: str) -> Tuple[Any, Any]:
+    literal = literal.strip('"')
+    if isinstance(value, bool):
+        return value, literal == "true"
+    if isinstance(value, (int, float)):
+        return float(value), float(literal)
+    return str(value), literal
+
+
+def _compare(value: Any, op: str, literal: str) -> bool:
+    if op == "is":
+        return (value is None) if literal == "null" else (value is (literal == "true"))
+    if op == "in":
+        options = [item.strip('"') for item in _split_top_level(literal.strip("()"))]
+        return value is not None and str(value) in options
+    if value is None:
+        return False
+    left, right = _coerce(value, literal)
+    if op == "eq":
+        return left == right
+    if op == "neq":
+        return left != right
+    if op == "gt":
+        return left > right
+    if op == "gte":
+        return left >= right
+    if op == "lt":
+        return left < right
+    if op == "lte":
+        return left <= right
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def _logical(row: Row, expression: str, combine: Callable[[Iterable[bool]], bool]) -> bool:
+    return combine(_condition(row, part) for part in _split_top_level(expression[1:-1]))
+
+
+def _condition(row: Row, expression: str) -> bool:
+    """Evaluate one ``col.op.value``, ``and(...)`` or ``or(...)`` term of a logical filter."""
+    if expression.startswith("and("):
+        return _logical(row, expression[3:], all)
+    if expression.startswith("or("):
+        return _logical(row, expression[2:], any)
+    column, op, literal = expression.split(".", 2)
+    return _compare(row.get(column), op, literal)
+
+
+class PostgrestStub:
+    """Minimal in-memory PostgREST, usable as ``Database(transport=stub.transport())``."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.tables: Dict[str, Table] = {
+            "users": Table(indexed=("id", "email", "cpf"), unique=("id", "email", "cpf")),
+            "transactions": Table(indexed=("id", "user_id")),
+            "idempotency_keys": Table(indexed=("key",), unique=("key",)),
+            "crypto_prices": Table(indexed=("id", "symbol")),
+            "crypto_price_candles": Table(indexed=("symbol",), unique=()),
+            "escrow_transactions": Table(indexed=("id", "status")),
+            "escrow_logs": Table(indexed=("escrow_id",)),
+            "revoked_tokens": Table(indexed=("jti",), unique=("jti",)),
+            "audit_events": Table(indexed=("id", "subject_id")),
+        }
+        # Set to simulate another worker holding the expire_escrows advisory lock
+        self.escrow_lock_held = False
+        self.functions: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "get_platform_stats": self.get_platform_stats,
+            "get_transaction_activity": self.get_transaction_activity,
+            "rollup_crypto_price_candles": self.rollup_crypto_price_candles,
+            "apply_order_fills": self.apply_order_fills,
+            "expire_escrows": self.expire_escrows,
+            "order_book_depth": self.order_book_depth,
+        }
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def table(self, name: str) -> Table:
+        if name not in self.tables:
+            self.tables[name] = Table()
+        return self.tables[name]
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body = await request.aread()
+        path = request.url.path.split("/rest/v1/", 1)[-1]
+        params = parse_qsl(request.url.query.decode(), keep_blank_values=True)
+
+        if path.startswith("rpc/"):
+            function = self.functions.get(path[4:])
+            if function is None:
+                return self._error(404, f"function {path[4:]} does not exist")
+            try:
+                return self._json(200, function(json.loads(body or b"{}")))
+            except StubError as e:
+                return self._error(e.status_code, str(e), code=e.code, details=e.details)
+
+        table = self.table(path)
+        prefer = request.headers.get("prefer", "")
+        if request.method in ("GET", "HEAD"):
+            return self._select(table, params, prefer)
+        if request.method == "POST":
+            return self._insert(table, params, prefer, json.loads(body))
+        if request.method == "PATCH":
+            return self._update(table, params, prefer, json.loads(body))
+        if request.method == "DELETE":
+            return self._delete(table, params, prefer)
+        return self._error(405, f"Method {request.method} not allowed")
+
+    # Query evaluation
+
+    def _filter(self, table: Table, params: List[Tuple[str, str]]) -> List[Row]:
+        filters = [(key, value) for key, value in params if key not in RESERVED_PARAMS]
+        # Indexed columns are all text, so an eq filter on one narrows the scan
+        rows = table.rows
+        for key, value in filters:
+            op, _, literal = value.partition(".")
+            if op == "eq" and key in table.indexes:
+                rows = table.lookup(key, literal.strip('"'))
+                break
+            if key == "or":
+                # Like a bitmap OR in Postgres: eq terms on indexed columns only visit the matching rows
+                terms = [term.split(".", 2) for term in _split_top_level(value[1:-1])]
+                if all(len(term) == 3 and term[1] == "eq" and term[0] in table.indexes for term in terms):
+                    found = {id(row): row for column, _, literal in terms for row in table.lookup(column, literal.strip('"'))}
+                    rows = list(found.values())
+                    break
+
+        def matches(row: Row) -> bool:
+            for key, value in filters:
+                if key in ("or", "and"):
+                    if not _logical(row, value, any if key == "or" else all):
+                        return False
+                    continue
+                op, _, literal = value.partition(".")
+                if not _compare(row.get(key), op, literal):
+                    return False
+            return True
+
+        return [row for row in rows if matches(row)]
+
+    @staticmethod
+    def _order(rows: List[Row], params: List[Tuple[str, str]]) -> List[Row]:
+        orders = [part for key, value in params if key == "order" for part in value.split(",")]
+        for order in reversed(orders):
+            column, _, direction = order.partition(".")
+            rows.sort(
+                key=lambda row: (row.get(column) is None, row.get(column) if row.get(column) is not None else ""),
+                reverse=direction.startswith("desc"),
+            )
+        return rows
+
+    @staticmethod
+    def _project(rows: List[Row], params: List[Tuple[str, str]]) -> List[Row]:
+        select = dict(params).get("select", "*")
+        if select == "*":
+            return [dict(row) for row in rows]
+        columns = [column.strip() for column in select.split(",") if column.strip()]
+        return [{column: row.get(column) for column in columns} for row in rows]
+
+    def _select(self, table: Table, params: List[Tuple[str, str]], prefer: str) -> httpx.Response:
+        rows = self._order(self._filter(table, params), params)
+        total = len(rows)
+        options = dict(params)
+        offset = int(options.get("offset", 0))
+        end = offset + int(options["limit"]) if "limit" in options else None
+        page = self._project(rows[offset:end], params)
+        headers = {"content-range": f"{offset}-{offset + len(page) - 1}/{total if 'count=' in prefer else '*'}"}
+        return self._json(200, page, headers)
+
+    def _insert(self, table: Table, params: List[Tuple[str, str]], prefer: str, payload: Any) -> httpx.Response:
+        records = payload if isinstance(payload, list) else [payload]
+        on_conflict = dict(params).get("on_conflict")
+        conflict_columns = on_conflict.split(",") if on_conflict else []
+        inserted: List[Row] = []
+        for record in records:
+            row = dict(record)
+            if conflict_columns:
+                existing = self._find(table, {column: row.get(column) for column in conflict_columns})
+                if existing is not None:
+                    if "resolution=merge-duplicates" in prefer:
+                        old = dict(existing)
+                        existing.update(row)
+                        table.reindex(existing, old)
+                        inserted.append(existing)
+                    continue
+            now = datetime.now(timezone.utc).isoformat()
+            row.setdefault("id", str(uuid.uuid4()))
+            row.setdefault("created_at", now)
+            row.setdefault("updated_at", now)
+            column = table.conflicts(row)
+            if column is not None:
+                return self._error(
+                    409,
+                    f'duplicate key value violates unique constraint "{column}"',
+                    code="23505",
+                    details=f"Key ({column})=({row[column]}) already exists.",
+                )
+            table.insert(row)
+            inserted.append(row)
+        if "return=minimal" in prefer:
+            return httpx.Response(201)
+        return self._json(201, self._project(inserted, params))
+
+    def _find(self, table: Table, values: Row) -> Optional[Row]:
+        first_column = next((column for column in values if column in table.indexes), None)
+        rows = table.lookup(first_column, values[first_column]) if first_column else table.rows
+        for row in rows:
+            if all(row.get(column) == value for column, value in values.items()):
+                return row
+        return None
+
+    def _update(self, table: Table, params: List[Tuple[str, str]], prefer: str, changes: Row) -> httpx.Response:
+        updated = []
+        for row in self._filter(table, params):
+            old = dict(row)
+            row.update(changes)
+            table.reindex(row, old)
+            updated.append(row)
+        if "return=minimal" in prefer:
+            return httpx.Response(204)
+        return self._json(200, self._project(updated, params))
+
+    def _delete(self, table: Table, params: List[Tuple[str, str]], prefer: str) -> httpx.Response:
+        doomed = self._filter(table, params)
+        doomed_ids = {id(row) for row in doomed}
+        table.rows = [row for row in table.rows if id(row) not in doomed_ids]
+        for index in table.indexes.values():
+            for key in list(index):
+                index[key] = [row for row in index[key] if id(row) not in doomed_ids]
+        if "return=minimal" in prefer:
+            return httpx.Response(204)
+        return self._json(200, self._project(doomed, params))
+
+    # SQL functions from migrations/
+
+    def get_platform_stats(self, args: Dict[str, Any]) -> List[Row]:
+        since = args.get("since") or (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
+        transactions = self.table("transactions").rows
+        recent = [t for t in transactions if t["created_at"] >= since]
+        return [{
+            "total_users": len(self.table("users").rows),
+            "total_transactions": len(transactions),
+            "total_volume_brl": sum(t["amount_brl"] for t in transactions),
+            "total_volume_btc": sum(t["amount_btc"] for t in transactions),
+            "active_users_24h": len({t["user_id"] for t in recent}),
+            "transactions_24h": len(recent),
+        }]
+
+    def get_transaction_activity(self, args: Dict[str, Any]) -> List[Row]:
+        since = args["since"]
+        bucket_seconds = int(args.get("bucket_seconds", 60))
+        buckets: Dict[Tuple[int, str], Row] = {}
+        for t in self.table("transactions").rows:
+            if t["created_at"] < since:
+                continue
+            ts = int(datetime.fromisoformat(t["created_at"]).timestamp()) // bucket_seconds * bucket_seconds
+            bucket = buckets.setdefault((ts, t["user_id"]), {
+                "bucket": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+                "user_id": t["user_id"],
+                "transactions": 0,
+                "volume_brl": 0.0,
+                "volume_btc": 0.0,
+            })
+            bucket["transactions"] += 1
+            bucket["volume_brl"] += t["amount_brl"]
+            bucket["volume_btc"] += t["amount_btc"]
+        return list(buckets.values())
+
+    def rollup_crypto_price_candles(self, args: Dict[str, Any]) -> None:
+        symbol = args["p_symbol"]
+        since = datetime.fromisoformat(args["p_since"]).timestamp()
+        ticks = sorted(self.table("crypto_prices").lookup("symbol", symbol) or [], key=lambda t: t["created_at"])
+        candles = self.table("crypto_price_candles")
+        for seconds in (60, 3600, 86400):
+            first = since // seconds * seconds
+            buckets: Dict[float, Row] = {}
+            for tick in ticks:
+                ts = datetime.fromisoformat(tick["created_at"]).timestamp() // seconds * seconds
+                if ts < first:
+                    continue
+                price = tick["price_brl"]
+                bar = buckets.get(ts)
+                if bar is None:
+                    buckets[ts] = {"open": price, "high": price, "low": price, "close": price, "ticks": 1}
+                else:
+                    bar.update(high=max(bar["high"], price), low=min(bar["low"], price), close=price, ticks=bar["ticks"] + 1)
+            for ts, bar in buckets.items():
+                key = {
+                    "symbol": symbol,
+                    "bucket_seconds": seconds,
+                    "bucket_start": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+                }
+                existing = self._find(candles, key)
+                if existing is not None:
+                    existing.update(bar)
+                else:
+                    candles.insert({**key, **bar})
+        return None
+
+    def apply_order_fills(self, args: Dict[str, Any]) -> None:
+        # Checked first, as the function runs in one transaction
+        users = self.table("users")
+        for escrow in args["p_escrows"]:
+            for column in ("seller_id", "buyer_id"):
+                if not users.lookup("id", escrow[column]):
+                    raise StubError(
+                        409,
+                        f'insert or update on table "escrow_transactions" violates foreign key constraint "escrow_transactions_{column}_fkey"',
+                        code="23503",
+                        details=f'Key ({column})=({escrow[column]}) is not present in table "users".',
+                    )
+        transactions = self.table("transactions")
+        for update in args["p_orders"]:
+            for row in transactions.lookup("id", update["id"]) or []:
+                row.update(update)
+        escrows = self.table("escrow_transactions")
+        for escrow in args["p_escrows"]:
+            if not escrows.lookup("id", escrow["id"]):
+                escrows.insert({**escrow, "updated_at": escrow["created_at"]})
+        return None
+
+    def order_book_depth(self, args: Dict[str, Any]) -> Row:
+        sides: Dict[str, Dict[float, Row]] = {"buy": {}, "sell": {}}
+        for row in self.table("transactions").rows:
+            remaining = row["amount_btc"] - (row.get("filled_btc") or 0)
+            if row["status"] != "pending" or remaining <= 0:
+                continue
+            level = sides[row["type"]].setdefault(
+                row["price_per_btc"], {"price_per_btc": row["price_per_btc"], "amount_btc": 0.0, "orders": 0}
+            )
+            level["amount_btc"] += remaining
+            level["orders"] += 1
+        return {
+            "bids": sorted(sides["buy"].values(), key=lambda l: -l["price_per_btc"])[:args["p_limit"]],
+            "asks": sorted(sides["sell"].values(), key=lambda l: l["price_per_btc"])[:args["p_limit"]],
+        }
+
+    def expire_escrows(self, args: Dict[str, Any]) -> Row:
+        if self.escrow_lock_held:
+            return {"locked": False}
+        now = datetime.now(timezone.utc)
+        escrows = self.table("escrow_transactions")
+        logs = self.table("escrow_logs")
+        expired, not_due = [], []
+        for escrow_id in args["p_ids"]:
+            for escrow in escrows.lookup("id", escrow_id) or []:
+                if escrow["status"] not in ("pending", "payment_pending"):
+                    continue
+                if datetime.fromisoformat(escrow["expires_at"]) > now:
+                    not_due.append({"id": escrow["id"], "expires_at": escrow["expires_at"]})
+                    continue
+                old = dict(escrow)
+                escrow.update(status="cancelled", cancelled_at=now.isoformat(), updated_at=now.isoformat())
+                escrows.reindex(escrow, old)
+                logs.insert({
+                    "id": str(uuid.uuid4()),
+                    "escrow_id": escrow["id"],
+                    "event": "expired",
+                    "metadata": {"previous_status": old["status"], "expires_at": escrow["expires_at"]},
+                    "created_at": now.isoformat(),
+                })
+                expired.append({
+                    **{key: escrow.get(key) for key in ("id", "transaction_id", "buy_transaction_id", "seller_id", "buyer_id", "expires_at", "cancelled_at")},
+                    "previous_status": old["status"],
+                })
+        return {"locked": True, "expired": expired, "not_due": not_due}
+
+    # Responses
+
+    @staticmethod
+    def _json(status_code: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        return httpx.Response(
+            status_code,
+            content=json.dumps(payload).encode(),
+            headers={"content-type": "application/json", **(headers or {})},
+        )
+
+    def _error(self, status_code: int, message: str, code: str = "PGRST000", details: Optional[str] = None) -> httpx.Response:
+        return self._json(status_code, {"code": code, "message": message, "details": details, "hint": None})
+
+
+class PriceFeedStub:
+    """Answers the CoinGecko, Binance and Mercado Bitcoin tickers with a fixed Bitcoin quote."""
+
+    def __init__(self, price_brl: float = 350000.0, price_usd: float = 65000.0, latency: float = 0.0):
+        self.price_brl = price_brl
+        self.price_usd = price_usd
+        self.latency = latency
+        self.requests = 0
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        host = request.url.host
+        if "coingecko" in host:
+            return httpx.Response(200, json={
+                "bitcoin": {
+                    "brl": self.price_brl,
+                    "usd": self.price_usd,
+                    "brl_24h_change": 1.25,
+                    "brl_24h_vol": 1500000000.0,
+                }
+            })
+        if "binance" in host:
+            return httpx.Response(200, json=[
+                {"symbol": "BTCBRL", "lastPrice": str(self.price_brl), "priceChangePercent": "1.25", "quoteVolume": "250000000.0"},
+                {"symbol": "BTCUSDT", "lastPrice": str(self.price_usd), "priceChangePercent": "1.10", "quoteVolume": "900000000.0"},
+            ])
+        if "mercadobitcoin" in host:
+            return httpx.Response(200, json={"ticker": {"last": str(self.price_brl), "vol": "120.5"}})
+        return httpx.Response(404)
+
+
+def make_cpf(number: int) -> str:
+    """Build a CPF with valid check digits from any non-negative integer."""
+    base = [int(digit) for digit in f"{number % 10 ** 9:09d}"]
+    for weight_start in (10, 11):
+        total = sum(digit * weight for digit, weight in zip(base, range(weight_start, 1, -1)))
+        remainder = total * 10 % 11
+        base.append(0 if remainder == 10 else remainder)
+    return "".join(str(digit) for digit in base)
+
+
+def seed(
+    stub: PostgrestStub,
+    users: int,
+    transactions_per_user: int,
+    password_hash: str,
+    days: int = 7,
+) -> List[Row]:
+    """Fill the stub with users (the first one an admin) and their transaction history.
+
+    Every user shares ``password_hash`` so seeding costs a single bcrypt call.
+    Returns the created user rows.
+    """
+    now = datetime.now(timezone.utc)
+    step = timedelta(days=days) / max(transactions_per_user, 1)
+    created = []
+    user_table = stub.table("users")
+    transaction_table = stub.table("transactions")
+    for i in range(users):
+        user = {
+            "id": str(uuid.uuid4()),
+            "email": f"bench-{i}@example.com",
+            "password": password_hash,
+            "full_name": f"Benchmark User {i}",
+            "cpf": make_cpf(i + 1),
+            "phone": f"119{i % 10 ** 8:08d}",
+            "kyc_level": 3 if i == 0 else 1,
+            "is_admin": i == 0,
+            "created_at": (now - timedelta(days=days + 1)).isoformat(),
+        }
+        user_table.insert(user)
+        created.append(user)
+        for n in range(transactions_per_user):
+            ts = (now - step * (n + 1)).isoformat()
+            transaction_table.insert({
+                "id": str(uuid.uuid4()),
+                "user_id": user["id"],
+                "type": "buy" if n % 2 else "sell",
+                "amount_brl": 500.0,
+                "amount_btc": 0.0015,
+                "price_per_btc": 333333.33,
+                "payment_method": "pix",
+                "status": "completed",
+                "description": None,
+                "idempotency_key": None,
+                "created_at": ts,
+                "updated_at": ts,
+            })
+    return created
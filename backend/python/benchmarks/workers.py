@@ -0,0 +1,205 @@
+"""Throughput against worker count, through ``server.py`` on a real socket.
+
+For each worker count a ``server.Supervisor`` is started on a free local port
+and driven by ``--clients`` load generator processes over HTTP/1.1 keep-alive
+connections. The app is imported, pointed at the stubs in
+``benchmarks/stubs.py`` and seeded before the supervisor forks, so every worker
+starts with its own copy of the stub database. Writes made through one worker
+are not visible to the others, which is why the default scenarios only read.
+
+Clients and workers share the machine, so the numbers flatten out once workers
+plus clients exceed the available CPUs. Run from ``backend/python``::
+
+    python -m benchmarks.workers --workers 1,2,4 --requests 4000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.run import (
+    BENCHMARK_DIR, PASSWORD, SCENARIOS, Context, build_scenarios, configure_environment, git_commit, percentile,
+)
+from benchmarks.stubs import PostgrestStub, PriceFeedStub, seed
+from server import Supervisor, available_cpus
+
+DEFAULT_SCENARIOS = ["get_bitcoin_price", "get_transactions", "get_order_book"]
+
+# Set in the parent before the client processes fork
+_scenarios = {}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port: int, workers: int) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 1
+    try:
+        code = Supervisor(app, host="127.0.0.1", port=port, workers=workers, log_level="warning").run()
+    finally:
+        os._exit(code)
+
+
+def wait_until_healthy(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if httpx.get(f"{base_url}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server at {base_url} did not become healthy")
+        time.sleep(0.1)
+
+
+async def _client_load(base_url: str, name: str, offset: int, concurrency: int, requests: int, warmup: int) -> Tuple[float, List[float], int]:
+    scenario = _scenarios[name]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        async def run(indexes, latencies, failures):
+            for i in indexes:
+                method, url, kwargs = scenario.build(offset + i)
+                start = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                if latencies is not None:
+                    latencies.append(time.perf_counter() - start)
+                if response.status_code != scenario.expected_status:
+                    failures.append(response.status_code)
+
+        warmup_indexes = iter(range(warmup))
+        await asyncio.gather(*(run(warmup_indexes, None, []) for _ in range(concurrency)))
+        latencies: List[float] = []
+        failures: List[int] = []
+        indexes = iter(range(requests))
+        start = time.perf_counter()
+        await asyncio.gather(*(run(indexes, latencies, failures) for _ in range(concurrency)))
+        return time.perf_counter() - start, latencies, len(failures)
+
+
+def client_load(job) -> Tuple[float, List[float], int]:
+    return asyncio.run(_client_load(*job))
+
+
+def measure(pool, base_url: str, name: str, clients: int, concurrency: int, requests: int) -> Dict[str, Any]:
+    per_client = requests // clients
+    per_connection = max(concurrency // clients, 1)
+    jobs = [
+        (base_url, name, c * per_client, per_connection, per_client, min(per_client // 10, 200))
+        for c in range(clients)
+    ]
+    results = pool.map(client_load, jobs)
+    latencies = sorted(latency for _, client_latencies, _ in results for latency in client_latencies)
+    # Clients start together, so the slowest one bounds the run
+    seconds = max(elapsed for elapsed, _, _ in results)
+    return {
+        "requests": len(latencies),
+        "concurrency": per_connection * clients,
+        "seconds": seconds,
+        "throughput_rps": len(latencies) / seconds if seconds else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+        },
+        "errors": sum(errors for _, _, errors in results),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default=None, help="comma-separated worker counts (default: 1, 2, 4... up to 2x the CPUs)")
+    parser.add_argument("--clients", type=int, default=2, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=64, help="open connections, split across the clients")
+    parser.add_argument("--requests", type=int, default=4000, help="measured requests per scenario and worker count")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=200, help="seeded users (the first is an admin)")
+    parser.add_argument("--transactions-per-user", type=int, default=200)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated round trip per PostgREST request")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="BCRYPT_ROUNDS, unless set in the environment")
+    parser.add_argument("--output", help="JSON results path (default: benchmarks/results/<time>-<commit>-workers.json)")
+    args = parser.parse_args(argv)
+    if args.workers:
+        args.workers = [int(w) for w in args.workers.split(",") if w]
+    else:
+        cpus = available_cpus()
+        args.workers = [w for w in (1, 2, 4, 8, 16, 32) if w <= max(2 * cpus, 2)]
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    configure_environment(args)
+
+    import app as app_module
+
+    logging.getLogger().setLevel(logging.WARNING)
+    postgrest = PostgrestStub(latency=args.db_latency_ms / 1000)
+    app_module.db.transport = postgrest.transport()
+    app_module.price_service.transport = PriceFeedStub().transport()
+    password_hash = app_module.password_hasher.context.hash(PASSWORD)
+    users = seed(postgrest, args.users, args.transactions_per_user, password_hash)
+    _scenarios.update(build_scenarios(Context(app_module, users)))
+
+    started_at = datetime.now(timezone.utc)
+    commit = git_commit()
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": commit,
+            "started_at": started_at.isoformat(),
+            "cpus": available_cpus(),
+            "args": {k: v for k, v in vars(args).items() if k != "output"},
+        },
+        "workers": {},
+    }
+    with multiprocessing.get_context("fork").Pool(args.clients) as pool:
+        for workers in args.workers:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            server_pid = start_server(app_module.app, port, workers)
+            try:
+                wait_until_healthy(base_url)
+                results = report["workers"][str(workers)] = {}
+                for name in args.scenarios:
+                    result = results[name] = measure(pool, base_url, name, args.clients, args.concurrency, args.requests)
+                    print(
+                        f"workers={workers:<3} {name:<20} {result['throughput_rps']:>9.1f} req/s  "
+                        f"p50={result['latency_ms']['p50']:.2f}ms p99={result['latency_ms']['p99']:.2f}ms "
+                        f"errors={result['errors']}",
+                        file=sys.stderr,
+                    )
+            finally:
+                os.kill(server_pid, signal.SIGTERM)
+                os.waitpid(server_pid, 0)
+
+    output = Path(args.output) if args.output else (
+        BENCHMARK_DIR / "results" / f"{started_at:%Y%m%dT%H%M%S}-{commit or 'nogit'}-workers.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class CacheEntry(Generic[T]):
+    value: T
+    stored_at: float
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+
+class SWRCache(Generic[T]):
+    """In-process TTL cache with stale-while-revalidate and single-flight loads.
+
+    Entries younger than ``ttl`` are served as-is. Entries between ``ttl`` and
+    ``ttl + stale_ttl`` are served immediately while one background refresh
+    runs. Concurrent misses for the same key share a single loader call.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float = 0.0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: Dict[Hashable, CacheEntry[T]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def peek(self, key: Hashable) -> Optional[CacheEntry[T]]:
+        return self._entries.get(key)
+
+    def set(self, key: Hashable, value: T) -> CacheEntry[T]:
+        entry = CacheEntry(value=value, stored_at=time.monotonic())
+        self._entries[key] = entry
+        return entry
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> CacheEntry[T]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = entry.age
+            if age < self.ttl:
+                self.hits += 1
+                return entry
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self.refresh_in_background(key, loader)
+                return entry
+
+        self.misses += 1
+        try:
+            return await self.load(key, loader)
+        except Exception:
+            # Upstream failed and nothing fresh is available: fall back to
+            # whatever we still hold rather than erroring out.
+            if entry is not None:
+                logger.warning(f"Cache load failed for {key!r}, serving entry aged {entry.age:.1f}s")
+                return entry
+            raise
+
+    async def load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> CacheEntry[T]:
+        """Run ``loader`` once per key no matter how many callers are waiting."""
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            try:
+                value = await loader()
+            except BaseException as e:
+                future.set_exception(e)
+                # Mark the exception as retrieved when nobody else is waiting
+                future.exception()
+                raise
+            else:
+                entry = self.set(key, value)
+                future.set_result(entry)
+                return entry
+            finally:
+                self._inflight.pop(key, None)
+        return await asyncio.shield(future)
+
+    def refresh_in_background(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> None:
+        if key in self._inflight:
+            return
+
+        async def _refresh() -> None:
+            try:
+                await self.load(key, loader)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {key!r}: {str(e)}")
+
+        asyncio.get_running_loop().create_task(_refresh())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+
+class LRUCache(Generic[T]):
+    """Size-bounded LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, CacheEntry[T]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[T]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.age >= self.ttl:
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: Hashable, value: T) -> None:
+        self._entries[key] = CacheEntry(value=value, stored_at=time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _isoformat(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+class CacheInvalidations:
+    """Carries cache invalidations from the worker that made them to every other worker.
+
+    Callbacks are registered per kind of cache (``register("user", ...)``).
+    ``invalidate`` runs the local callback at once and queues the
+    invalidation; every ``sync_interval`` seconds the queue is written to the
+    repository (a CacheInvalidationRepository) and the invalidations other
+    workers stored since the last sync are applied here. Rows are read again
+    with one interval of overlap, so ones committed while the last sync ran
+    are not missed, and the ids already applied in that window are skipped.
+    A worker therefore serves a stale entry for at most about two intervals
+    after another worker changed it.
+    """
+
+    def __init__(self, sync_interval: float = 1.0, load_page_size: int = 1000, max_pending: int = 10000):
+        self.sync_interval = sync_interval
+        self.load_page_size = load_page_size
+        self.max_pending = max_pending
+        self.callbacks: Dict[str, Callable[[str], None]] = {}
+        self.repository = None
+        self.worker_id: Optional[str] = None
+        self.pending: List[Dict[str, Any]] = []
+        self.synced_until: Optional[float] = None
+        # Ids applied within the overlap window, with the time they were applied
+        self._seen: Dict[int, float] = {}
+        self.published = 0
+        self.applied = 0
+        self.dropped = 0
+        self.sync_failures = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, kind: str, callback: Callable[[str], None]) -> None:
+        self.callbacks[kind] = callback
+
+    async def start(self, repository) -> None:
+        """Publish to and load from ``repository`` from now on."""
+        self.repository = repository
+        # Generated here, after the server forked, so every worker has its own
+        self.worker_id = uuid.uuid4().hex
+        # Invalidations made before this worker started cannot concern anything it has cached
+        self.synced_until = time.time()
+        self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.repository is not None:
+            try:
+                await self._publish()
+            except Exception as e:
+                logger.warning(f"Publishing {len(self.pending)} cache invalidations failed: {str(e)}")
+
+    def invalidate(self, kind: str, scope: str) -> None:
+        """Invalidate ``scope`` in the ``kind`` cache here now, and on the other workers with the next sync."""
+        self.callbacks[kind](scope)
+        if self.repository is None:
+            return
+        if len(self.pending) >= self.max_pending:
+            # Entries expire with their TTL anyway; a full queue means the database is unreachable
+            self.dropped += 1
+            return
+        self.pending.append({"kind": kind, "scope": str(scope), "worker": self.worker_id})
+
+    async def flush(self) -> None:
+        """Publish the queued invalidations now, for changes other workers must see without delay."""
+        await self._publish()
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                self.sync_failures += 1
+                logger.warning(f"Syncing cache invalidations failed: {str(e)}")
+
+    async def _publish(self) -> None:
+        async with self._lock:
+            rows, self.pending = self.pending, []
+            if not rows:
+                return
+            try:
+                await self.repository.publish(rows)
+            except Exception:
+                self.pending = rows + self.pending
+                raise
+            self.published += len(rows)
+
+    async def sync(self) -> int:
+        """Publish the queue and apply the invalidations stored by other workers; returns how many were applied."""
+        await self._publish()
+        started = time.time()
+        since = _isoformat(self.synced_until - self.sync_interval)
+        applied = 0
+        after: Optional[Tuple[str, int]] = None
+        while True:
+            rows = await self.repository.since(since, limit=self.load_page_size, after=after)
+            for row in rows:
+                if row["id"] in self._seen:
+                    continue
+                self._seen[row["id"]] = started
+                if row["worker"] == self.worker_id:
+                    continue
+                callback = self.callbacks.get(row["kind"])
+                if callback is not None:
+                    callback(row["scope"])
+                    applied += 1
+            if len(rows) < self.load_page_size:
+                break
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+        self.synced_until = started
+        # Older ids fall before the next read's overlap; applying one twice would only cost a cache miss
+        self._seen = {i: seen_at for i, seen_at in self._seen.items() if started - seen_at <= 3 * self.sync_interval}
+        self.applied += applied
+        return applied
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "published": self.published,
+            "applied": self.applied,
+            "dropped": self.dropped,
+            "sync_failures": self.sync_failures,
+        }
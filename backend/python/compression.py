@@ -0,0 +1,224 @@
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._compressor.process(data)
+        return out + self._compressor.flush() if flush else out
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Content-Encoding tokens this process can produce; brotli and zstd need their optional packages
+ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS["zstd"] = ZstdEncoder
+
+# Bytes in and out per encoding, for the metrics collector
+compression_counters: Dict[str, Dict[str, int]] = {
+    name: {"responses": 0, "bytes_in": 0, "bytes_out": 0} for name in ENCODERS
+}
+
+
+def compress(encoding: str, level: int, body: bytes) -> bytes:
+    encoder = ENCODERS[encoding](level)
+    return encoder.compress(body) + encoder.finish()
+
+
+def parse_levels(spec: str) -> Dict[str, List[Tuple[str, int]]]:
+    """Parse ``application/json=zstd:3,br:4,gzip:6;application/x-ndjson=gzip:1``.
+
+    Each media type maps to the encodings it may be sent with, most preferred
+    first, and their levels. Encodings whose package is not installed are left
+    out, and media types not listed are never compressed.
+    """
+    levels: Dict[str, List[Tuple[str, int]]] = {}
+    for entry in spec.split(";"):
+        media_type, _, encodings = entry.partition("=")
+        media_type = media_type.strip().lower()
+        if not media_type:
+            continue
+        allowed = []
+        for item in encodings.split(","):
+            encoding, _, level = item.partition(":")
+            encoding = encoding.strip().lower()
+            if not encoding:
+                continue
+            if not level.strip():
+                raise ValueError(f"Compression level missing for {encoding} in {media_type}")
+            if encoding in ENCODERS:
+                allowed.append((encoding, int(level)))
+        levels[media_type] = allowed
+    return levels
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Quality values from an ``Accept-Encoding`` header, keyed by lowercase coding."""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def negotiate(accepted: Dict[str, float], allowed: List[Tuple[str, int]]) -> Optional[Tuple[str, int]]:
+    """The allowed encoding the client ranks highest, ties going to the server's order."""
+    best = None
+    best_quality = 0.0
+    for encoding, level in allowed:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = (encoding, level), quality
+    return best
+
+
+class CompressionMiddleware:
+    """Compresses responses with the best encoding both sides support.
+
+    Only media types listed in ``levels`` are compressed, each with its own
+    encodings and levels, so event streams and already compressed content pass
+    through untouched. Bodies sent in one piece are compressed when they reach
+    ``minimum_size`` bytes. Streamed bodies are compressed chunk by chunk and
+    each chunk is flushed, so nothing is buffered and clients can decode rows
+    as they arrive. Strong ETags are weakened on compressed responses, since
+    the bytes differ from the identity representation; ``If-None-Match`` still
+    matches them under weak comparison.
+    """
+
+    def __init__(self, app, levels: Dict[str, List[Tuple[str, int]]], minimum_size: int = 1024):
+        self.app = app
+        self.levels = levels
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding")
+        if not accept_encoding:
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(accept_encoding)
+
+        start_message = None
+        chosen: Optional[Tuple[str, int]] = None
+        encoder = None
+        counters: Dict[str, int] = {}
+
+        async def compress_send(message):
+            nonlocal start_message, chosen, encoder, counters
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                chosen = self._choose(message, accepted)
+                if chosen is None:
+                    await send(message)
+                else:
+                    # Hold the headers until the first chunk shows whether the body is worth compressing
+                    start_message = {**message, "headers": list(message.get("headers", []))}
+                return
+            if message_type != "http.response.body" or (start_message is None and encoder is None):
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+                encoding, level = chosen
+                encoder = ENCODERS[encoding](level)
+                counters = compression_counters[encoding]
+                counters["responses"] += 1
+                headers["Content-Encoding"] = encoding
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                if more_body:
+                    del headers["Content-Length"]
+                    chunk = encoder.compress(body, flush=True)
+                else:
+                    chunk = encoder.compress(body) + encoder.finish()
+                    headers["Content-Length"] = str(len(chunk))
+                await send(start_message)
+                start_message = None
+            elif more_body:
+                chunk = encoder.compress(body, flush=True)
+            else:
+                chunk = encoder.compress(body) + encoder.finish()
+            counters["bytes_in"] += len(body)
+            counters["bytes_out"] += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, compress_send)
+
+    def _choose(self, start_message, accepted: Dict[str, float]) -> Optional[Tuple[str, int]]:
+        status = start_message["status"]
+        if status < 200 or status in (204, 304):
+            return None
+        headers = Headers(raw=start_message["headers"])
+        if "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+            return None
+        media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+        allowed = self.levels.get(media_type)
+        if not allowed:
+            return None
+        return negotiate(accepted, allowed)
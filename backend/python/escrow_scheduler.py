@@ -0,0 +1,192 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Escrow states in which nothing has been paid yet, so running out of time cancels the escrow
+EXPIRABLE_STATUSES = ("pending", "payment_pending")
+
+
+def _timestamp(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _isoformat(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+class EscrowExpiryScheduler:
+    """Cancels escrows when their ``expires_at`` passes, without polling the whole table.
+
+    Upcoming expiries are kept in a min-heap. Every ``refresh_interval`` seconds
+    the heap is topped up with open escrows that entered the ``lookahead``
+    window or were created since the previous refresh, so each refresh reads
+    only new rows. The loop sleeps until the earliest expiry and cancels
+    everything due in batches of ``batch_size`` with the ``expire_escrows`` SQL
+    function, which also writes the ``escrow_logs`` entries. That function takes
+    a transaction-level advisory lock, so when several workers run the
+    scheduler only one of them cancels a given batch; the others retry after
+    ``retry_delay`` seconds and find the escrows already cancelled.
+    """
+
+    def __init__(
+        self,
+        lookahead: float = 300.0,
+        refresh_interval: float = 30.0,
+        batch_size: int = 500,
+        retry_delay: float = 1.0,
+        load_page_size: int = 1000,
+    ):
+        self.repository = None
+        self.lookahead = max(lookahead, 2 * refresh_interval)
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.load_page_size = load_page_size
+        self.listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self.heap: List[Tuple[float, str]] = []
+        # Expiry currently scheduled per escrow id; heap entries that disagree are stale
+        self.scheduled: Dict[str, float] = {}
+        self.loaded_until: Optional[float] = None
+        self.last_refresh: Optional[float] = None
+        self.expired = 0
+        self.lock_misses = 0
+        self.failures = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """Call ``callback`` with the escrow rows cancelled by each batch."""
+        self.listeners.append(callback)
+
+    async def start(self, repository) -> None:
+        """Load due and upcoming expiries from ``repository`` (an EscrowRepository) and start the loop."""
+        self.repository = repository
+        self._wakeup = asyncio.Event()
+        try:
+            await self.refresh()
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Loading escrow expiries failed: {str(e)}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, escrow_id: str, expires_at: float) -> None:
+        if self.scheduled.get(escrow_id) == expires_at:
+            return
+        self.scheduled[escrow_id] = expires_at
+        heapq.heappush(self.heap, (expires_at, escrow_id))
+        if self.heap[0][1] == escrow_id:
+            self._wakeup.set()
+
+    async def refresh(self) -> int:
+        """Add open escrows expiring before the lookahead horizon that are not loaded yet."""
+        started = time.time()
+        horizon = started + self.lookahead
+        loaded = 0
+        after = None
+        while True:
+            rows = await self.repository.upcoming_expiries(
+                EXPIRABLE_STATUSES,
+                before=_isoformat(horizon),
+                since=_isoformat(self.loaded_until) if self.loaded_until is not None else None,
+                created_since=_isoformat(self.last_refresh) if self.last_refresh is not None else None,
+                limit=self.load_page_size,
+                after=after,
+            )
+            for row in rows:
+                self.schedule(row["id"], _timestamp(row["expires_at"]))
+            loaded += len(rows)
+            if len(rows) < self.load_page_size:
+                break
+            after = (rows[-1]["expires_at"], rows[-1]["id"])
+        self.loaded_until = horizon
+        # Overlap by one interval so rows committed while this refresh ran are seen next time
+        self.last_refresh = started - self.refresh_interval
+        return loaded
+
+    def _pop_due(self, now: float) -> List[str]:
+        due: List[str] = []
+        while self.heap and self.heap[0][0] <= now and len(due) < self.batch_size:
+            expires_at, escrow_id = heapq.heappop(self.heap)
+            if self.scheduled.get(escrow_id) == expires_at:
+                del self.scheduled[escrow_id]
+                due.append(escrow_id)
+        return due
+
+    async def expire(self, escrow_ids: List[str]) -> int:
+        """Cancel the given due escrows; returns how many this worker cancelled."""
+        try:
+            result = await self.repository.expire(escrow_ids)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Expiring {len(escrow_ids)} escrows failed: {str(e)}")
+            self._retry(escrow_ids)
+            return 0
+        if not result.get("locked"):
+            # Another worker holds the lock and is cancelling its batch, probably these same escrows
+            self.lock_misses += 1
+            self._retry(escrow_ids)
+            return 0
+        # The database clock says these are not due yet; try again when it does
+        for row in result.get("not_due") or []:
+            self.schedule(row["id"], _timestamp(row["expires_at"]))
+        expired = result.get("expired") or []
+        self.expired += len(expired)
+        if expired:
+            logger.info(f"Cancelled {len(expired)} expired escrows")
+            for callback in self.listeners:
+                try:
+                    callback(expired)
+                except Exception as e:
+                    logger.warning(f"Escrow expiry listener failed: {str(e)}")
+        return len(expired)
+
+    def _retry(self, escrow_ids: List[str]) -> None:
+        retry_at = time.time() + self.retry_delay
+        for escrow_id in escrow_ids:
+            self.schedule(escrow_id, retry_at)
+
+    async def _run(self) -> None:
+        next_refresh = time.time() + self.refresh_interval
+        while True:
+            now = time.time()
+            if now >= next_refresh:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    self.failures += 1
+                    logger.warning(f"Loading escrow expiries failed: {str(e)}")
+                next_refresh = now + self.refresh_interval
+
+            due = self._pop_due(now)
+            if due:
+                await self.expire(due)
+                continue
+
+            wake_at = min(self.heap[0][0], next_refresh) if self.heap else next_refresh
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(wake_at - time.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "scheduled": len(self.scheduled),
+            "expired": self.expired,
+            "lock_misses": self.lock_misses,
+            "failures": self.failures,
+        }
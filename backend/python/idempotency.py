@@ -0,0 +1,276 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"POST", "PATCH"}
+HEADER_NAME = b"idempotency-key"
+
+
+@dataclass
+class StoredResponse:
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "headers": [[k.decode("latin-1"), v.decode("latin-1")] for k, v in self.headers],
+            "body": base64.b64encode(self.body).decode(),
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "StoredResponse":
+        return cls(
+            status=record["status"],
+            headers=[(k.encode("latin-1"), v.encode("latin-1")) for k, v in record["headers"]],
+            body=base64.b64decode(record["body"]),
+        )
+
+
+@dataclass
+class IdempotencyEntry:
+    fingerprint: str
+    created_at: float = field(default_factory=time.monotonic)
+    response: Optional[StoredResponse] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class IdempotencyStore:
+    """Bounded in-memory map of idempotency keys to in-flight or completed requests."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, IdempotencyEntry]" = OrderedDict()
+        self.replays = 0
+        self.conflicts = 0
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        excess = len(self._entries) - self.max_entries
+        stale = []
+        # Entries are kept in insertion order, so the oldest are at the front.
+        # In-flight entries stay: their duplicates are waiting on them.
+        for key, entry in self._entries.items():
+            if len(stale) >= excess and now - entry.created_at < self.ttl:
+                break
+            if entry.done.is_set():
+                stale.append(key)
+        for key in stale:
+            del self._entries[key]
+
+    def get(self, key: str) -> Optional[IdempotencyEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.done.is_set() and time.monotonic() - entry.created_at >= self.ttl:
+            del self._entries[key]
+            return None
+        return entry
+
+    def begin(self, key: str, fingerprint: str) -> IdempotencyEntry:
+        entry = IdempotencyEntry(fingerprint=fingerprint)
+        self._entries[key] = entry
+        self._evict()
+        return entry
+
+    def complete(self, key: str, entry: IdempotencyEntry, response: Optional[StoredResponse]) -> None:
+        entry.response = response
+        entry.done.set()
+        if response is None:
+            # Not replayable (e.g. a server error): let the client retry for real
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+        }
+
+
+class IdempotencyMiddleware:
+    """Replays the stored response for repeated ``Idempotency-Key`` requests.
+
+    Keys are scoped to the method, path and caller, as returned by ``identify``
+    (the Authorization header when none is given), and bound to a hash of the
+    request body so a reused key with a different payload is
+    rejected. A duplicate that arrives while the first request is still running
+    waits for it instead of executing again. Only responses below 500 are
+    stored. When a durable repository is configured, completed responses are
+    also written there so they survive restarts and are shared by workers.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: IdempotencyStore,
+        repository_getter=None,
+        max_body_size: int = 1_048_576,
+        identify: Optional[Callable[[dict], str]] = None,
+    ):
+        self.app = app
+        self.store = store
+        self.repository_getter = repository_getter
+        self.identify = identify
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in IDEMPOTENT_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(HEADER_NAME)
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._send_json(send, 413, "Request body too large for an idempotent request")
+            return
+
+        scope_key = hashlib.sha256(
+            b"\0".join([
+                scope["method"].encode(),
+                scope["path"].encode(),
+                self._caller(scope, headers),
+                idempotency_key,
+            ])
+        ).hexdigest()
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        entry = self.store.get(scope_key)
+        if entry is None:
+            stored = await self._load_durable(scope_key)
+            if stored is not None:
+                # Keep the stored fingerprint, so a different payload is refused below
+                stored_fingerprint, stored_response = stored
+                entry = self.store.begin(scope_key, stored_fingerprint)
+                self.store.complete(scope_key, entry, stored_response)
+
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                self.store.conflicts += 1
+                await self._send_json(send, 422, "Idempotency-Key was already used with a different request")
+                return
+            await entry.done.wait()
+            if entry.response is not None:
+                self.store.replays += 1
+                await self._replay(send, entry.response)
+                return
+            # The first attempt failed without a replayable response; run again
+            entry = None
+
+        entry = self.store.begin(scope_key, fingerprint)
+        captured: Dict[str, Any] = {"status": 500, "headers": [], "body": []}
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if body_sent:
+                # Only disconnect notifications are left on the real channel
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                captured["body"].append(message.get("body", b""))
+            await send(message)
+
+        response: Optional[StoredResponse] = None
+        try:
+            await self.app(scope, replay_receive, capture_send)
+            if captured["status"] < 500:
+                response = StoredResponse(
+                    status=captured["status"],
+                    headers=captured["headers"],
+                    body=b"".join(captured["body"]),
+                )
+        finally:
+            self.store.complete(scope_key, entry, response)
+        if response is not None:
+            await self._save_durable(scope_key, fingerprint, response)
+
+    async def _read_body(self, receive) -> Optional[bytes]:
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_size:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    def _caller(self, scope, headers: Dict[bytes, bytes]) -> bytes:
+        if self.identify is None:
+            return headers.get(b"authorization", b"")
+        return self.identify(scope).encode()
+
+    def _repository(self):
+        return self.repository_getter() if self.repository_getter is not None else None
+
+    async def _load_durable(self, scope_key: str) -> Optional[Tuple[str, StoredResponse]]:
+        """The fingerprint and response stored for ``scope_key`` by any worker, if there is one."""
+        repository = self._repository()
+        if repository is None:
+            return None
+        try:
+            record = await repository.get(scope_key)
+        except Exception as e:
+            logger.warning(f"Idempotency key lookup failed: {str(e)}")
+            return None
+        if not record:
+            return None
+        return record["fingerprint"], StoredResponse.from_record(record["response"])
+
+    async def _save_durable(self, scope_key: str, fingerprint: str, response: StoredResponse) -> None:
+        repository = self._repository()
+        if repository is None:
+            return
+        try:
+            await repository.save(scope_key, fingerprint, response.to_record())
+        except Exception as e:
+            logger.warning(f"Idempotency key persistence failed: {str(e)}")
+
+    async def _replay(self, send, response: StoredResponse) -> None:
+        headers = [h for h in response.headers if h[0].lower() != b"idempotent-replayed"]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": response.status, "headers": headers})
+        await send({"type": "http.response.body", "body": response.body})
+
+    async def _send_json(self, send, status_code: int, message: str) -> None:
+        body = json.dumps({
+            "error": {
+                "code": status_code,
+                "message": message,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
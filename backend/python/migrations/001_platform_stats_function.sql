@@ -0,0 +1,42 @@
+-- Platform statistics computed in the database for GET /api/admin/stats
+-- Called over PostgREST as POST /rest/v1/rpc/get_platform_stats
+
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at_user_id ON transactions(created_at, user_id);
+
+CREATE OR REPLACE FUNCTION get_platform_stats(since TIMESTAMPTZ DEFAULT NOW() - INTERVAL '24 hours')
+RETURNS TABLE (
+  total_users BIGINT,
+  total_transactions BIGINT,
+  total_volume_brl NUMERIC,
+  total_volume_btc NUMERIC,
+  active_users_24h BIGINT,
+  transactions_24h BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT
+    (SELECT COUNT(*) FROM users),
+    totals.total_transactions,
+    totals.total_volume_brl,
+    totals.total_volume_btc,
+    recent.active_users_24h,
+    recent.transactions_24h
+  FROM (
+    SELECT
+      COUNT(*) AS total_transactions,
+      COALESCE(SUM(amount_brl), 0) AS total_volume_brl,
+      COALESCE(SUM(amount_btc), 0) AS total_volume_btc
+    FROM transactions
+  ) totals,
+  (
+    SELECT
+      COUNT(DISTINCT user_id) AS active_users_24h,
+      COUNT(*) AS transactions_24h
+    FROM transactions
+    WHERE created_at >= since
+  ) recent;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_platform_stats(TIMESTAMPTZ) TO service_role;
@@ -0,0 +1,27 @@
+-- Per-bucket, per-user transaction activity used to rebuild the in-process
+-- rolling statistics windows on startup and on each reconciliation
+-- Called over PostgREST as POST /rest/v1/rpc/get_transaction_activity
+
+CREATE OR REPLACE FUNCTION get_transaction_activity(since TIMESTAMPTZ, bucket_seconds INTEGER DEFAULT 60)
+RETURNS TABLE (
+  bucket TIMESTAMPTZ,
+  user_id UUID,
+  transactions BIGINT,
+  volume_brl NUMERIC,
+  volume_btc NUMERIC
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT
+    to_timestamp(floor(extract(epoch FROM created_at) / bucket_seconds) * bucket_seconds) AS bucket,
+    user_id,
+    COUNT(*),
+    COALESCE(SUM(amount_brl), 0),
+    COALESCE(SUM(amount_btc), 0)
+  FROM transactions
+  WHERE created_at >= since
+  GROUP BY 1, 2;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_transaction_activity(TIMESTAMPTZ, INTEGER) TO service_role;
@@ -0,0 +1,5 @@
+-- Supports keyset pagination of GET /api/transactions, which orders a user's
+-- transactions by (created_at, id) descending
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created_id
+  ON transactions(user_id, created_at DESC, id DESC);
@@ -0,0 +1,8 @@
+-- Client-supplied idempotency keys for POST /api/transactions/batch.
+-- Each item is stored with "<Idempotency-Key header>:<item index>" so a retried
+-- batch inserts only the rows that are not already present.
+
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_user_idempotency_key
+  ON transactions(user_id, idempotency_key);
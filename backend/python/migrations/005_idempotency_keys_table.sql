@@ -0,0 +1,25 @@
+-- Durable store for Idempotency-Key responses (enabled with IDEMPOTENCY_DURABLE=true)
+-- "key" is a SHA-256 of method, path, Authorization header and the client key
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  key TEXT PRIMARY KEY,
+  fingerprint TEXT NOT NULL,
+  response JSONB NOT NULL,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+
+-- Remove expired keys; schedule with pg_cron or call periodically
+CREATE OR REPLACE FUNCTION purge_expired_idempotency_keys()
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH deleted AS (
+    DELETE FROM idempotency_keys WHERE expires_at < NOW() RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM deleted;
+$$;
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON idempotency_keys TO service_role;
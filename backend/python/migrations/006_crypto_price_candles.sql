@@ -0,0 +1,48 @@
+-- OHLC rollups of crypto_prices ticks for GET /api/bitcoin/candles
+-- The API keeps recent candles in memory and reads older ranges from here.
+-- Rows are (re)computed by rollup_crypto_price_candles after each batch of ticks is written.
+
+CREATE TABLE IF NOT EXISTS crypto_price_candles (
+  symbol VARCHAR(10) NOT NULL,
+  bucket_seconds INTEGER NOT NULL,
+  bucket_start TIMESTAMPTZ NOT NULL,
+  open DECIMAL(20, 8) NOT NULL,
+  high DECIMAL(20, 8) NOT NULL,
+  low DECIMAL(20, 8) NOT NULL,
+  close DECIMAL(20, 8) NOT NULL,
+  ticks INTEGER NOT NULL,
+  PRIMARY KEY (symbol, bucket_seconds, bucket_start)
+);
+
+-- Aggregate all ticks from the start of the bucket containing p_since, for 1m, 1h and 1d candles
+CREATE OR REPLACE FUNCTION rollup_crypto_price_candles(p_symbol TEXT, p_since TIMESTAMPTZ)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+  INSERT INTO crypto_price_candles (symbol, bucket_seconds, bucket_start, open, high, low, close, ticks)
+  SELECT
+    p_symbol,
+    b.seconds,
+    to_timestamp(floor(extract(epoch FROM p.created_at) / b.seconds) * b.seconds),
+    (array_agg(p.price_brl ORDER BY p.created_at))[1],
+    MAX(p.price_brl),
+    MIN(p.price_brl),
+    (array_agg(p.price_brl ORDER BY p.created_at DESC))[1],
+    COUNT(*)
+  FROM (VALUES (60), (3600), (86400)) AS b(seconds)
+  JOIN crypto_prices p
+    ON p.symbol = p_symbol
+   AND p.created_at >= to_timestamp(floor(extract(epoch FROM p_since) / b.seconds) * b.seconds)
+  GROUP BY 2, 3
+  ON CONFLICT (symbol, bucket_seconds, bucket_start) DO UPDATE SET
+    open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close,
+    ticks = EXCLUDED.ticks;
+$$;
+
+GRANT SELECT, INSERT, UPDATE ON crypto_price_candles TO service_role;
+GRANT SELECT ON crypto_price_candles TO anon;
+GRANT SELECT ON crypto_price_candles TO authenticated;
+GRANT EXECUTE ON FUNCTION rollup_crypto_price_candles(TEXT, TIMESTAMPTZ) TO service_role;
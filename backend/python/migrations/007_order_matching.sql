@@ -0,0 +1,52 @@
+-- Order book matching for POST /api/transactions.
+-- Pending buy/sell transactions are the book's orders; filled_btc records how
+-- much of each has been matched, and status becomes 'matched' once all of it is.
+-- Each fill creates an escrow_transactions row (see supabase/migrations/20250105_create_escrow_tables.sql)
+-- whose transaction_id is the sell side and buy_transaction_id the buy side.
+-- Its seller_id/buyer_id are ids from users; apply 012_escrow_users_fk.sql too.
+
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS filled_btc DECIMAL(20, 8) NOT NULL DEFAULT 0;
+
+-- The book is rebuilt on startup from pending transactions in creation order
+CREATE INDEX IF NOT EXISTS idx_transactions_pending_created_id
+  ON transactions(created_at, id)
+  WHERE status = 'pending';
+
+ALTER TABLE escrow_transactions
+  ADD COLUMN IF NOT EXISTS buy_transaction_id UUID REFERENCES transactions(id) ON DELETE CASCADE;
+
+CREATE INDEX IF NOT EXISTS idx_escrow_transactions_buy_transaction_id
+  ON escrow_transactions(buy_transaction_id);
+
+-- Write a batch of fills in one round trip and one transaction.
+-- p_orders: [{id, filled_btc, status, updated_at}], the latest state of each matched transaction
+-- p_escrows: escrow_transactions rows with client-generated ids, so a retried batch is not duplicated
+CREATE OR REPLACE FUNCTION apply_order_fills(p_orders JSONB, p_escrows JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+  UPDATE transactions t
+  SET filled_btc = o.filled_btc,
+      status = o.status,
+      updated_at = o.updated_at
+  FROM jsonb_to_recordset(p_orders) AS o(id UUID, filled_btc DECIMAL(20, 8), status TEXT, updated_at TIMESTAMPTZ)
+  WHERE t.id = o.id;
+
+  INSERT INTO escrow_transactions (
+    id, transaction_id, buy_transaction_id, seller_id, buyer_id,
+    crypto_amount, crypto_currency, fiat_amount, fiat_currency,
+    status, expires_at, created_at
+  )
+  SELECT
+    e.id, e.transaction_id, e.buy_transaction_id, e.seller_id, e.buyer_id,
+    e.crypto_amount, e.crypto_currency, e.fiat_amount, e.fiat_currency,
+    e.status, e.expires_at, e.created_at
+  FROM jsonb_to_recordset(p_escrows) AS e(
+    id UUID, transaction_id UUID, buy_transaction_id UUID, seller_id UUID, buyer_id UUID,
+    crypto_amount DECIMAL(20, 8), crypto_currency VARCHAR(10), fiat_amount DECIMAL(20, 2), fiat_currency VARCHAR(10),
+    status VARCHAR(50), expires_at TIMESTAMPTZ, created_at TIMESTAMPTZ
+  )
+  ON CONFLICT (id) DO NOTHING;
+$$;
+
+GRANT EXECUTE ON FUNCTION apply_order_fills(JSONB, JSONB) TO service_role;
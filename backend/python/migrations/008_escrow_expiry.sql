@@ -0,0 +1,62 @@
+-- Escrow expiry for the API's background scheduler.
+-- Open escrows are loaded by expiry time, plus any created since the previous
+-- load, and due ones are cancelled in batches by expire_escrows.
+
+CREATE INDEX IF NOT EXISTS idx_escrow_transactions_open_expires_at
+  ON escrow_transactions(expires_at, id)
+  WHERE status IN ('pending', 'payment_pending');
+
+CREATE INDEX IF NOT EXISTS idx_escrow_transactions_created_at
+  ON escrow_transactions(created_at);
+
+-- Cancel the escrows among p_ids whose expires_at has passed and that are still
+-- awaiting payment, and log each one, in a single transaction.
+-- Returns {"locked": false} without doing anything while another worker runs a batch;
+-- otherwise {"locked": true, "expired": [cancelled rows], "not_due": [{id, expires_at}]}
+-- where not_due lists open escrows whose expiry is still in the future by the database clock.
+CREATE OR REPLACE FUNCTION expire_escrows(p_ids UUID[])
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_expired JSONB;
+  v_not_due JSONB;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('expire_escrows')) THEN
+    RETURN jsonb_build_object('locked', false);
+  END IF;
+
+  WITH due AS (
+    SELECT id, status
+    FROM escrow_transactions
+    WHERE id = ANY(p_ids)
+      AND status IN ('pending', 'payment_pending')
+      AND expires_at <= NOW()
+    FOR UPDATE
+  ), cancelled AS (
+    UPDATE escrow_transactions e
+    SET status = 'cancelled',
+        cancelled_at = NOW()
+    FROM due
+    WHERE e.id = due.id
+    RETURNING e.id, e.transaction_id, e.buy_transaction_id, e.seller_id, e.buyer_id,
+              e.expires_at, e.cancelled_at, due.status AS previous_status
+  ), logged AS (
+    INSERT INTO escrow_logs (escrow_id, event, metadata)
+    SELECT id, 'expired', jsonb_build_object('previous_status', previous_status, 'expires_at', expires_at)
+    FROM cancelled
+  )
+  SELECT COALESCE(jsonb_agg(to_jsonb(cancelled)), '[]'::jsonb) INTO v_expired FROM cancelled;
+
+  SELECT COALESCE(jsonb_agg(jsonb_build_object('id', id, 'expires_at', expires_at)), '[]'::jsonb)
+  INTO v_not_due
+  FROM escrow_transactions
+  WHERE id = ANY(p_ids)
+    AND status IN ('pending', 'payment_pending')
+    AND expires_at > NOW();
+
+  RETURN jsonb_build_object('locked', true, 'expired', v_expired, 'not_due', v_not_due);
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION expire_escrows(UUID[]) TO service_role;
@@ -0,0 +1,42 @@
+-- Order book depth from the stored pending transactions.
+-- Only the worker that runs the matching engine holds the book in memory; the
+-- other API workers answer GET /api/bitcoin/orderbook with this function.
+
+CREATE INDEX IF NOT EXISTS idx_transactions_pending_type_price
+  ON transactions(type, price_per_btc)
+  WHERE status = 'pending';
+
+-- Returns {"bids": [...], "asks": [...]}, best price first, each level being
+-- {price_per_btc, amount_btc, orders} with amount_btc the unfilled remainder.
+CREATE OR REPLACE FUNCTION order_book_depth(p_limit INT)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT jsonb_build_object(
+    'bids', COALESCE((
+      SELECT jsonb_agg(to_jsonb(levels) ORDER BY levels.price_per_btc DESC)
+      FROM (
+        SELECT price_per_btc, SUM(amount_btc - filled_btc) AS amount_btc, COUNT(*) AS orders
+        FROM transactions
+        WHERE status = 'pending' AND type = 'buy' AND amount_btc > filled_btc
+        GROUP BY price_per_btc
+        ORDER BY price_per_btc DESC
+        LIMIT p_limit
+      ) levels
+    ), '[]'::jsonb),
+    'asks', COALESCE((
+      SELECT jsonb_agg(to_jsonb(levels) ORDER BY levels.price_per_btc ASC)
+      FROM (
+        SELECT price_per_btc, SUM(amount_btc - filled_btc) AS amount_btc, COUNT(*) AS orders
+        FROM transactions
+        WHERE status = 'pending' AND type = 'sell' AND amount_btc > filled_btc
+        GROUP BY price_per_btc
+        ORDER BY price_per_btc ASC
+        LIMIT p_limit
+      ) levels
+    ), '[]'::jsonb)
+  );
+$$;
+
+GRANT EXECUTE ON FUNCTION order_book_depth(INT) TO service_role;
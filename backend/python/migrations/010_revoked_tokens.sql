@@ -0,0 +1,26 @@
+-- Revoked JWT ids, so a logout reaches every API worker.
+-- Workers keep the unexpired rows in memory and poll for new ones by revoked_at.
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+  jti TEXT PRIMARY KEY,
+  user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  revoked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at
+  ON revoked_tokens(revoked_at, jti);
+
+-- Rows are useless once the token has expired; run periodically (e.g. with pg_cron)
+CREATE OR REPLACE FUNCTION purge_revoked_tokens()
+RETURNS INT
+LANGUAGE sql
+AS $$
+  WITH purged AS (
+    DELETE FROM revoked_tokens WHERE expires_at <= NOW() RETURNING 1
+  )
+  SELECT COUNT(*)::INT FROM purged;
+$$;
+
+GRANT SELECT, INSERT, UPDATE ON revoked_tokens TO service_role;
+GRANT EXECUTE ON FUNCTION purge_revoked_tokens() TO service_role;
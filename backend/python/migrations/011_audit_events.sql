@@ -0,0 +1,27 @@
+-- Audit trail of security- and money-relevant API actions (registrations,
+-- logins, logouts, transactions, KYC changes), written by each worker in batches.
+-- There are no foreign keys, so events outlive the rows they describe and
+-- bulk inserts skip the key checks. Rows are only ever inserted.
+
+CREATE TABLE IF NOT EXISTS audit_events (
+  id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+  event VARCHAR(100) NOT NULL,
+  actor_id UUID,
+  subject_id UUID,
+  metadata JSONB NOT NULL DEFAULT '{}'::jsonb,
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_audit_events_subject_created_at
+  ON audit_events(subject_id, created_at);
+
+CREATE INDEX IF NOT EXISTS idx_audit_events_actor_created_at
+  ON audit_events(actor_id, created_at);
+
+CREATE INDEX IF NOT EXISTS idx_audit_events_event_created_at
+  ON audit_events(event, created_at);
+
+-- Only the API (service role) reads or writes the trail
+ALTER TABLE audit_events ENABLE ROW LEVEL SECURITY;
+
+GRANT SELECT, INSERT ON audit_events TO service_role;
@@ -0,0 +1,16 @@
+-- escrow_transactions.seller_id/buyer_id were created referencing users_profile
+-- (supabase/migrations/20250105_create_escrow_tables.sql), but the API's users
+-- live in users, and apply_order_fills writes those ids. Point both foreign
+-- keys at users so fills can be stored.
+-- NOT VALID skips checking rows written before this migration against users;
+-- new and updated rows are checked. Run VALIDATE CONSTRAINT once old rows are fixed.
+
+ALTER TABLE escrow_transactions
+  DROP CONSTRAINT IF EXISTS escrow_transactions_seller_id_fkey,
+  DROP CONSTRAINT IF EXISTS escrow_transactions_buyer_id_fkey;
+
+ALTER TABLE escrow_transactions
+  ADD CONSTRAINT escrow_transactions_seller_id_fkey
+    FOREIGN KEY (seller_id) REFERENCES users(id) ON DELETE CASCADE NOT VALID,
+  ADD CONSTRAINT escrow_transactions_buyer_id_fkey
+    FOREIGN KEY (buyer_id) REFERENCES users(id) ON DELETE CASCADE NOT VALID;
@@ -0,0 +1,29 @@
+-- Cache invalidations (users after a KYC change, cached responses after a write),
+-- so every API worker drops the entries another worker made stale.
+-- Workers poll for new rows by created_at; rows are only needed for a few seconds.
+
+CREATE TABLE IF NOT EXISTS cache_invalidations (
+  id BIGSERIAL PRIMARY KEY,
+  kind VARCHAR(20) NOT NULL,
+  scope TEXT NOT NULL,
+  worker VARCHAR(32) NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_cache_invalidations_created_at
+  ON cache_invalidations(created_at, id);
+
+-- Run periodically (e.g. with pg_cron); workers only read the last few seconds
+CREATE OR REPLACE FUNCTION purge_cache_invalidations(older_than INTERVAL DEFAULT INTERVAL '1 hour')
+RETURNS INT
+LANGUAGE sql
+AS $$
+  WITH purged AS (
+    DELETE FROM cache_invalidations WHERE created_at < NOW() - older_than RETURNING 1
+  )
+  SELECT COUNT(*)::INT FROM purged;
+$$;
+
+GRANT SELECT, INSERT ON cache_invalidations TO service_role;
+GRANT USAGE, SELECT ON SEQUENCE cache_invalidations_id_seq TO service_role;
+GRANT EXECUTE ON FUNCTION purge_cache_invalidations(INTERVAL) TO service_role;
@@ -0,0 +1,181 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, EmailStr, Field, validator
+
+
+def cpf_is_valid(cpf: str) -> bool:
+    """Check the two CPF check digits (``cpf`` is 11 digits)."""
+    # Repeated digits pass the checksum but are never issued
+    if cpf == cpf[0] * 11:
+        return False
+    digits = [int(char) for char in cpf]
+    for length in (9, 10):
+        total = sum(digit * weight for digit, weight in zip(digits, range(length + 1, 1, -1)))
+        if total * 10 % 11 % 10 != digits[length]:
+            return False
+    return True
+
+class UserRegister(BaseModel):
+    email: EmailStr
+    password: str = Field(..., min_length=8)
+    full_name: str = Field(..., min_length=2, max_length=100)
+    cpf: str = Field(..., pattern="^[0-9]{11}$")
+    phone: str = Field(..., pattern="^[0-9]{10,11}$")
+    
+    @validator('password')
+    def validate_password(cls, v):
+        if not any(char.isdigit() for char in v):
+            raise ValueError('Password must contain at least one digit')
+        if not any(char.isupper() for char in v):
+            raise ValueError('Password must contain at least one uppercase letter')
+        if not any(char.islower() for char in v):
+            raise ValueError('Password must contain at least one lowercase letter')
+        return v
+    
+    @validator('cpf')
+    def validate_cpf(cls, v):
+        if not cpf_is_valid(v):
+            raise ValueError('Invalid CPF')
+        return v
+    
+    @validator('phone')
+    def validate_phone(cls, v):
+        # Area codes have no zero digit; 11-digit numbers are mobiles, which start with 9
+        if '0' in v[:2]:
+            raise ValueError('Invalid area code')
+        if len(v) == 11 and v[2] != '9':
+            raise ValueError('Mobile numbers must start with 9')
+        return v
+
+class UserLogin(BaseModel):
+    email: EmailStr
+    password: str
+
+class UserResponse(BaseModel):
+    id: str
+    email: str
+    full_name: str
+    cpf: str
+    phone: str
+    kyc_level: int
+    is_admin: bool
+    created_at: datetime
+
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: Optional[int] = None
+    refresh_token: Optional[str] = None
+    user: UserResponse
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class AccessTokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+class StreamTicketResponse(BaseModel):
+    ticket: str
+    expires_in: int
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+class TransactionCreate(BaseModel):
+    type: str = Field(..., pattern="^(buy|sell)$")
+    amount_brl: float = Field(..., gt=0)
+    amount_btc: float = Field(..., gt=0)
+    price_per_btc: float = Field(..., gt=0)
+    payment_method: str = Field(..., pattern="^(pix|bank_transfer)$")
+    description: Optional[str] = None
+    
+    @validator('price_per_btc')
+    def validate_amounts(cls, v, values):
+        # KYC limits apply to amount_brl while orders fill amount_btc at price_per_btc,
+        # so they must agree up to rounding: a centavo, plus a satoshi's worth
+        if 'amount_brl' in values and 'amount_btc' in values:
+            if abs(values['amount_brl'] - values['amount_btc'] * v) > 0.01 + v / 100_000_000:
+                raise ValueError('amount_brl must equal amount_btc * price_per_btc')
+        return v
+
+class TransactionResponse(BaseModel):
+    id: str
+    user_id: str
+    type: str
+    amount_brl: float
+    amount_btc: float
+    price_per_btc: float
+    payment_method: str
+    status: str
+    description: Optional[str]
+    # BTC matched against opposite orders so far; status becomes "matched" once all of amount_btc is
+    filled_btc: float = 0.0
+    created_at: datetime
+    updated_at: datetime
+
+class KYCUpdateRequest(BaseModel):
+    user_id: str
+    kyc_level: int = Field(..., ge=1, le=3)
+
+class BitcoinPriceResponse(BaseModel):
+    price_brl: float
+    price_usd: float
+    last_updated: datetime
+    change_24h: float
+    volume_24h: float
+    sources: List[str] = []
+    # True when no source could be reached and this is the last known good quote
+    stale: bool = False
+
+class PriceCandle(BaseModel):
+    start: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    ticks: int
+
+class PriceCandles(BaseModel):
+    symbol: str
+    interval: str
+    candles: List[PriceCandle]
+
+class OrderBookLevel(BaseModel):
+    price_per_btc: float
+    amount_btc: float
+    orders: int
+
+class OrderBookDepth(BaseModel):
+    pair: str
+    sequence: int
+    bids: List[OrderBookLevel]
+    asks: List[OrderBookLevel]
+
+class PlatformStats(BaseModel):
+    total_users: int
+    total_transactions: int
+    total_volume_brl: float
+    total_volume_btc: float
+    active_users_24h: int
+    transactions_24h: int
+    average_transaction_brl: float
+
+MAX_TRANSACTION_BATCH_SIZE = 500
+
+class TransactionBatchCreate(BaseModel):
+    transactions: List[TransactionCreate] = Field(..., min_length=1, max_length=MAX_TRANSACTION_BATCH_SIZE)
+
+class TransactionBatchItemResult(BaseModel):
+    index: int
+    status: str
+    transaction: Optional[TransactionResponse] = None
+    error: Optional[str] = None
+
+class TransactionBatchResponse(BaseModel):
+    created: int
+    existing: int
+    rejected: int
+    results: List[TransactionBatchItemResult]
@@ -0,0 +1,594 @@
+import asyncio
+import logging
+import time
+import uuid
+from bisect import bisect_left, insort
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from models import OrderBookDepth, OrderBookLevel
+
+logger = logging.getLogger(__name__)
+
+SATOSHIS_PER_BTC = 100_000_000
+CENTS_PER_BRL = 100
+
+
+def to_satoshis(amount_btc: float) -> int:
+    return round(amount_btc * SATOSHIS_PER_BTC)
+
+
+def to_cents(price_brl: float) -> int:
+    return round(price_brl * CENTS_PER_BRL)
+
+
+# Lowest UUID, so a (created_at, id) keyset position covers every row created at that instant
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
+
+@dataclass(eq=False)
+class Order:
+    """A resting or incoming order; prices are in centavos and amounts in satoshis."""
+
+    id: str
+    user_id: str
+    side: str
+    price: int
+    remaining: int
+    row: Dict[str, Any] = field(repr=False)
+    filled: int = 0
+
+    def crosses(self, price: int) -> bool:
+        return price <= self.price if self.side == "buy" else price >= self.price
+
+
+@dataclass
+class Fill:
+    maker: Order
+    taker: Order
+    price: int
+    quantity: int
+
+    @property
+    def buy(self) -> Order:
+        return self.taker if self.taker.side == "buy" else self.maker
+
+    @property
+    def sell(self) -> Order:
+        return self.taker if self.taker.side == "sell" else self.maker
+
+
+class PriceLevel:
+    __slots__ = ("price", "orders", "quantity", "count")
+
+    def __init__(self, price: int):
+        self.price = price
+        self.orders: Deque[Order] = deque()
+        self.quantity = 0
+        self.count = 0
+
+
+class BookSide:
+    """Price levels of one side, each a FIFO queue of orders.
+
+    Level keys are kept sorted with the best price last (bids by price, asks by
+    negated price), so finding and removing the best level is O(1) and adding a
+    new level is a bisection.
+    """
+
+    def __init__(self, side: str):
+        self.side = side
+        self.levels: Dict[int, PriceLevel] = {}
+        self.keys: List[int] = []
+
+    def key(self, price: int) -> int:
+        return price if self.side == "buy" else -price
+
+    def add(self, order: Order) -> None:
+        key = self.key(order.price)
+        level = self.levels.get(key)
+        if level is None:
+            level = self.levels[key] = PriceLevel(order.price)
+            insort(self.keys, key)
+        level.orders.append(order)
+        level.quantity += order.remaining
+        level.count += 1
+
+    def remove_level(self, key: int) -> None:
+        del self.levels[key]
+        del self.keys[bisect_left(self.keys, key)]
+
+    def best_first(self):
+        for key in reversed(self.keys):
+            yield key, self.levels[key]
+
+    def depth(self, limit: int) -> List[Tuple[int, int, int]]:
+        return [(level.price, level.quantity, level.count) for _, (_, level) in zip(range(limit), self.best_first())]
+
+
+class OrderBook:
+    """In-memory limit order book for one pair with price-time priority.
+
+    Incoming orders match against the opposite side from the best price
+    outwards, oldest order first within a level, at the resting order's price.
+    Orders never match against orders of the same user; those are skipped and
+    keep their place in the queue. Cancelled orders are removed from their
+    level's totals at once and dropped from the queue lazily while matching.
+    """
+
+    def __init__(self, pair: str):
+        self.pair = pair
+        self.bids = BookSide("buy")
+        self.asks = BookSide("sell")
+        self.orders: Dict[str, Order] = {}
+        # Bumped on every change, so depth snapshots can be reused until the book moves
+        self.sequence = 0
+
+    def side(self, side: str) -> BookSide:
+        return self.bids if side == "buy" else self.asks
+
+    def submit(self, order: Order) -> List[Fill]:
+        """Match ``order`` and rest whatever is left of it; returns the fills, in execution order."""
+        fills = self._match(order)
+        if order.remaining:
+            self.side(order.side).add(order)
+            self.orders[order.id] = order
+        self.sequence += 1
+        return fills
+
+    def _match(self, taker: Order) -> List[Fill]:
+        opposite = self.asks if taker.side == "buy" else self.bids
+        fills: List[Fill] = []
+        emptied: List[int] = []
+        for key, level in opposite.best_first():
+            if not taker.remaining or not taker.crosses(level.price):
+                break
+            self._match_level(taker, level, fills)
+            if not level.count:
+                emptied.append(key)
+        for key in emptied:
+            opposite.remove_level(key)
+        return fills
+
+    def _match_level(self, taker: Order, level: PriceLevel, fills: List[Fill]) -> None:
+        queue = level.orders
+        kept: List[Order] = []
+        while queue and taker.remaining:
+            maker = queue.popleft()
+            if not maker.remaining:
+                continue
+            if maker.user_id == taker.user_id:
+                kept.append(maker)
+                continue
+            quantity = min(maker.remaining, taker.remaining)
+            maker.remaining -= quantity
+            maker.filled += quantity
+            taker.remaining -= quantity
+            taker.filled += quantity
+            level.quantity -= quantity
+            fills.append(Fill(maker, taker, level.price, quantity))
+            if maker.remaining:
+                kept.append(maker)
+            else:
+                level.count -= 1
+                del self.orders[maker.id]
+        if kept:
+            queue.extendleft(reversed(kept))
+
+    def cancel(self, order_id: str) -> Optional[Order]:
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        side = self.side(order.side)
+        key = side.key(order.price)
+        level = side.levels[key]
+        level.quantity -= order.remaining
+        level.count -= 1
+        order.remaining = 0
+        if not level.count:
+            side.remove_level(key)
+        self.sequence += 1
+        return order
+
+    def depth(self, limit: int) -> Tuple[List[Tuple[int, int, int]], List[Tuple[int, int, int]]]:
+        """Best ``limit`` levels per side as ``(price, quantity, orders)``, best first."""
+        return self.bids.depth(limit), self.asks.depth(limit)
+
+
+class MatchingEngine:
+    """Matches new buy/sell transactions against the order book and persists the results.
+
+    Matching happens in memory as each transaction is created. Fills turn into
+    ``escrow_transactions`` rows and updates of the matched transactions'
+    ``filled_btc`` and ``status``; both are buffered and written together by
+    the ``apply_order_fills`` SQL function every ``flush_interval`` seconds, or
+    as soon as ``batch_size`` fills are pending. On startup the book is rebuilt
+    by replaying the open transactions in creation order, which also redoes any
+    matches whose fills were not written before the last shutdown.
+
+    Only one process may run the engine. When other processes create
+    transactions too, set ``sync_interval`` and the engine picks up pending
+    transactions it has not seen from the database that often. Each sync
+    re-reads the last ``sync_overlap`` seconds of creation times, so rows that
+    were committed late are not missed.
+
+    A failed write is retried with the next flush. After ``max_attempts``
+    failures in a row, the next flush writes the batch in halves, down to
+    single fills, so one row the database rejects cannot hold back the rest;
+    fills that still fail alone are dropped and logged, and counted in
+    ``stats``.
+
+    At most ``max_pending`` escrows wait in memory. Once that many are
+    unwritten, new transactions are not matched at all: they stay pending in
+    the database, untouched by the book, and are counted as deferred. After
+    the backlog has been written, the open transactions the book does not
+    hold are loaded again and matched, so stored orders and escrows always
+    agree with the fills in memory.
+    """
+
+    def __init__(
+        self,
+        pair: str = "BTC-BRL",
+        escrow_ttl: float = 1800.0,
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        load_page_size: int = 1000,
+        sync_interval: float = 0.0,
+        sync_overlap: float = 30.0,
+        max_pending: int = 10000,
+        max_attempts: int = 3,
+    ):
+        self.book = OrderBook(pair)
+        self.repository = None
+        self.escrow_ttl = escrow_ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.load_page_size = load_page_size
+        self.sync_interval = sync_interval
+        self.sync_overlap = sync_overlap
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        # Creation time of each order submitted within the sync overlap, so a sync skips them
+        self.seen: Dict[str, float] = {}
+        self.synced_until: Optional[float] = None
+        self.synced = 0
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.flush_listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        # Latest state per transaction id, and escrows to create, since the last write
+        self.pending_orders: Dict[str, Dict[str, Any]] = {}
+        self.pending_escrows: List[Dict[str, Any]] = []
+        self.fills = 0
+        self.written = 0
+        self.dropped = 0
+        self.deferred = 0
+        self.flush_failures = 0
+        # Set when transactions were deferred, until they have been loaded again
+        self.catch_up_needed = False
+        # Failed writes since the last one that succeeded
+        self.failed_attempts = 0
+        self._depth: Dict[int, OrderBookDepth] = {}
+        self._depth_sequence = -1
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """Call ``callback`` with each resting transaction row whose fill status changed."""
+        self.listeners.append(callback)
+
+    def add_flush_listener(self, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """Call ``callback`` with the transaction updates (id, user_id, filled_btc, status) each write stored."""
+        self.flush_listeners.append(callback)
+
+    async def start(self, repository) -> None:
+        """Rebuild the book from ``repository`` (an OrderRepository) and schedule fill writes."""
+        self.repository = repository
+        self.synced_until = time.time()
+        after = None
+        loaded = 0
+        while True:
+            rows = await repository.open_orders(self.load_page_size, after=after)
+            for row in rows:
+                self.submit(row, notify=False)
+            loaded += len(rows)
+            if len(rows) < self.load_page_size:
+                break
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+        logger.info(f"Order book rebuilt from {loaded} open transactions, {self.fills} fills replayed")
+        self._task = asyncio.create_task(self._flush_loop())
+        if self.sync_interval > 0:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self) -> None:
+        for task in (self._sync_task, self._task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._sync_task = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Loading transactions from other workers failed: {str(e)}")
+
+    async def sync(self) -> int:
+        """Submit pending transactions stored by other processes since the last sync; returns how many."""
+        started = time.time()
+        after = (_isoformat(self.synced_until - self.sync_overlap), NIL_UUID)
+        picked = 0
+        while True:
+            rows = await self.repository.open_orders(self.load_page_size, after=after)
+            for row in rows:
+                order_id = row["id"]
+                if order_id in self.seen or order_id in self.book.orders or order_id in self.pending_orders:
+                    continue
+                if self.submit(row):
+                    # Its creator's worker could not tell the owner it matched
+                    self._notify(row)
+                picked += 1
+            if len(rows) < self.load_page_size:
+                break
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+        self.synced_until = started
+        # Orders created before the next sync's window will not be read again
+        horizon = started - self.sync_overlap
+        self.seen = {order_id: created for order_id, created in self.seen.items() if created >= horizon}
+        self.synced += picked
+        return picked
+
+    @property
+    def backlogged(self) -> bool:
+        return len(self.pending_escrows) >= self.max_pending
+
+    def submit(self, row: Dict[str, Any], notify: bool = True) -> List[Fill]:
+        """Match a pending transaction row, updating it and any matched rows in place."""
+        if self.backlogged:
+            # Matching now would add fills that cannot be written; match it once the backlog clears
+            self.deferred += 1
+            self.catch_up_needed = True
+            return []
+        filled = to_satoshis(row.get("filled_btc") or 0)
+        order = Order(
+            id=row["id"],
+            user_id=row["user_id"],
+            side=row["type"],
+            price=to_cents(row["price_per_btc"]),
+            remaining=to_satoshis(row["amount_btc"]) - filled,
+            row=row,
+            filled=filled,
+        )
+        if order.remaining <= 0:
+            return []
+        if self.sync_interval > 0:
+            self.seen[order.id] = datetime.fromisoformat(row["created_at"]).timestamp()
+        fills = self.book.submit(order)
+        if not fills:
+            return fills
+
+        now = datetime.now(timezone.utc)
+        expires_at = (now + timedelta(seconds=self.escrow_ttl)).isoformat()
+        makers: Dict[str, Order] = {}
+        for fill in fills:
+            makers[fill.maker.id] = fill.maker
+            self.pending_escrows.append(self._escrow_row(fill, now.isoformat(), expires_at))
+        self.fills += len(fills)
+        for matched in (order, *makers.values()):
+            self._update_row(matched, now.isoformat())
+        if notify:
+            for maker in makers.values():
+                self._notify(maker.row)
+        if len(self.pending_escrows) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+        return fills
+
+    def _notify(self, row: Dict[str, Any]) -> None:
+        for callback in self.listeners:
+            try:
+                callback(row)
+            except Exception as e:
+                logger.warning(f"Order fill listener failed: {str(e)}")
+
+    def _update_row(self, order: Order, now: str) -> None:
+        row = order.row
+        row["filled_btc"] = order.filled / SATOSHIS_PER_BTC
+        row["status"] = "pending" if order.remaining else "matched"
+        row["updated_at"] = now
+        self.pending_orders[order.id] = {
+            "id": order.id,
+            "user_id": order.user_id,
+            "filled_btc": row["filled_btc"],
+            "status": row["status"],
+            "updated_at": now,
+        }
+
+    def _escrow_row(self, fill: Fill, now: str, expires_at: str) -> Dict[str, Any]:
+        buy, sell = fill.buy, fill.sell
+        return {
+            "id": str(uuid.uuid4()),
+            "transaction_id": sell.id,
+            "buy_transaction_id": buy.id,
+            "seller_id": sell.user_id,
+            "buyer_id": buy.user_id,
+            "crypto_amount": fill.quantity / SATOSHIS_PER_BTC,
+            "crypto_currency": "BTC",
+            "fiat_amount": round(fill.quantity * fill.price / SATOSHIS_PER_BTC) / CENTS_PER_BRL,
+            "fiat_currency": "BRL",
+            "status": "pending",
+            "expires_at": expires_at,
+            "created_at": now,
+        }
+
+    def cancel(self, transaction_id: str) -> bool:
+        return self.book.cancel(transaction_id) is not None
+
+    async def catch_up(self) -> int:
+        """Match the open transactions deferred while the backlog was full; returns how many."""
+        self.catch_up_needed = False
+        picked = 0
+        after = None
+        while True:
+            rows = await self.repository.open_orders(self.load_page_size, after=after)
+            for row in rows:
+                if self.backlogged:
+                    # Full again; the rest waits for the next clear
+                    self.catch_up_needed = True
+                    break
+                if row["id"] in self.book.orders or row["id"] in self.pending_orders:
+                    continue
+                if self.submit(row):
+                    self._notify(row)
+                picked += 1
+            if len(rows) < self.load_page_size or self.catch_up_needed:
+                break
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+        logger.info(f"Matched {picked} transactions deferred by the order fill backlog")
+        return picked
+
+    async def flush(self) -> int:
+        """Write pending fills in one call; returns the number of escrows written."""
+        written = await self._write_pending()
+        if self.catch_up_needed and not self.backlogged and self.running:
+            try:
+                await self.catch_up()
+            except Exception as e:
+                self.catch_up_needed = True
+                logger.warning(f"Loading deferred transactions failed: {str(e)}")
+        return written
+
+    async def _write_pending(self) -> int:
+        async with self._lock:
+            if not self.pending_escrows and not self.pending_orders:
+                return 0
+            if self.repository is None:
+                return 0
+            orders, self.pending_orders = self.pending_orders, {}
+            escrows, self.pending_escrows = self.pending_escrows, []
+            if self.failed_attempts >= self.max_attempts:
+                # Keep failing as a whole: find the rows the database rejects
+                written = await self._write_isolating(_fill_units(orders, escrows))
+                self.failed_attempts = 0
+                return written
+            try:
+                await self.repository.apply_fills(list(orders.values()), escrows)
+            except Exception as e:
+                self.flush_failures += 1
+                self.failed_attempts += 1
+                logger.warning(f"Writing {len(escrows)} order fills failed: {str(e)}")
+                # Updates made since the attempt started are newer and win
+                for order_id, update in orders.items():
+                    self.pending_orders.setdefault(order_id, update)
+                self.pending_escrows = escrows + self.pending_escrows
+                return 0
+            self.failed_attempts = 0
+            self._written(orders, escrows)
+            return len(escrows)
+
+    async def _write_isolating(self, units: List[Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]]) -> int:
+        """Write ``units`` (escrows with the order updates they depend on), halving failed batches."""
+        escrows = [escrow for unit_escrows, _ in units for escrow in unit_escrows]
+        orders = {order_id: update for _, unit_orders in units for order_id, update in unit_orders.items()}
+        try:
+            await self.repository.apply_fills(list(orders.values()), escrows)
+        except Exception as e:
+            self.flush_failures += 1
+            if len(units) > 1:
+                middle = len(units) // 2
+                return await self._write_isolating(units[:middle]) + await self._write_isolating(units[middle:])
+            self.dropped += len(escrows)
+            logger.error(
+                f"Dropped order fill after {self.max_attempts} failed writes: "
+                f"escrows {[e['id'] for e in escrows]}, transactions {list(orders)}: {str(e)}"
+            )
+            return 0
+        self._written(orders, escrows)
+        return len(escrows)
+
+    def _written(self, orders: Dict[str, Dict[str, Any]], escrows: List[Dict[str, Any]]) -> None:
+        self.written += len(escrows)
+        for callback in self.flush_listeners:
+            try:
+                callback(list(orders.values()))
+            except Exception as e:
+                logger.warning(f"Order flush listener failed: {str(e)}")
+
+    def depth(self, limit: int) -> OrderBookDepth:
+        """Aggregated price levels straight from the book, reused until it changes."""
+        if self._depth_sequence != self.book.sequence:
+            self._depth = {}
+            self._depth_sequence = self.book.sequence
+        snapshot = self._depth.get(limit)
+        if snapshot is None:
+            bids, asks = self.book.depth(limit)
+            snapshot = self._depth[limit] = OrderBookDepth(
+                pair=self.book.pair,
+                sequence=self.book.sequence,
+                bids=[_depth_level(level) for level in bids],
+                asks=[_depth_level(level) for level in asks],
+            )
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bids": len(self.book.bids.levels),
+            "asks": len(self.book.asks.levels),
+            "orders": len(self.book.orders),
+            "fills": self.fills,
+            "written": self.written,
+            "pending": len(self.pending_escrows),
+            "dropped": self.dropped,
+            "deferred": self.deferred,
+            "flush_failures": self.flush_failures,
+            "synced": self.synced,
+        }
+
+
+def _fill_units(
+    orders: Dict[str, Dict[str, Any]], escrows: List[Dict[str, Any]]
+) -> List[Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]]:
+    """Split a batch into the smallest parts that can be written on their own.
+
+    Each escrow goes with the updates of its two transactions; updates no
+    escrow refers to form parts of their own.
+    """
+    units = []
+    referenced = set()
+    for escrow in escrows:
+        sides = (escrow["transaction_id"], escrow["buy_transaction_id"])
+        referenced.update(sides)
+        units.append(([escrow], {order_id: orders[order_id] for order_id in sides if order_id in orders}))
+    units.extend(([], {order_id: update}) for order_id, update in orders.items() if order_id not in referenced)
+    return units
+
+
+def _isoformat(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def _depth_level(level: Tuple[int, int, int]) -> OrderBookLevel:
+    price, quantity, orders = level
+    return OrderBookLevel(
+        price_per_btc=price / CENTS_PER_BRL,
+        amount_btc=quantity / SATOSHIS_PER_BTC,
+        orders=orders,
+    )
@@ -0,0 +1,34 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: str, row_id: str) -> str:
+    """Opaque keyset cursor pointing just past the row (created_at, id)."""
+    raw = json.dumps([created_at, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid pagination cursor")
+    if not isinstance(created_at, str) or not isinstance(row_id, str):
+        raise InvalidCursor("Invalid pagination cursor")
+    # Both end up in a PostgREST filter; only ever accept what encode_cursor was given
+    try:
+        datetime.fromisoformat(created_at)
+        uuid.UUID(row_id)
+    except ValueError:
+        raise InvalidCursor("Invalid pagination cursor")
+    return created_at, row_id
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple, TypeVar
+
+from passlib.context import CryptContext
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing queue is full and the caller should retry later."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing pool is saturated")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated, size-limited thread pool.
+
+    bcrypt releases the GIL, so a small thread pool keeps hashing off the event
+    loop without the cost of a process pool. At most ``max_pending`` operations
+    may be running or queued at once; beyond that callers get
+    :class:`PasswordPoolBusy` instead of waiting behind the backlog.
+
+    The passlib context is built on first use, and :meth:`warm_up` loads the
+    bcrypt backend (which runs passlib's self-test) before the first request
+    needs it.
+    """
+
+    def __init__(
+        self,
+        rounds: int = 12,
+        max_workers: int = 4,
+        max_pending: int = 64,
+        retry_after: int = 1,
+    ):
+        self.rounds = rounds
+        self._context: Optional[CryptContext] = None
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def context(self) -> CryptContext:
+        if self._context is None:
+            self._context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=self.rounds)
+        return self._context
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="bcrypt",
+            )
+
+    async def warm_up(self) -> None:
+        self.start()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.context.handler().get_backend)
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            # Called from the event loop: don't wait for running hashes, drop queued ones
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordPoolBusy(self.retry_after)
+        self.start()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    @timed("bcrypt")
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    @timed("bcrypt")
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    @timed("bcrypt")
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password and return a new hash when ``needs_update`` flags the stored one."""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from cache import LRUCache
+from models import BitcoinPriceResponse, PriceCandle
+
+logger = logging.getLogger(__name__)
+
+CANDLE_INTERVALS = {"1m": 60, "1h": 3600, "1d": 86400}
+# Candles kept in memory per interval: 24 hours of 1m, 30 days of 1h, a year of 1d
+MEMORY_CANDLES = {"1m": 1440, "1h": 720, "1d": 365}
+
+
+class CandleSeries:
+    """The most recent OHLC candles of one interval, updated in place as ticks arrive.
+
+    Each bar is ``[open, high, low, close, ticks]``; bucket starts are kept in a
+    parallel deque so a time range is found by bisection.
+    """
+
+    def __init__(self, bucket_seconds: int, max_candles: int):
+        self.bucket_seconds = bucket_seconds
+        self.max_candles = max_candles
+        self.starts: Deque[int] = deque(maxlen=max_candles)
+        self.bars: Deque[List[float]] = deque(maxlen=max_candles)
+        # Buckets from here on are complete in memory; older ones come from the rollup table
+        self.complete_from: Optional[int] = None
+
+    def bucket_start(self, ts: float) -> int:
+        return int(ts // self.bucket_seconds) * self.bucket_seconds
+
+    def add(self, ts: float, price: float) -> None:
+        start = self.bucket_start(ts)
+        if not self.starts or self.starts[-1] < start:
+            if self.complete_from is None:
+                # History was not loaded, so ticks from before startup are missing from this bucket
+                self.complete_from = start + self.bucket_seconds
+            self.starts.append(start)
+            self.bars.append([price, price, price, price, 1])
+            return
+        index = bisect_left(self.starts, start)
+        if index == len(self.starts) or self.starts[index] != start:
+            return
+        bar = self.bars[index]
+        bar[1] = max(bar[1], price)
+        bar[2] = min(bar[2], price)
+        if index == len(self.starts) - 1:
+            bar[3] = price
+        bar[4] += 1
+
+    def load(self, stored: List[Tuple[int, List[float]]], complete: bool) -> None:
+        """Prepend stored candles (oldest first) older than anything already in memory.
+
+        ``complete`` means ``stored`` is the entire history, not just its most recent part.
+        """
+        oldest = self.starts[0] if self.starts else None
+        older = [(start, bar) for start, bar in stored if oldest is None or start < oldest]
+        merged = older + list(zip(self.starts, self.bars))
+        merged = merged[-self.max_candles:]
+        self.starts = deque((start for start, _ in merged), maxlen=self.max_candles)
+        self.bars = deque((bar for _, bar in merged), maxlen=self.max_candles)
+        if complete and len(merged) < self.max_candles:
+            self.complete_from = 0
+        elif merged:
+            self.complete_from = merged[0][0]
+
+    def coverage_start(self) -> Optional[int]:
+        if self.complete_from is None:
+            return None
+        if len(self.starts) == self.max_candles:
+            return max(self.complete_from, self.starts[0])
+        return self.complete_from
+
+    def range(self, start: int, end: float) -> List[Tuple[int, List[float]]]:
+        first = bisect_left(self.starts, start)
+        last = bisect_left(self.starts, end)
+        return [(self.starts[i], self.bars[i]) for i in range(first, last)]
+
+
+def _candle(start: int, bar: List[float]) -> PriceCandle:
+    return PriceCandle(
+        start=datetime.fromtimestamp(start, tz=timezone.utc),
+        open=bar[0],
+        high=bar[1],
+        low=bar[2],
+        close=bar[3],
+        ticks=int(bar[4]),
+    )
+
+
+def _stored_bar(row: Dict[str, Any]) -> Tuple[int, List[float]]:
+    start = int(datetime.fromisoformat(row["bucket_start"]).timestamp())
+    return start, [float(row["open"]), float(row["high"]), float(row["low"]), float(row["close"]), int(row["ticks"])]
+
+
+class PriceHistory:
+    """Persists fetched quotes to ``crypto_prices`` and serves OHLC candles.
+
+    Ticks are buffered and written in bulk every ``flush_interval`` seconds, or
+    as soon as ``batch_size`` are pending, and the database then rolls them up
+    into candles. Recent candles are kept up to date in memory as each tick
+    arrives, so chart requests over recent windows never reach the database;
+    older ranges are read from the rollup table and cached briefly.
+    """
+
+    def __init__(
+        self,
+        symbol: str = "BTC",
+        flush_interval: float = 60.0,
+        batch_size: int = 500,
+        max_pending: int = 10000,
+        persist: bool = True,
+        stored_cache_ttl: float = 60.0,
+    ):
+        self.repository = None
+        self.symbol = symbol
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.persist = persist
+        self.series = {
+            name: CandleSeries(seconds, MEMORY_CANDLES[name])
+            for name, seconds in CANDLE_INTERVALS.items()
+        }
+        self.stored_cache: LRUCache[List[PriceCandle]] = LRUCache(max_size=256, ttl=stored_cache_ttl)
+        self.pending: List[Dict[str, Any]] = []
+        self.written = 0
+        self.dropped = 0
+        self.flush_failures = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def start(self, repository) -> None:
+        """Load recent candles from ``repository`` (a PriceRepository) and schedule tick flushes."""
+        self.repository = repository
+        await asyncio.gather(*(self._load(name, series) for name, series in self.series.items()))
+        if self.persist:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _load(self, name: str, series: CandleSeries) -> None:
+        try:
+            rows = await self.repository.recent_candles(self.symbol, series.bucket_seconds, series.max_candles)
+            series.load([_stored_bar(row) for row in reversed(rows)], complete=len(rows) < series.max_candles)
+        except Exception as e:
+            logger.warning(f"Loading {name} price candles failed: {str(e)}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def record(self, price: BitcoinPriceResponse) -> None:
+        ts = price.last_updated.timestamp()
+        for series in self.series.values():
+            series.add(ts, price.price_brl)
+        if not self.persist:
+            return
+
+        self.pending.append({
+            "symbol": self.symbol,
+            "price_brl": price.price_brl,
+            "price_usd": price.price_usd,
+            "percent_change_24h": price.change_24h,
+            "volume_24h": price.volume_24h,
+            "source": ",".join(price.sources)[:50] or "unknown",
+            "created_at": price.last_updated.isoformat(),
+        })
+        self._trim_pending()
+        if len(self.pending) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    def _trim_pending(self) -> None:
+        overflow = len(self.pending) - self.max_pending
+        if overflow > 0:
+            # The database has been unreachable for a while; keep the newest ticks
+            del self.pending[:overflow]
+            self.dropped += overflow
+
+    async def flush(self) -> int:
+        """Write pending ticks in one insert and roll them up; returns the number written."""
+        async with self._lock:
+            if not self.pending or self.repository is None:
+                return 0
+            rows, self.pending = self.pending, []
+            try:
+                await self.repository.insert_ticks(rows)
+            except Exception as e:
+                self.flush_failures += 1
+                logger.warning(f"Writing {len(rows)} price ticks failed: {str(e)}")
+                self.pending = rows + self.pending
+                self._trim_pending()
+                return 0
+            self.written += len(rows)
+            try:
+                await self.repository.rollup(self.symbol, rows[0]["created_at"])
+            except Exception as e:
+                logger.warning(f"Price candle rollup failed: {str(e)}")
+            return len(rows)
+
+    async def candles(self, interval: str, start: float, end: float) -> List[PriceCandle]:
+        """Candles of ``interval`` whose bucket starts in [start, end), oldest first."""
+        series = self.series[interval]
+        first = series.bucket_start(start)
+        boundary = series.coverage_start()
+
+        candles: List[PriceCandle] = []
+        if boundary is None or first < boundary:
+            stored_end = end if boundary is None else min(end, boundary)
+            candles.extend(await self._stored(interval, series, first, stored_end))
+        if boundary is not None:
+            candles.extend(_candle(s, bar) for s, bar in series.range(max(first, boundary), end))
+        return candles
+
+    async def _stored(self, interval: str, series: CandleSeries, start: int, end: float) -> List[PriceCandle]:
+        key = (interval, start, end)
+        candles = self.stored_cache.get(key)
+        if candles is None:
+            rows = await self.repository.candles(
+                self.symbol,
+                series.bucket_seconds,
+                datetime.fromtimestamp(start, tz=timezone.utc).isoformat(),
+                datetime.fromtimestamp(end, tz=timezone.utc).isoformat(),
+            )
+            candles = [_candle(*_stored_bar(row)) for row in rows]
+            self.stored_cache.set(key, candles)
+        return candles
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "written": self.written,
+            "dropped": self.dropped,
+            "flush_failures": self.flush_failures,
+        }
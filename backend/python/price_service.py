@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+import httpx
+
+from cache import SWRCache
+from metrics import timed
+from models import BitcoinPriceResponse
+from price_sources import PriceAggregator
+
+logger = logging.getLogger(__name__)
+
+PRICE_CACHE_KEY = "bitcoin"
+
+
+class PriceService:
+    """Keeps the latest Bitcoin quote in memory and refreshes it in the background.
+
+    Quotes come from a ``PriceAggregator`` over several exchanges. A single
+    pooled ``httpx.AsyncClient`` is shared by every refresh, so the request
+    path never opens a connection to a price source on its own. Listeners
+    added with ``add_listener`` are called with each freshly fetched quote.
+    """
+
+    def __init__(
+        self,
+        aggregator: PriceAggregator,
+        refresh_interval: float = 30.0,
+        ttl: float = 60.0,
+        stale_ttl: float = 300.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.aggregator = aggregator
+        self.refresh_interval = refresh_interval
+        self.transport = transport
+        self.cache: SWRCache[BitcoinPriceResponse] = SWRCache(ttl=ttl, stale_ttl=stale_ttl)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[BitcoinPriceResponse], None]] = []
+
+    def add_listener(self, listener: Callable[[BitcoinPriceResponse], None]) -> None:
+        self._listeners.append(listener)
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(
+            timeout=self.aggregator.timeout,
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=len(self.aggregator.sources)),
+            transport=self.transport,
+        )
+        try:
+            await self.cache.load(PRICE_CACHE_KEY, self.fetch)
+        except Exception as e:
+            logger.warning(f"Initial Bitcoin price fetch failed: {str(e)}")
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.cache.load(PRICE_CACHE_KEY, self.fetch)
+            except Exception as e:
+                logger.warning(f"Bitcoin price refresh failed: {str(e)}")
+
+    @timed("price", "aggregate")
+    async def fetch(self) -> BitcoinPriceResponse:
+        if self._client is None:
+            raise RuntimeError("PriceService has not been started")
+
+        price = await self.aggregator.fetch(self._client)
+        for listener in self._listeners:
+            try:
+                listener(price)
+            except Exception as e:
+                logger.warning(f"Bitcoin price listener failed: {str(e)}")
+        return price
+
+    async def get_price(self) -> Tuple[BitcoinPriceResponse, float]:
+        """Return the cached quote and its age in seconds.
+
+        A quote older than the cache TTL means refreshes are failing, so it is
+        returned with ``stale`` set. This only raises when no quote has ever
+        been fetched.
+        """
+        entry = await self.cache.get(PRICE_CACHE_KEY, self.fetch)
+        age = entry.age
+        if age >= self.cache.ttl:
+            return entry.value.model_copy(update={"stale": True}), age
+        return entry.value, age
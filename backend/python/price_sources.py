@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import statistics
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from metrics import span
+from models import BitcoinPriceResponse
+
+logger = logging.getLogger(__name__)
+
+
+class PriceUnavailable(Exception):
+    pass
+
+
+@dataclass
+class PriceQuote:
+    source: str
+    price_brl: float
+    price_usd: Optional[float] = None
+    change_24h: Optional[float] = None
+    volume_24h: Optional[float] = None  # in BRL
+    # The volume is summed over many exchanges (an aggregator), so it is not a vwap weight
+    aggregate_volume: bool = False
+
+
+class PriceSource:
+    """Adapter for one upstream ticker; subclasses set ``name``/``url`` and implement ``parse``."""
+
+    name = ""
+    url = ""
+    params: Dict[str, str] = {}
+
+    async def fetch(self, client: httpx.AsyncClient) -> PriceQuote:
+        response = await client.get(self.url, params=self.params)
+        response.raise_for_status()
+        return self.parse(response.json())
+
+    def parse(self, payload: Any) -> PriceQuote:
+        raise NotImplementedError
+
+
+class CoinGeckoSource(PriceSource):
+    name = "coingecko"
+    url = "https://api.coingecko.com/api/v3/simple/price"
+    params = {
+        "ids": "bitcoin",
+        "vs_currencies": "brl,usd",
+        "include_24hr_change": "true",
+        "include_24hr_vol": "true",
+    }
+
+    def parse(self, payload: Any) -> PriceQuote:
+        bitcoin = payload.get("bitcoin", {})
+        if "brl" not in bitcoin:
+            raise ValueError("CoinGecko response is missing the BRL price")
+        return PriceQuote(
+            source=self.name,
+            price_brl=float(bitcoin["brl"]),
+            price_usd=bitcoin.get("usd"),
+            change_24h=bitcoin.get("brl_24h_change"),
+            volume_24h=bitcoin.get("brl_24h_vol"),
+            aggregate_volume=True,
+        )
+
+
+class BinanceSource(PriceSource):
+    name = "binance"
+    url = "https://api.binance.com/api/v3/ticker/24hr"
+    params = {"symbols": '["BTCBRL","BTCUSDT"]'}
+
+    def parse(self, payload: Any) -> PriceQuote:
+        tickers = {ticker["symbol"]: ticker for ticker in payload}
+        brl = tickers.get("BTCBRL")
+        if brl is None:
+            raise ValueError("Binance response is missing BTCBRL")
+        usd = tickers.get("BTCUSDT")
+        return PriceQuote(
+            source=self.name,
+            price_brl=float(brl["lastPrice"]),
+            price_usd=float(usd["lastPrice"]) if usd else None,
+            change_24h=float(brl["priceChangePercent"]),
+            volume_24h=float(brl["quoteVolume"]),
+        )
+
+
+class MercadoBitcoinSource(PriceSource):
+    name = "mercadobitcoin"
+    url = "https://www.mercadobitcoin.net/api/BTC/ticker/"
+
+    def parse(self, payload: Any) -> PriceQuote:
+        ticker = payload["ticker"]
+        last = float(ticker["last"])
+        return PriceQuote(
+            source=self.name,
+            price_brl=last,
+            volume_24h=float(ticker["vol"]) * last,
+        )
+
+
+PRICE_SOURCES = {
+    source.name: source
+    for source in (CoinGeckoSource, BinanceSource, MercadoBitcoinSource)
+}
+
+
+class CircuitBreaker:
+    """Stops calling a source after ``failure_threshold`` consecutive failures.
+
+    After ``reset_timeout`` seconds a single trial request is let through;
+    success closes the breaker again and failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    @property
+    def available(self) -> bool:
+        """Whether ``allow`` would let a request through, without taking the trial slot."""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial)
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """Give back a trial slot that was never used, e.g. because the request was cancelled."""
+        self._trial = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+
+class PriceAggregator:
+    """Fetches a quote from several sources and combines the answers.
+
+    ``quorum`` sources are queried at once; if one has not answered within
+    ``hedge_delay`` seconds, or fails, the next source is started as a hedge.
+    As soon as ``quorum`` quotes are in, the rest are cancelled and the quotes
+    are combined by median (or volume-weighted average). Every source call is
+    bounded by ``timeout`` and guarded by its own circuit breaker.
+
+    The volume-weighted average only weighs single exchanges: an aggregator's
+    volume already includes theirs and would outweigh them. When no exchange
+    volume is at hand, the median is used.
+    """
+
+    def __init__(
+        self,
+        sources: List[PriceSource],
+        timeout: float = 2.0,
+        hedge_delay: float = 0.3,
+        quorum: int = 2,
+        method: str = "median",
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+    ):
+        if method not in ("median", "vwap"):
+            raise ValueError(f"Unknown price aggregation method: {method}")
+        self.sources = sources
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.quorum = quorum
+        self.method = method
+        self.breakers = {
+            source.name: CircuitBreaker(failure_threshold, reset_timeout)
+            for source in sources
+        }
+
+    async def _fetch_one(self, client: httpx.AsyncClient, source: PriceSource) -> Optional[PriceQuote]:
+        breaker = self.breakers[source.name]
+        # Taken once the task runs, so a hedge cancelled before its first step holds no trial slot
+        if not breaker.allow():
+            return None
+        try:
+            with span("price_source", source.name):
+                quote = await asyncio.wait_for(source.fetch(client), self.timeout)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            breaker.record_failure()
+            logger.warning(f"Price source {source.name} failed ({breaker.state}): {e!r}")
+            return None
+        breaker.record_success()
+        return quote
+
+    async def fetch(self, client: httpx.AsyncClient) -> BitcoinPriceResponse:
+        waiting = [source for source in self.sources if self.breakers[source.name].available]
+        if not waiting:
+            raise PriceUnavailable("Every price source is unavailable")
+
+        quorum = min(self.quorum, len(waiting))
+        quotes: List[PriceQuote] = []
+        running: Dict[asyncio.Task, PriceSource] = {}
+
+        def launch() -> None:
+            source = waiting.pop(0)
+            running[asyncio.create_task(self._fetch_one(client, source))] = source
+
+        for _ in range(quorum):
+            launch()
+        try:
+            while running and len(quotes) < quorum:
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=self.hedge_delay if waiting else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # Slow answers: hedge with the next source instead of waiting out the timeout
+                    launch()
+                    continue
+                for task in done:
+                    del running[task]
+                    quote = task.result()
+                    if quote is not None:
+                        quotes.append(quote)
+                    elif waiting:
+                        launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        if not quotes:
+            raise PriceUnavailable("No price source answered")
+        return self.combine(quotes)
+
+    def combine(self, quotes: List[PriceQuote]) -> BitcoinPriceResponse:
+        weighted = [q for q in quotes if q.volume_24h and not q.aggregate_volume]
+        if self.method == "vwap" and weighted:
+            price_brl = sum(q.price_brl * q.volume_24h for q in weighted) / sum(q.volume_24h for q in weighted)
+        else:
+            price_brl = statistics.median(q.price_brl for q in quotes)
+
+        def median_of(values: List[Optional[float]]) -> float:
+            present = [float(v) for v in values if v is not None]
+            return statistics.median(present) if present else 0.0
+
+        return BitcoinPriceResponse(
+            price_brl=price_brl,
+            price_usd=median_of([q.price_usd for q in quotes]),
+            last_updated=datetime.now(timezone.utc),
+            change_24h=median_of([q.change_24h for q in quotes]),
+            volume_24h=median_of([q.volume_24h for q in quotes]),
+            sources=sorted(q.source for q in quotes),
+        )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"state": breaker.state, "failures": breaker.failures}
+            for name, breaker in self.breakers.items()
+        }
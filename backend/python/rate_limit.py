@@ -0,0 +1,199 @@
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Allowed/rejected request counts per policy name, for this worker
+rate_limit_counters: Dict[str, Dict[str, int]] = {}
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    name: str
+    capacity: float
+    refill_per_second: float
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> "RatePolicy":
+        """Build a policy from ``"<requests>/<seconds>"``, e.g. ``"10/60"``."""
+        requests, _, seconds = spec.partition("/")
+        capacity = float(requests)
+        return cls(name=name, capacity=capacity, refill_per_second=capacity / float(seconds or 1))
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    policy: RatePolicy
+    path_prefix: str
+    methods: Optional[frozenset] = None
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        return path.startswith(self.path_prefix)
+
+
+class InMemoryBucketBackend:
+    """Token buckets for a single worker, bounded by LRU eviction of idle keys."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, policy: RatePolicy, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = policy.capacity
+        else:
+            tokens, updated_at = bucket
+            tokens = min(policy.capacity, tokens + (now - updated_at) * policy.refill_per_second)
+
+        if tokens >= cost:
+            allowed, retry_after = True, 0.0
+            tokens -= cost
+        else:
+            allowed, retry_after = False, (cost - tokens) / policy.refill_per_second
+
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    async def close(self) -> None:
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisBucketBackend:
+    """Token buckets shared by every worker, updated atomically by a Lua script.
+
+    Requires the optional ``redis`` package.
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the 'redis' package is not installed")
+        self.prefix = prefix
+        self._redis = redis_asyncio.from_url(url)
+        self._script = self._redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, policy: RatePolicy, cost: float = 1.0) -> Tuple[bool, float]:
+        allowed, retry_after = await self._script(
+            keys=[self.prefix + key],
+            args=[policy.capacity, policy.refill_per_second, cost],
+        )
+        return bool(int(allowed)), float(retry_after)
+
+    async def close(self) -> None:
+        await self._redis.close()
+
+
+class RateLimitMiddleware:
+    """Applies the first matching route policy per request, keyed by user or client IP.
+
+    Requests rejected by the limiter get ``429`` with ``Retry-After``. If the
+    backend itself fails, requests are let through rather than taking the API
+    down with it.
+    """
+
+    def __init__(
+        self,
+        app,
+        rules: List[RouteRule],
+        default_policy: RatePolicy,
+        backend_getter: Callable[[], object],
+        identify: Callable[[dict], str],
+    ):
+        self.app = app
+        self.rules = rules
+        self.default_policy = default_policy
+        self.backend_getter = backend_getter
+        self.identify = identify
+
+    def policy_for(self, method: str, path: str) -> RatePolicy:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule.policy
+        return self.default_policy
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.policy_for(scope["method"], scope["path"])
+        key = f"{policy.name}:{self.identify(scope)}"
+        try:
+            allowed, retry_after = await self.backend_getter().take(key, policy)
+        except Exception as e:
+            logger.warning(f"Rate limiter backend error, allowing request: {str(e)}")
+            allowed, retry_after = True, 0.0
+
+        counters = rate_limit_counters.setdefault(policy.name, {"allowed": 0, "rejected": 0})
+        if allowed:
+            counters["allowed"] += 1
+            await self.app(scope, receive, send)
+            return
+
+        counters["rejected"] += 1
+        body = json.dumps({
+            "error": {
+                "code": 429,
+                "message": "Too many requests",
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def client_ip(scope: dict, trust_proxy: bool = False) -> str:
+    if trust_proxy:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
@@ -0,0 +1,527 @@
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from postgrest.exceptions import APIError
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+UNIQUE_VIOLATION = "23505"
+# Postgres names the conflicting column in the error details: "Key (email)=(...) already exists."
+_CONFLICT_KEY = re.compile(r"Key \((\w+)\)")
+
+
+class AlreadyExists(Exception):
+    """An insert hit a unique constraint; ``column`` names the conflicting column when known."""
+
+    def __init__(self, column: Optional[str]):
+        super().__init__(f"Duplicate value for {column or 'a unique column'}")
+        self.column = column
+
+
+class PooledPostgrestClient(AsyncPostgrestClient):
+    """Async PostgREST client whose HTTP session has a bounded connection pool."""
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        limits: httpx.Limits,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        **kwargs,
+    ):
+        self._limits = limits
+        self._transport = transport
+        super().__init__(base_url, **kwargs)
+
+    def create_session(
+        self,
+        base_url: str,
+        headers: Dict[str, str],
+        timeout: Union[int, float, httpx.Timeout],
+    ) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=self._limits,
+            transport=self._transport,
+        )
+
+
+def _quote(value: str) -> str:
+    """A PostgREST logical-filter literal, safe for commas, parentheses and quotes in ``value``."""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+class UserRepository:
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def get_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        response = await self.client.table("users").select("*").eq("id", user_id).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    @timed("supabase")
+    async def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        response = await self.client.table("users").select("*").eq("email", email).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    @timed("supabase")
+    async def find_registered(self, email: str, cpf: str) -> List[Dict[str, Any]]:
+        """Email and CPF of the (at most two) users already holding ``email`` or ``cpf``, in one query."""
+        query = self.client.table("users").select("email, cpf").limit(2)
+        query.params = query.params.add("or", f"(email.eq.{_quote(email)},cpf.eq.{_quote(cpf)})")
+        response = await query.execute()
+        return response.data or []
+
+    @timed("supabase")
+    async def create(self, user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Insert a user; raises :class:`AlreadyExists` when the email or CPF was taken in the meantime."""
+        try:
+            response = await self.client.table("users").insert(user_data).execute()
+        except APIError as e:
+            if e.code != UNIQUE_VIOLATION:
+                raise
+            match = _CONFLICT_KEY.search(e.details or "")
+            raise AlreadyExists(match.group(1) if match else None)
+        return response.data[0] if response.data else None
+
+    @timed("supabase")
+    async def update_password(self, user_id: str, hashed_password: str) -> None:
+        await self.client.table("users").update({"password": hashed_password}).eq("id", user_id).execute()
+
+    @timed("supabase")
+    async def ping(self) -> None:
+        await self.client.table("users").select("id").limit(1).execute()
+
+
+class KYCRepository:
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def get_level(self, user_id: str) -> Optional[int]:
+        response = await self.client.table("users")\
+            .select("kyc_level")\
+            .eq("id", user_id)\
+            .limit(1)\
+            .execute()
+        return response.data[0]["kyc_level"] if response.data else None
+
+    @timed("supabase")
+    async def update_level(self, user_id: str, kyc_level: int) -> Optional[Dict[str, Any]]:
+        response = await self.client.table("users")\
+            .update({"kyc_level": kyc_level})\
+            .eq("id", user_id)\
+            .execute()
+        return response.data[0] if response.data else None
+
+
+class TransactionRepository:
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def create(self, transaction_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        response = await self.client.table("transactions").insert(transaction_data).execute()
+        return response.data[0] if response.data else None
+
+    @timed("supabase")
+    async def create_many(self, rows: List[Dict[str, Any]], idempotent: bool = False) -> List[Dict[str, Any]]:
+        """Insert all rows in one request.
+
+        With ``idempotent`` set, rows whose (user_id, idempotency_key) already
+        exists are skipped and only the newly inserted rows are returned.
+        """
+        if idempotent:
+            query = self.client.table("transactions").upsert(
+                rows,
+                ignore_duplicates=True,
+                on_conflict="user_id,idempotency_key",
+            )
+        else:
+            query = self.client.table("transactions").insert(rows)
+        response = await query.execute()
+        return response.data or []
+
+    @timed("supabase")
+    async def get_by_idempotency_keys(self, user_id: str, keys: List[str]) -> List[Dict[str, Any]]:
+        response = await self.client.table("transactions")\
+            .select("*")\
+            .eq("user_id", user_id)\
+            .in_("idempotency_key", keys)\
+            .execute()
+        return response.data or []
+
+    @timed("supabase")
+    async def get(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        response = await self.client.table("transactions")\
+            .select("*")\
+            .eq("id", transaction_id)\
+            .limit(1)\
+            .execute()
+        return response.data[0] if response.data else None
+
+    @timed("supabase")
+    async def list_for_user(
+        self,
+        user_id: str,
+        limit: int,
+        offset: int = 0,
+        columns: str = "*",
+        before: Optional[Tuple[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Newest-first page of a user's transactions.
+
+        ``before`` is a ``(created_at, id)`` keyset position; only rows that sort
+        after it are returned, so deep pages cost the same as the first one.
+        """
+        query = self.client.table("transactions")\
+            .select(columns)\
+            .eq("user_id", user_id)
+        if before is not None:
+            created_at, row_id = before
+            query.params = query.params.add(
+                "or",
+                f"(created_at.lt.{_quote(created_at)},and(created_at.eq.{_quote(created_at)},id.lt.{_quote(row_id)}))",
+            )
+        query = query.order("created_at", desc=True).order("id", desc=True).limit(limit)
+        if offset:
+            query = query.offset(offset)
+        response = await query.execute()
+        return response.data or []
+
+
+class StatsRepository:
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def platform_stats(self, since: str) -> Dict[str, Any]:
+        """Aggregate totals and activity since ``since`` with the get_platform_stats SQL function."""
+        response = await self.client.rpc("get_platform_stats", {"since": since}).execute()
+        return response.data[0] if response.data else {}
+
+    @timed("supabase")
+    async def activity(self, since: str, bucket_seconds: int = 60) -> List[Dict[str, Any]]:
+        """Transaction counts and volumes per time bucket and user since ``since``."""
+        response = await self.client.rpc(
+            "get_transaction_activity",
+            {"since": since, "bucket_seconds": bucket_seconds},
+        ).execute()
+        return response.data or []
+
+
+class PriceRepository:
+    """Bitcoin ticks in crypto_prices and their OHLC rollups in crypto_price_candles."""
+
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def insert_ticks(self, rows: List[Dict[str, Any]]) -> None:
+        await self.client.table("crypto_prices").insert(rows, returning="minimal").execute()
+
+    @timed("supabase")
+    async def rollup(self, symbol: str, since: str) -> None:
+        """Recompute every candle interval from ``since`` with the rollup_crypto_price_candles SQL function."""
+        await self.client.rpc("rollup_crypto_price_candles", {"p_symbol": symbol, "p_since": since}).execute()
+
+    @timed("supabase")
+    async def candles(self, symbol: str, bucket_seconds: int, start: str, end: str) -> List[Dict[str, Any]]:
+        response = await self.client.table("crypto_price_candles")\
+            .select("bucket_start, open, high, low, close, ticks")\
+            .eq("symbol", symbol)\
+            .eq("bucket_seconds", bucket_seconds)\
+            .gte("bucket_start", start)\
+            .lt("bucket_start", end)\
+            .order("bucket_start")\
+            .execute()
+        return response.data or []
+
+    @timed("supabase")
+    async def recent_candles(self, symbol: str, bucket_seconds: int, limit: int) -> List[Dict[str, Any]]:
+        response = await self.client.table("crypto_price_candles")\
+            .select("bucket_start, open, high, low, close, ticks")\
+            .eq("symbol", symbol)\
+            .eq("bucket_seconds", bucket_seconds)\
+            .order("bucket_start", desc=True)\
+            .limit(limit)\
+            .execute()
+        return response.data or []
+
+
+class OrderRepository:
+    """Open buy/sell transactions for the order book, and the fills it produces."""
+
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def open_orders(self, limit: int, after: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+        """Oldest-first page of pending transactions; ``after`` is a ``(created_at, id)`` keyset position."""
+        query = self.client.table("transactions")\
+            .select("*")\
+            .eq("status", "pending")
+        if after is not None:
+            created_at, row_id = after
+            query.params = query.params.add(
+                "or",
+                f"(created_at.gt.{_quote(created_at)},and(created_at.eq.{_quote(created_at)},id.gt.{_quote(row_id)}))",
+            )
+        response = await query.order("created_at").order("id").limit(limit).execute()
+        return response.data or []
+
+    @timed("supabase")
+    async def apply_fills(self, orders: List[Dict[str, Any]], escrows: List[Dict[str, Any]]) -> None:
+        """Update matched transactions and create their escrows atomically with the apply_order_fills SQL function."""
+        await self.client.rpc("apply_order_fills", {"p_orders": orders, "p_escrows": escrows}).execute()
+
+    @timed("supabase")
+    async def depth(self, limit: int) -> Dict[str, Any]:
+        """Best ``limit`` price levels per side of the stored pending transactions."""
+        response = await self.client.rpc("order_book_depth", {"p_limit": limit}).execute()
+        return response.data or {"bids": [], "asks": []}
+
+
+class EscrowRepository:
+    """Escrow expiry lookups and the batched cancellation of expired escrows."""
+
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def upcoming_expiries(
+        self,
+        statuses: Sequence[str],
+        before: str,
+        since: Optional[str] = None,
+        created_since: Optional[str] = None,
+        limit: int = 1000,
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Open escrows expiring before ``before``, soonest first.
+
+        With ``since``, only escrows expiring from then on or created after
+        ``created_since`` are returned, i.e. the ones a previous call with
+        ``before=since`` could not have seen. ``after`` is an
+        ``(expires_at, id)`` keyset position.
+        """
+        query = self.client.table("escrow_transactions")\
+            .select("id, expires_at")\
+            .in_("status", list(statuses))\
+            .lt("expires_at", before)
+        conditions = []
+        if since is not None:
+            unseen = [f"expires_at.gte.{_quote(since)}"]
+            if created_since is not None:
+                unseen.append(f"created_at.gte.{_quote(created_since)}")
+            conditions.append(f"or({','.join(unseen)})")
+        if after is not None:
+            expires_at, row_id = after
+            conditions.append(
+                f"or(expires_at.gt.{_quote(expires_at)},and(expires_at.eq.{_quote(expires_at)},id.gt.{_quote(row_id)}))"
+            )
+        if conditions:
+            query.params = query.params.add("and", f"({','.join(conditions)})")
+        response = await query.order("expires_at").order("id").limit(limit).execute()
+        return response.data or []
+
+    @timed("supabase")
+    async def expire(self, escrow_ids: List[str]) -> Dict[str, Any]:
+        """Cancel the due escrows among ``escrow_ids`` and log them with the expire_escrows SQL function.
+
+        Returns ``{"locked": bool, "expired": [...], "not_due": [...]}``; ``locked``
+        is false when another worker was running a batch at the same time.
+        """
+        response = await self.client.rpc("expire_escrows", {"p_ids": escrow_ids}).execute()
+        return response.data or {}
+
+
+class TokenRepository:
+    """Revoked JWT ids, shared by the workers until the tokens expire."""
+
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def revoke(self, jti: str, user_id: str, expires_at: str) -> None:
+        await self.client.table("revoked_tokens").upsert(
+            {
+                "jti": jti,
+                "user_id": user_id,
+                "expires_at": expires_at,
+                "revoked_at": datetime.now(timezone.utc).isoformat(),
+            },
+            returning="minimal",
+            on_conflict="jti",
+        ).execute()
+
+    @timed("supabase")
+    async def revocations(
+        self,
+        since: Optional[str] = None,
+        limit: int = 1000,
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Revocations of unexpired tokens, oldest first, made at or after ``since`` when given.
+
+        ``after`` is a ``(revoked_at, jti)`` keyset position.
+        """
+        query = self.client.table("revoked_tokens")\
+            .select("jti, expires_at, revoked_at")\
+            .gt("expires_at", datetime.now(timezone.utc).isoformat())
+        if since is not None:
+            query = query.gte("revoked_at", since)
+        if after is not None:
+            revoked_at, jti = after
+            query.params = query.params.add(
+                "or",
+                f"(revoked_at.gt.{_quote(revoked_at)},and(revoked_at.eq.{_quote(revoked_at)},jti.gt.{_quote(jti)}))",
+            )
+        response = await query.order("revoked_at").order("jti").limit(limit).execute()
+        return response.data or []
+
+
+class CacheInvalidationRepository:
+    """Cache invalidations made by one worker, for the others to apply."""
+
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def publish(self, rows: List[Dict[str, Any]]) -> None:
+        await self.client.table("cache_invalidations").insert(rows, returning="minimal").execute()
+
+    @timed("supabase")
+    async def since(
+        self,
+        since: str,
+        limit: int = 1000,
+        after: Optional[Tuple[str, int]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Invalidations stored at or after ``since``, oldest first; ``after`` is a ``(created_at, id)`` keyset position."""
+        query = self.client.table("cache_invalidations")\
+            .select("id, kind, scope, worker, created_at")\
+            .gte("created_at", since)
+        if after is not None:
+            created_at, row_id = after
+            query.params = query.params.add(
+                "or",
+                f"(created_at.gt.{_quote(created_at)},and(created_at.eq.{_quote(created_at)},id.gt.{row_id}))",
+            )
+        response = await query.order("created_at").order("id").limit(limit).execute()
+        return response.data or []
+
+
+class AuditRepository:
+    """Append-only audit trail in audit_events."""
+
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @timed("supabase")
+    async def insert(self, rows: List[Dict[str, Any]]) -> None:
+        await self.client.table("audit_events").insert(rows, returning="minimal").execute()
+
+
+class IdempotencyRepository:
+    """Durable store for replayable responses keyed by hashed idempotency key."""
+
+    def __init__(self, client: AsyncPostgrestClient, ttl_seconds: float):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+
+    @timed("supabase")
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        response = await self.client.table("idempotency_keys")\
+            .select("fingerprint, response")\
+            .eq("key", key)\
+            .gt("expires_at", datetime.now(timezone.utc).isoformat())\
+            .limit(1)\
+            .execute()
+        return response.data[0] if response.data else None
+
+    @timed("supabase")
+    async def save(self, key: str, fingerprint: str, stored_response: Dict[str, Any]) -> None:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        await self.client.table("idempotency_keys").upsert(
+            {
+                "key": key,
+                "fingerprint": fingerprint,
+                "response": stored_response,
+                "expires_at": expires_at.isoformat(),
+            },
+            returning="minimal",
+            on_conflict="key",
+        ).execute()
+
+
+class Database:
+    """Shared async PostgREST client and the repositories built on top of it.
+
+    Created and closed in the app ``lifespan`` so every request on a worker
+    reuses the same bounded connection pool.
+    """
+
+    def __init__(
+        self,
+        supabase_url: str,
+        supabase_key: str,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        timeout: float = 10.0,
+        idempotency_ttl_seconds: float = 86400.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.rest_url = f"{supabase_url}/rest/v1"
+        self.supabase_key = supabase_key
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.timeout = timeout
+        self.idempotency_ttl_seconds = idempotency_ttl_seconds
+        # Custom httpx transport, used by the benchmarks to run against an in-process stand-in
+        self.transport = transport
+        self.client: Optional[PooledPostgrestClient] = None
+
+    async def connect(self) -> None:
+        headers = {
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apiKey": self.supabase_key,
+            "Authorization": f"Bearer {self.supabase_key}",
+        }
+        self.client = PooledPostgrestClient(
+            self.rest_url,
+            headers=headers,
+            timeout=self.timeout,
+            limits=self.limits,
+            transport=self.transport,
+        )
+        self.users = UserRepository(self.client)
+        self.kyc = KYCRepository(self.client)
+        self.transactions = TransactionRepository(self.client)
+        self.stats = StatsRepository(self.client)
+        self.prices = PriceRepository(self.client)
+        self.orders = OrderRepository(self.client)
+        self.escrows = EscrowRepository(self.client)
+        self.tokens = TokenRepository(self.client)
+        self.audit = AuditRepository(self.client)
+        self.invalidations = CacheInvalidationRepository(self.client)
+        self.idempotency = IdempotencyRepository(self.client, self.idempotency_ttl_seconds)
+        logger.info(f"Connected to Supabase REST API at {self.rest_url}")
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
@@ -0,0 +1,92 @@
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from fastapi import Response
+
+from cache import LRUCache
+
+CacheKey = Tuple[Hashable, float, Hashable]
+
+
+def make_etag(*parts: Any) -> str:
+    """A strong ETag over ``parts``, which must determine the response body byte for byte."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` header lists ``etag`` (weak comparison, as RFC 9110 asks for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == target for tag in if_none_match.split(","))
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    # User who may read the response, for entries that are not scoped to the reader
+    owner: Optional[str] = None
+
+
+class ResponseCache:
+    """Serialized JSON bodies and their ETags, kept for ``ttl`` seconds per scope.
+
+    A scope is whatever a write invalidates: a user id for everything listed
+    under that user, a transaction id for a single transaction. Invalidating a
+    scope bumps its generation, which is part of every key, so all of its
+    entries become unreachable at once and age out of the LRU. Callers take
+    the key before reading the database and store under it afterwards, so a
+    write that lands while a request is in flight is never hidden behind the
+    older body. A ``max_size`` of 0 turns body caching off while ETags and
+    ``304 Not Modified`` replies keep working.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.entries: LRUCache[CachedResponse] = LRUCache(max_size=max_size, ttl=ttl)
+        self._generations: Dict[Hashable, float] = {}
+        self.invalidations = 0
+        self.not_modified = 0
+
+    def key(self, scope: Hashable, name: Hashable) -> CacheKey:
+        return scope, self._generations.get(scope, 0.0), name
+
+    def get(self, key: CacheKey) -> Optional[CachedResponse]:
+        return self.entries.get(key)
+
+    def set(self, key: CacheKey, response: CachedResponse) -> None:
+        self.entries.set(key, response)
+
+    def invalidate(self, scope: Hashable) -> None:
+        now = time.monotonic()
+        self._generations[scope] = now
+        self.invalidations += 1
+        if len(self._generations) > self.entries.max_size:
+            # Entries stored before a generation older than the TTL have expired, so it can be forgotten
+            self._generations = {s: t for s, t in self._generations.items() if now - t < self.entries.ttl}
+
+    def respond(
+        self,
+        cached: CachedResponse,
+        if_none_match: Optional[str],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """``cached`` as a response, or an empty 304 when the client already holds it."""
+        response_headers = {**cached.headers, **(headers or {}), "ETag": cached.etag}
+        if etag_matches(if_none_match, cached.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=response_headers)
+        return Response(cached.body, headers=response_headers, media_type="application/json")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.entries.stats(),
+            "invalidations": self.invalidations,
+            "not_modified": self.not_modified,
+        }
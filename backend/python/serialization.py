@@ -0,0 +1,84 @@
+from typing import Any, Dict, List, Mapping, Optional, Type, Union, get_args, get_origin
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from typing_extensions import TypedDict
+
+
+_row_types: Dict[Type[BaseModel], Any] = {}
+
+
+def _row_annotation(annotation: Any) -> Any:
+    """The row type for a field: nested models become their row TypedDict, anything else passes through."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return row_type(annotation)
+    origin = get_origin(annotation)
+    if origin in (list, List):
+        (item,) = get_args(annotation) or (Any,)
+        return List[_row_annotation(item)]
+    if origin is Union:
+        return Union[tuple(_row_annotation(arg) for arg in get_args(annotation))]
+    return Any
+
+
+def row_type(model: Type[BaseModel]) -> Any:
+    """A TypedDict with ``model``'s fields, untyped except for nested models.
+
+    Serializing through it keeps exactly the model's keys (so e.g. a user row's
+    password never leaks) without validating or converting the values, which
+    are written as the database returned them.
+    """
+    if model not in _row_types:
+        fields = {name: _row_annotation(field.annotation) for name, field in model.model_fields.items()}
+        _row_types[model] = TypedDict(f"{model.__name__}Row", fields, total=False)
+    return _row_types[model]
+
+
+class RowSerializer:
+    """JSON responses for ``model`` (or a list of it) built straight from dict rows.
+
+    With ``direct`` set, rows go through a precompiled ``TypeAdapter`` over the
+    model's row type and are written in one pass by pydantic-core, instead of
+    building a model instance per row and having FastAPI validate and encode
+    the result again. Fields with defaults are filled in when the rows lack
+    them. Without ``direct``, rows are validated against the model first,
+    which is slower but rejects rows that do not match it.
+    """
+
+    def __init__(self, model: Type[BaseModel], many: bool = False, direct: bool = True):
+        self.model = model
+        self.many = many
+        self.direct = direct
+        self.defaults = {
+            name: field.get_default(call_default_factory=True)
+            for name, field in model.model_fields.items()
+            if not field.is_required()
+        }
+        row = row_type(model)
+        self.adapter = TypeAdapter(List[row] if many else row)
+        self.model_adapter = TypeAdapter(List[model] if many else model)
+
+    def _with_defaults(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Rows from one query share their columns, so the first one tells whether any are missing
+        if not rows or not self.defaults:
+            return rows
+        missing = {name: value for name, value in self.defaults.items() if name not in rows[0]}
+        if not missing:
+            return rows
+        return [{**row, **missing} for row in rows]
+
+    def dumps(self, data: Union[Mapping[str, Any], List[Mapping[str, Any]]]) -> bytes:
+        if not self.direct:
+            return self.model_adapter.dump_json(self.model_adapter.validate_python(data))
+        if self.many:
+            return self.adapter.dump_json(self._with_defaults(data))
+        return self.adapter.dump_json(self._with_defaults([data])[0])
+
+    def response(
+        self,
+        data: Union[Mapping[str, Any], List[Mapping[str, Any]]],
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> Response:
+        return Response(self.dumps(data), status_code=status_code, headers=headers, media_type="application/json")
+
@@ -0,0 +1,275 @@
+"""Production launcher: the API on several uvicorn workers sharing one listening socket.
+
+The app module is imported once in the supervising process, before forking, so
+workers start from its already-loaded code and configuration. Everything that
+holds connections, threads or tasks is created per worker by the app's
+``lifespan``. Each worker gets ``SERVER_WORKER_INDEX`` in its environment;
+worker 0 also runs the jobs that must run once per deployment (see
+``app.is_primary_worker``).
+
+Signals sent to the supervisor:
+
+- ``SIGTERM``/``SIGINT``: stop accepting connections, let in-flight requests
+  finish for up to ``SERVER_GRACEFUL_TIMEOUT_SECONDS``, run shutdown, and exit
+- ``SIGTTIN``/``SIGTTOU``: add or remove one worker (worker 0 is never removed)
+
+Workers that crash are replaced under the same index. If a worker fails
+during startup, the whole server stops instead of restarting it in a loop.
+
+Run from ``backend/python``::
+
+    python server.py
+"""
+import importlib.util
+import logging
+import math
+import os
+import select
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional, Set
+
+import uvicorn
+
+logger = logging.getLogger("server")
+
+# Exit status of a worker whose app never finished starting up
+STARTUP_FAILED = 3
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on, capped by a cgroup v2 CPU quota if there is one."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def event_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Forks ``workers`` uvicorn servers for ``app`` on one socket and keeps them running."""
+
+    def __init__(
+        self,
+        app,
+        host: str = "0.0.0.0",
+        port: int = 8000,
+        workers: int = 1,
+        graceful_timeout: float = 30.0,
+        keep_alive: int = 5,
+        backlog: int = 2048,
+        access_log: bool = False,
+        log_level: str = "info",
+    ):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.graceful_timeout = graceful_timeout
+        self.keep_alive = keep_alive
+        self.backlog = backlog
+        self.access_log = access_log
+        self.log_level = log_level
+        self.loop = event_loop()
+        self.http = http_protocol()
+        self.sock: Optional[socket.socket] = None
+        # Worker index per child pid
+        self.children: Dict[int, int] = {}
+        # Pids asked to exit by SIGTTOU; only their exits are expected
+        self.retiring: Set[int] = set()
+        self.stopping = False
+        self.exit_code = 0
+        self._signals: List[int] = []
+
+    def run(self) -> int:
+        self.sock = bind_socket(self.host, self.port, self.backlog)
+        wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_read, False)
+        os.set_blocking(wakeup_write, False)
+        signal.set_wakeup_fd(wakeup_write)
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU, signal.SIGCHLD):
+            signal.signal(sig, self._handle_signal)
+
+        logger.info(
+            f"Listening on {self.host}:{self.port} with {self.workers} workers "
+            f"(loop={self.loop}, http={self.http}), supervisor pid {os.getpid()}"
+        )
+        for index in range(self.workers):
+            self._spawn(index)
+
+        try:
+            while self.children:
+                try:
+                    select.select([wakeup_read], [], [], 1.0)
+                    os.read(wakeup_read, 1024)
+                except (BlockingIOError, InterruptedError):
+                    pass
+                self._dispatch_signals()
+                self._reap()
+        finally:
+            signal.set_wakeup_fd(-1)
+            os.close(wakeup_read)
+            os.close(wakeup_write)
+            self.sock.close()
+        logger.info("All workers stopped")
+        return self.exit_code
+
+    def _handle_signal(self, sig, frame) -> None:
+        self._signals.append(sig)
+
+    def _dispatch_signals(self) -> None:
+        while self._signals:
+            sig = self._signals.pop(0)
+            if sig in (signal.SIGTERM, signal.SIGINT):
+                self.stop()
+            elif sig == signal.SIGTTIN and not self.stopping:
+                self.workers += 1
+                self._spawn(self.workers - 1)
+                logger.info(f"Scaled up to {self.workers} workers")
+            elif sig == signal.SIGTTOU and not self.stopping:
+                self.scale_down()
+
+    def scale_down(self) -> None:
+        """Retire the newest worker that is not already retiring; worker 0 always stays."""
+        candidates = [(index, pid) for pid, index in self.children.items() if index > 0 and pid not in self.retiring]
+        if not candidates:
+            logger.info("No worker to remove, keeping the current workers")
+            return
+        index, pid = max(candidates)
+        self.retiring.add(pid)
+        self.workers -= 1
+        self._kill(pid, signal.SIGTERM)
+        logger.info(f"Scaling down to {self.workers} workers, stopping worker {index} (pid {pid})")
+
+    def stop(self) -> None:
+        """Ask every worker to drain and exit, killing those still running after the graceful timeout."""
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info(f"Draining {len(self.children)} workers")
+        for pid in self.children:
+            self._kill(pid, signal.SIGTERM)
+        # uvicorn's own timeout covers the requests; allow a little longer for shutdown to run
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self.children):
+            logger.warning(f"Worker {self.children[pid]} (pid {pid}) did not stop in time, killing it")
+            self._kill(pid, signal.SIGKILL)
+        while self.children:
+            self._reap()
+            time.sleep(0.05)
+
+    def _kill(self, pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            index = self.children.pop(pid, None)
+            if index is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            if self.stopping:
+                continue
+            if code == STARTUP_FAILED:
+                logger.error(f"Worker {index} failed to start, shutting down")
+                self.exit_code = STARTUP_FAILED
+                self.stop()
+                return
+            logger.warning(f"Worker {index} (pid {pid}) exited with status {code}, restarting it")
+            self._spawn(index)
+
+    def _spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            return
+        code = 1
+        try:
+            code = self._run_worker(index)
+        except BaseException:
+            logger.exception(f"Worker {index} crashed")
+        finally:
+            os._exit(code)
+
+    def _run_worker(self, index: int) -> int:
+        signal.set_wakeup_fd(-1)
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        os.environ["SERVER_WORKER_INDEX"] = str(index)
+        config = uvicorn.Config(
+            self.app,
+            loop=self.loop,
+            http=self.http,
+            lifespan="on",
+            timeout_keep_alive=self.keep_alive,
+            timeout_graceful_shutdown=self.graceful_timeout,
+            access_log=self.access_log,
+            log_level=self.log_level,
+        )
+        server = uvicorn.Server(config)
+        server.run(sockets=[self.sock])
+        return 0 if server.started else STARTUP_FAILED
+
+
+def main() -> None:
+    # Preload: import the app (and its settings from .env) once, before forking
+    from app import app
+
+    workers = int(os.getenv("WEB_CONCURRENCY") or 0) or available_cpus()
+    supervisor = Supervisor(
+        app,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        graceful_timeout=float(os.getenv("SERVER_GRACEFUL_TIMEOUT_SECONDS", "30")),
+        keep_alive=int(os.getenv("SERVER_KEEPALIVE_SECONDS", "5")),
+        backlog=int(os.getenv("SERVER_BACKLOG", "2048")),
+        access_log=os.getenv("SERVER_ACCESS_LOG", "false").lower() == "true",
+    )
+    sys.exit(supervisor.run())
+
+
+if __name__ == "__main__":
+    main()
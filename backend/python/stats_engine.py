@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Bucket:
+    start: int
+    transactions: int = 0
+    volume_brl: float = 0.0
+    volume_btc: float = 0.0
+    users: Dict[str, int] = field(default_factory=dict)
+
+
+class RollingWindow:
+    """Activity over the last ``span`` seconds, kept as fixed-size time buckets.
+
+    Running sums and a per-user reference count are updated as events arrive
+    and as buckets fall out of the window, so reading the window is O(1).
+    """
+
+    def __init__(self, span: int, bucket_seconds: int = 60):
+        self.span = span
+        self.bucket_seconds = bucket_seconds
+        self.buckets: Deque[Bucket] = deque()
+        self.transactions = 0
+        self.volume_brl = 0.0
+        self.volume_btc = 0.0
+        self.user_refs: Dict[str, int] = {}
+
+    def _bucket_start(self, ts: float) -> int:
+        return int(ts // self.bucket_seconds) * self.bucket_seconds
+
+    def _bucket_for(self, start: int) -> Bucket:
+        if not self.buckets or self.buckets[-1].start < start:
+            bucket = Bucket(start=start)
+            self.buckets.append(bucket)
+            return bucket
+        # Out-of-order event: walk back from the newest bucket
+        for index in range(len(self.buckets) - 1, -1, -1):
+            bucket = self.buckets[index]
+            if bucket.start == start:
+                return bucket
+            if bucket.start < start:
+                bucket = Bucket(start=start)
+                self.buckets.insert(index + 1, bucket)
+                return bucket
+        bucket = Bucket(start=start)
+        self.buckets.appendleft(bucket)
+        return bucket
+
+    def add(
+        self,
+        ts: float,
+        user_id: str,
+        transactions: int = 1,
+        volume_brl: float = 0.0,
+        volume_btc: float = 0.0,
+        now: Optional[float] = None,
+    ) -> None:
+        now = time.time() if now is None else now
+        if ts <= now - self.span:
+            return
+        bucket = self._bucket_for(self._bucket_start(ts))
+        bucket.transactions += transactions
+        bucket.volume_brl += volume_brl
+        bucket.volume_btc += volume_btc
+        if user_id not in bucket.users:
+            self.user_refs[user_id] = self.user_refs.get(user_id, 0) + 1
+        bucket.users[user_id] = bucket.users.get(user_id, 0) + transactions
+        self.transactions += transactions
+        self.volume_brl += volume_brl
+        self.volume_btc += volume_btc
+
+    def expire(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        cutoff = now - self.span
+        while self.buckets and self.buckets[0].start + self.bucket_seconds <= cutoff:
+            bucket = self.buckets.popleft()
+            self.transactions -= bucket.transactions
+            self.volume_brl -= bucket.volume_brl
+            self.volume_btc -= bucket.volume_btc
+            for user_id in bucket.users:
+                refs = self.user_refs[user_id] - 1
+                if refs:
+                    self.user_refs[user_id] = refs
+                else:
+                    del self.user_refs[user_id]
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        self.expire(now)
+        return {
+            "transactions": self.transactions,
+            "active_users": len(self.user_refs),
+            "volume_brl": self.volume_brl,
+            "volume_btc": self.volume_btc,
+        }
+
+
+class StatsEngine:
+    """Platform statistics maintained incrementally as writes succeed.
+
+    Totals and rolling windows are rebuilt from the database on startup and
+    every ``reconcile_interval`` seconds, which also corrects for writes made
+    by other workers. Writes recorded while a reconciliation is querying the
+    database are replayed onto the rebuilt state, so none are lost; one that
+    the queries already saw is counted twice until the next reconciliation.
+    """
+
+    def __init__(
+        self,
+        windows: Optional[Dict[str, int]] = None,
+        bucket_seconds: int = 60,
+        reconcile_interval: float = 300.0,
+    ):
+        self.repository = None
+        self.window_spans = windows or {"1h": 3600, "24h": 86400}
+        self.bucket_seconds = bucket_seconds
+        self.reconcile_interval = reconcile_interval
+        self.total_users = 0
+        self.total_transactions = 0
+        self.total_volume_brl = 0.0
+        self.total_volume_btc = 0.0
+        self.windows = self._new_windows()
+        self.ready = False
+        self.last_reconciled_at: Optional[float] = None
+        # Set while a reconciliation is querying the database
+        self._users_during_reconcile: Optional[int] = None
+        self._transactions_during_reconcile: Optional[List[Tuple[float, str, float, float]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _new_windows(self) -> Dict[str, RollingWindow]:
+        return {
+            name: RollingWindow(span, self.bucket_seconds)
+            for name, span in self.window_spans.items()
+        }
+
+    async def start(self, repository) -> None:
+        """Reconcile from ``repository`` (a StatsRepository) and schedule periodic reconciliation."""
+        self.repository = repository
+        try:
+            await self.reconcile()
+        except Exception as e:
+            logger.warning(f"Initial stats reconciliation failed: {str(e)}")
+        self._task = asyncio.create_task(self._reconcile_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _reconcile_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.warning(f"Stats reconciliation failed: {str(e)}")
+
+    async def reconcile(self) -> None:
+        now = time.time()
+        longest = max(self.window_spans.values())
+        since = datetime.fromtimestamp(now - longest, tz=timezone.utc).isoformat()
+        self._users_during_reconcile = 0
+        self._transactions_during_reconcile = []
+        try:
+            totals = await self.repository.platform_stats(since=since)
+            activity = await self.repository.activity(since=since, bucket_seconds=self.bucket_seconds)
+        finally:
+            new_users, self._users_during_reconcile = self._users_during_reconcile, None
+            new_transactions, self._transactions_during_reconcile = self._transactions_during_reconcile, None
+
+        windows = self._new_windows()
+        for row in activity:
+            ts = datetime.fromisoformat(row["bucket"]).timestamp()
+            for window in windows.values():
+                window.add(
+                    ts,
+                    row["user_id"],
+                    transactions=row["transactions"],
+                    volume_brl=float(row["volume_brl"] or 0),
+                    volume_btc=float(row["volume_btc"] or 0),
+                    now=now,
+                )
+
+        self.total_users = totals.get("total_users") or 0
+        self.total_transactions = totals.get("total_transactions") or 0
+        self.total_volume_brl = float(totals.get("total_volume_brl") or 0)
+        self.total_volume_btc = float(totals.get("total_volume_btc") or 0)
+        self.windows = windows
+        self.total_users += new_users
+        for transaction in new_transactions:
+            self._add_transaction(*transaction)
+        self.ready = True
+        self.last_reconciled_at = now
+        logger.info(f"Platform stats reconciled: {self.total_users} users, {self.total_transactions} transactions")
+
+    def record_user(self) -> None:
+        self.total_users += 1
+        if self._users_during_reconcile is not None:
+            self._users_during_reconcile += 1
+
+    def record_transaction(self, user_id: str, amount_brl: float, amount_btc: float, created_at: Optional[str] = None) -> None:
+        ts = datetime.fromisoformat(created_at).timestamp() if created_at else time.time()
+        self._add_transaction(ts, user_id, amount_brl, amount_btc)
+        if self._transactions_during_reconcile is not None:
+            self._transactions_during_reconcile.append((ts, user_id, amount_brl, amount_btc))
+
+    def _add_transaction(self, ts: float, user_id: str, amount_brl: float, amount_btc: float) -> None:
+        self.total_transactions += 1
+        self.total_volume_brl += amount_brl
+        self.total_volume_btc += amount_btc
+        for window in self.windows.values():
+            window.add(ts, user_id, volume_brl=amount_brl, volume_btc=amount_btc)
+
+    def window(self, name: str) -> Dict[str, Any]:
+        return self.windows[name].snapshot()
+
+    def snapshot(self, window_names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        names = self.windows.keys() if window_names is None else window_names
+        return {
+            "total_users": self.total_users,
+            "total_transactions": self.total_transactions,
+            "total_volume_brl": self.total_volume_brl,
+            "total_volume_btc": self.total_volume_btc,
+            "windows": {name: self.window(name) for name in names},
+            "reconciled_seconds_ago": time.time() - self.last_reconciled_at if self.last_reconciled_at else None,
+        }
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+PRICE_TOPIC = "price"
+
+
+def transactions_topic(user_id: str) -> str:
+    return f"transactions:{user_id}"
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Event:
+    """A message serialized once at publish time and shared by every subscriber."""
+
+    topic: str
+    name: str
+    sse: bytes
+    text: str
+
+    @classmethod
+    def build(cls, topic: str, name: str, payload: Any) -> "Event":
+        data = json.dumps(jsonable_encoder(payload), separators=(",", ":"))
+        return cls(
+            topic=topic,
+            name=name,
+            sse=f"event: {name}\ndata: {data}\n\n".encode(),
+            text=f'{{"event":"{name}","data":{data}}}',
+        )
+
+
+class Subscription:
+    """One connection's view of the broadcaster, with a bounded send queue.
+
+    ``get`` returns ``None`` once the subscription is closed, either because
+    the broadcaster shut down or because the consumer fell too far behind.
+    """
+
+    def __init__(self, topics: Iterable[str], queue_size: int):
+        self.topics = frozenset(topics)
+        self.queue: "asyncio.Queue[Optional[Event]]" = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def offer(self, event: Event) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        # Pending events are discarded so the end-of-stream marker always fits
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self) -> Optional[Event]:
+        return await self.queue.get()
+
+
+class Broadcaster:
+    """In-process fan-out of events to SSE and WebSocket subscribers by topic.
+
+    Publishing never waits on a consumer: an event is offered to each
+    subscriber's queue and a subscriber whose queue is full is dropped, so one
+    slow client cannot delay the others or grow memory without bound.
+    """
+
+    def __init__(self, queue_size: int = 100, max_subscribers: int = 10000):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self.subscribers = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        if self.subscribers >= self.max_subscribers:
+            raise TooManySubscribers()
+        subscription = Subscription(topics, self.queue_size)
+        for topic in subscription.topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        self.subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        removed = False
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is None or subscription not in subscribers:
+                continue
+            subscribers.discard(subscription)
+            removed = True
+            if not subscribers:
+                del self._topics[topic]
+        if removed:
+            self.subscribers -= 1
+        subscription.close()
+
+    def publish(self, topic: str, name: str, payload: Any) -> int:
+        subscribers = self._topics.get(topic)
+        self.published += 1
+        if not subscribers:
+            return 0
+        event = Event.build(topic, name, payload)
+        delivered = 0
+        for subscription in list(subscribers):
+            if subscription.offer(event):
+                delivered += 1
+            else:
+                self.dropped += 1
+                logger.info(f"Dropping slow stream subscriber on {topic}")
+                self.unsubscribe(subscription)
+        self.delivered += delivered
+        return delivered
+
+    def close(self) -> None:
+        for subscribers in list(self._topics.values()):
+            for subscription in list(subscribers):
+                self.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self.subscribers,
+            "topics": len(self._topics),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+
+from audit import AuditLog
+
+
+class Repository:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.rows = []
+
+    async def insert(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unreachable")
+        self.rows.extend(rows)
+
+
+def test_events_are_written_in_one_insert_and_retried_after_a_failure():
+    async def run():
+        repository = Repository(failures=1)
+        audit = AuditLog()
+        audit.repository = repository
+        audit.record("user.login", "user-1", "user-1")
+        audit.record("transaction.created", "user-1", "tx-1", amount_brl=30.0)
+
+        assert await audit.flush() == 0
+        assert audit.stats()["pending"] == 2
+        assert await audit.flush() == 2
+        assert [row["event"] for row in repository.rows] == ["user.login", "transaction.created"]
+        assert repository.rows[1]["metadata"] == {"amount_brl": 30.0}
+
+    asyncio.run(run())
+
+
+def test_a_full_queue_drops_and_logs_routine_events_but_keeps_critical_ones(caplog):
+    async def run():
+        audit = AuditLog(max_pending=2)
+        audit.repository = Repository(failures=10)
+        assert audit.record("transaction.created", "user-1", "tx-1")
+        assert audit.record("transaction.created", "user-1", "tx-2")
+        assert not audit.record("transaction.created", "user-1", "tx-3")
+        assert audit.record("kyc.level_updated", "admin-1", "user-1", critical=True, kyc_level=1)
+
+        with caplog.at_level(logging.ERROR, logger="audit"):
+            await audit.flush()
+        assert "Dropped 1 audit events" in caplog.text
+        stats = audit.stats()
+        assert stats["dropped"] == 1
+        assert stats["pending"] == 3
+
+    asyncio.run(run())
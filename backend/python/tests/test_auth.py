@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from auth import ACCESS, REFRESH, InvalidToken, TokenAuthority
+
+
+def test_tokens_of_a_retired_key_keep_working_until_it_is_dropped():
+    old = TokenAuthority({"k1": "first-secret"}, "k1")
+    token = old.issue({"sub": "user-1"})
+
+    rotated = TokenAuthority({"k1": "first-secret", "k2": "second-secret"}, "k2")
+    assert rotated.verify(token)["sub"] == "user-1"
+    assert rotated.verify(rotated.issue({"sub": "user-2"}))["sub"] == "user-2"
+
+    dropped = TokenAuthority({"k2": "second-secret"}, "k2")
+    with pytest.raises(InvalidToken):
+        dropped.verify(token)
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    forged = TokenAuthority({"k1": "guessed-secret"}, "k1").issue({"sub": "admin"})
+    with pytest.raises(InvalidToken):
+        TokenAuthority({"k1": "first-secret"}, "k1").verify(forged)
+
+
+def test_revoked_tokens_are_rejected_even_when_cached():
+    authority = TokenAuthority({"k1": "first-secret"}, "k1")
+    token = authority.issue({"sub": "user-1"}, REFRESH)
+    payload = authority.verify(token, REFRESH)
+    asyncio.run(authority.revoke(payload))
+    with pytest.raises(InvalidToken):
+        authority.verify(token, REFRESH)
+
+
+def test_refresh_tokens_are_not_access_tokens():
+    authority = TokenAuthority({"k1": "first-secret"}, "k1")
+    with pytest.raises(InvalidToken):
+        authority.verify(authority.issue({"sub": "user-1"}, REFRESH), ACCESS)
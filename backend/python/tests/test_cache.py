@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import app as api
+from benchmarks.stubs import PostgrestStub, seed
+from cache import LRUCache
+from repository import Database
+
+
+def test_the_least_recently_used_user_is_evicted_first():
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set("user-1", {"id": "user-1"})
+    cache.set("user-2", {"id": "user-2"})
+    assert cache.get("user-1") is not None
+    cache.set("user-3", {"id": "user-3"})
+
+    assert cache.get("user-2") is None
+    assert cache.get("user-1") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = time.monotonic()
+    cache = LRUCache(max_size=10, ttl=60)
+    cache.set("user-1", {"id": "user-1"})
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.get("user-1") is None
+    assert len(cache) == 0
+
+
+def test_authenticated_users_are_loaded_from_the_database_once(monkeypatch):
+    async def run():
+        stub = PostgrestStub()
+        user = seed(stub, 1, 0, "hash")[0]
+        monkeypatch.setattr(api, "db", Database("http://supabase.test", "key", transport=stub.transport()))
+        await api.db.connect()
+        api.user_cache.clear()
+        try:
+            before = stub.requests
+            assert (await api.load_user(user["id"]))["email"] == user["email"]
+            assert (await api.load_user(user["id"]))["email"] == user["email"]
+            assert stub.requests == before + 1
+
+            api.cache_invalidations.invalidate("user", user["id"])
+            await api.load_user(user["id"])
+            assert stub.requests == before + 2
+        finally:
+            api.user_cache.clear()
+            await api.db.close()
+
+    asyncio.run(run())
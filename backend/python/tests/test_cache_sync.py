@@ -0,0 +1,61 @@
+import asyncio
+
+from benchmarks.stubs import PostgrestStub
+from cache import LRUCache
+from cache_sync import CacheInvalidations
+from repository import Database
+
+
+def test_an_invalidation_reaches_the_other_workers_once():
+    async def run():
+        stub = PostgrestStub()
+        db = Database("http://supabase.test", "key", transport=stub.transport())
+        await db.connect()
+        workers = []
+        for _ in range(2):
+            users = LRUCache(max_size=10, ttl=60)
+            users.set("user-1", {"kyc_level": 3})
+            invalidations = CacheInvalidations(sync_interval=60)
+            invalidations.register("user", users.invalidate)
+            await invalidations.start(db.invalidations)
+            workers.append((users, invalidations))
+        (users_a, a), (users_b, b) = workers
+
+        a.invalidate("user", "user-1")
+        assert users_a.get("user-1") is None
+        assert users_b.get("user-1") is not None
+
+        await a.flush()
+        assert await b.sync() == 1
+        assert users_b.get("user-1") is None
+
+        # Read again within the overlap, and by its own worker: applied nowhere a second time
+        users_b.set("user-1", {"kyc_level": 1})
+        assert await b.sync() == 0
+        assert await a.sync() == 0
+        assert users_b.get("user-1") is not None
+
+        for _, invalidations in workers:
+            await invalidations.stop()
+        await db.close()
+
+    asyncio.run(run())
+
+
+def test_unpublished_invalidations_are_kept_for_the_next_sync():
+    class Unreachable:
+        async def publish(self, rows):
+            raise ConnectionError("database unreachable")
+
+    async def run():
+        invalidations = CacheInvalidations(sync_interval=60)
+        invalidations.register("response", lambda scope: None)
+        invalidations.repository = Unreachable()
+        invalidations.invalidate("response", "user-1")
+        try:
+            await invalidations.flush()
+        except ConnectionError:
+            pass
+        assert invalidations.stats()["pending"] == 1
+
+    asyncio.run(run())
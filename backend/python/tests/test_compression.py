@@ -0,0 +1,104 @@
+import asyncio
+import gzip
+import zlib
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from compression import CompressionMiddleware, accepted_encodings, negotiate, parse_levels
+
+ROWS = [{"id": n, "type": "buy", "amount_brl": 900.0} for n in range(200)]
+
+
+async def rows(request):
+    return JSONResponse(ROWS, headers={"ETag": '"rows-v1"'})
+
+
+async def small(request):
+    return JSONResponse({"ok": True})
+
+
+async def export(request):
+    async def lines():
+        for row in ROWS[:3]:
+            yield JSONResponse.render(None, row) + b"\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def events(request):
+    return Response(b"data: x\n\n" * 500, media_type="text/event-stream")
+
+
+app = CompressionMiddleware(
+    Starlette(routes=[Route("/rows", rows), Route("/small", small), Route("/export", export), Route("/events", events)]),
+    parse_levels("application/json=gzip:6;application/x-ndjson=gzip:1"),
+    minimum_size=1024,
+)
+
+
+def get(path, accept_encoding="gzip"):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            # Raw bytes, so the test sees the encoding on the wire rather than httpx's decoding
+            async with client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+                return response, [chunk async for chunk in response.aiter_raw()]
+
+    return asyncio.run(run())
+
+
+def test_large_json_bodies_are_compressed_and_their_etag_weakened():
+    response, chunks = get("/rows")
+    body = b"".join(chunks)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"rows-v1"'
+    assert int(response.headers["content-length"]) == len(body)
+    assert gzip.decompress(body) == JSONResponse.render(None, ROWS)
+
+
+def test_small_bodies_unlisted_types_and_refused_encodings_pass_through():
+    for path, accept_encoding in (("/small", "gzip"), ("/events", "gzip"), ("/rows", "gzip;q=0, identity")):
+        response, _ = get(path, accept_encoding)
+        assert "content-encoding" not in response.headers, path
+
+
+def test_streamed_rows_can_be_decoded_as_each_chunk_arrives():
+    # Driven directly, since the test transport joins the chunks of a streamed body
+    sent = []
+
+    async def run():
+        scope = {
+            "type": "http", "method": "GET", "path": "/export", "raw_path": b"/export", "root_path": "",
+            "query_string": b"", "headers": [(b"accept-encoding", b"gzip")], "scheme": "http",
+            "server": ("test", 80), "client": ("test", 1234), "http_version": "1.1",
+        }
+
+        async def receive():
+            # The client never disconnects
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+
+    asyncio.run(run())
+    headers = dict(sent[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = [message["body"] for message in sent[1:] if message["body"]]
+    # One chunk per row, then the end of the gzip stream
+    assert len(chunks) == 4
+    for row, chunk in zip(ROWS, chunks[:3]):
+        assert decoder.decompress(chunk) == JSONResponse.render(None, row) + b"\n"
+    assert decoder.decompress(chunks[3]) == b"" and decoder.eof
+
+
+def test_the_clients_ranking_wins_and_ties_go_to_the_servers_order():
+    allowed = [("zstd", 3), ("br", 4), ("gzip", 6)]
+    assert negotiate(accepted_encodings("gzip, br;q=0.5"), allowed) == ("gzip", 6)
+    assert negotiate(accepted_encodings("gzip, br, zstd"), allowed) == ("zstd", 3)
+    assert negotiate(accepted_encodings("*;q=0"), allowed) is None
@@ -0,0 +1,34 @@
+import asyncio
+
+from escrow_scheduler import EscrowExpiryScheduler
+
+
+class LockedElsewhere:
+    async def expire(self, escrow_ids):
+        return {"locked": False}
+
+
+def test_due_escrows_come_out_earliest_first_in_batches():
+    scheduler = EscrowExpiryScheduler(batch_size=2)
+    for escrow_id, expires_at in (("c", 30.0), ("a", 10.0), ("later", 500.0), ("b", 20.0)):
+        scheduler.schedule(escrow_id, expires_at)
+    assert scheduler._pop_due(100.0) == ["a", "b"]
+    assert scheduler._pop_due(100.0) == ["c"]
+    assert scheduler._pop_due(100.0) == []
+    assert scheduler.stats()["scheduled"] == 1
+
+
+def test_rescheduled_escrows_leave_their_old_expiry_behind():
+    scheduler = EscrowExpiryScheduler()
+    scheduler.schedule("a", 10.0)
+    scheduler.schedule("a", 200.0)
+    assert scheduler._pop_due(100.0) == []
+    assert scheduler._pop_due(300.0) == ["a"]
+
+
+def test_batches_locked_by_another_worker_are_retried():
+    scheduler = EscrowExpiryScheduler(retry_delay=1.0)
+    scheduler.repository = LockedElsewhere()
+    assert asyncio.run(scheduler.expire(["a", "b"])) == 0
+    assert scheduler.lock_misses == 1
+    assert sorted(scheduler.scheduled) == ["a", "b"]
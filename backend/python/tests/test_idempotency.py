@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+
+from idempotency import IdempotencyMiddleware, IdempotencyStore, StoredResponse
+
+
+class Counting:
+    """An ASGI app that echoes the request body and counts how often it ran."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        body = (await receive())["body"]
+        await send({"type": "http.response.start", "status": 201, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"n":%d,"echo":%s}' % (self.calls, body)})
+
+
+class DurableStub:
+    def __init__(self):
+        self.records = {}
+
+    async def get(self, key):
+        return self.records.get(key)
+
+    async def save(self, key, fingerprint, response):
+        self.records[key] = {"fingerprint": fingerprint, "response": response}
+
+
+def post_all(middleware, requests):
+    async def run():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api.test") as client:
+            return [await client.post("/api/orders", content=body, headers=headers) for body, headers in requests]
+
+    return asyncio.run(run())
+
+
+def test_retry_is_replayed():
+    app = Counting()
+    store = IdempotencyStore()
+    first, retry = post_all(IdempotencyMiddleware(app, store), [(b"1", {"Idempotency-Key": "k"})] * 2)
+    assert app.calls == 1
+    assert retry.status_code == 201
+    assert retry.content == first.content
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert store.replays == 1
+
+
+def test_key_reused_with_another_body_is_refused():
+    app = Counting()
+    store = IdempotencyStore()
+    _, reused = post_all(IdempotencyMiddleware(app, store), [(b"1", {"Idempotency-Key": "k"}), (b"2", {"Idempotency-Key": "k"})])
+    assert app.calls == 1
+    assert reused.status_code == 422
+    assert store.conflicts == 1
+
+
+def test_keys_follow_the_identified_caller():
+    app = Counting()
+    middleware = IdempotencyMiddleware(app, IdempotencyStore(), identify=lambda scope: "user:1")
+    first, refreshed = post_all(middleware, [
+        (b"1", {"Idempotency-Key": "k", "Authorization": "Bearer old"}),
+        (b"1", {"Idempotency-Key": "k", "Authorization": "Bearer refreshed"}),
+    ])
+    assert app.calls == 1
+    assert refreshed.content == first.content
+
+
+def test_durable_key_reused_with_another_body_is_refused():
+    durable = DurableStub()
+    post_all(IdempotencyMiddleware(Counting(), IdempotencyStore(), lambda: durable), [(b"1", {"Idempotency-Key": "k"})])
+
+    # Another worker, which only has the durable record
+    app = Counting()
+    store = IdempotencyStore()
+    middleware = IdempotencyMiddleware(app, store, lambda: durable)
+    reused, replayed = post_all(middleware, [(b"2", {"Idempotency-Key": "k"}), (b"1", {"Idempotency-Key": "k"})])
+    assert app.calls == 0
+    assert reused.status_code == 422
+    assert replayed.status_code == 201
+
+
+def test_eviction_keeps_in_flight_entries():
+    store = IdempotencyStore(max_entries=2)
+    in_flight = store.begin("a", "f")
+    for key in "bcd":
+        store.complete(key, store.begin(key, "f"), StoredResponse(201, [], b""))
+    assert store.get("a") is in_flight
+    assert len(store) == 2
+    assert store.get("b") is None
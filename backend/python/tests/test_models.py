@@ -0,0 +1,73 @@
+import pytest
+from pydantic import ValidationError
+
+from models import TransactionCreate, UserRegister, cpf_is_valid
+
+
+def registration(**fields):
+    data = {
+        "email": "ana@example.com",
+        "password": "Passw0rd-x",
+        "full_name": "Ana Souza",
+        "cpf": "52998224725",
+        "phone": "11987654321",
+    }
+    data.update(fields)
+    return UserRegister(**data)
+
+
+@pytest.mark.parametrize("cpf", ["52998224725", "11144477735", "01234567890"])
+def test_valid_cpfs(cpf):
+    assert cpf_is_valid(cpf)
+    assert registration(cpf=cpf).cpf == cpf
+
+
+@pytest.mark.parametrize("cpf", [
+    "52998224724",  # wrong second check digit
+    "52998224715",  # wrong first check digit
+    "11111111111",  # repeated digits pass the checksum
+    "00000000000",
+    "5299822472",
+    "529.982.247-25",
+])
+def test_invalid_cpfs_are_rejected(cpf):
+    with pytest.raises(ValidationError):
+        registration(cpf=cpf)
+
+
+@pytest.mark.parametrize("phone", ["11987654321", "2132654321", "4799998888"])
+def test_valid_phones(phone):
+    assert registration(phone=phone).phone == phone
+
+
+@pytest.mark.parametrize("phone", [
+    "01987654321",  # area codes have no zero
+    "10987654321",
+    "11887654321",  # 11 digits is a mobile, which starts with 9
+    "119876543",
+    "(11)98765-4321",
+])
+def test_invalid_phones_are_rejected(phone):
+    with pytest.raises(ValidationError):
+        registration(phone=phone)
+
+
+def order(**fields):
+    data = {"type": "buy", "amount_brl": 100.0, "amount_btc": 0.0003, "price_per_btc": 333333.33, "payment_method": "pix"}
+    data.update(fields)
+    return TransactionCreate(**data)
+
+
+def test_order_amounts_agree_up_to_rounding():
+    assert order().amount_brl == 100.0
+    assert order(amount_brl=35.01, amount_btc=0.00012345, price_per_btc=283600.0).amount_brl == 35.01
+
+
+@pytest.mark.parametrize("fields", [
+    {"amount_brl": 1.0},  # a tiny BRL amount under the KYC limit for a large BTC order
+    {"amount_btc": 1.0},
+    {"price_per_btc": 400000.0},
+])
+def test_order_amounts_that_disagree_are_rejected(fields):
+    with pytest.raises(ValidationError):
+        order(**fields)
@@ -0,0 +1,170 @@
+import asyncio
+
+from benchmarks.stubs import PostgrestStub, seed
+from order_book import MatchingEngine, Order, OrderBook
+from repository import Database
+
+
+def order_row(order_id, user_id, side, price=100.0, amount=1.0):
+    return {
+        "id": order_id,
+        "user_id": user_id,
+        "type": side,
+        "price_per_btc": price,
+        "amount_btc": amount,
+        "status": "pending",
+        "created_at": "2026-01-01T00:00:00+00:00",
+    }
+
+
+def order(order_id, user_id, side, price, quantity):
+    return Order(order_id, user_id, side, price, quantity, row={})
+
+
+def matches(fills):
+    return [(fill.maker.id, fill.price, fill.quantity) for fill in fills]
+
+
+def test_best_price_matches_first_at_the_resting_price():
+    book = OrderBook("BTC/BRL")
+    book.submit(order("ask-high", "a", "sell", 101, 5))
+    book.submit(order("ask-low", "b", "sell", 100, 5))
+    fills = book.submit(order("bid", "c", "buy", 102, 7))
+    assert matches(fills) == [("ask-low", 100, 5), ("ask-high", 101, 2)]
+    assert book.depth(5) == ([], [(101, 3, 1)])
+
+
+def test_oldest_order_matches_first_within_a_level():
+    book = OrderBook("BTC/BRL")
+    book.submit(order("first", "a", "buy", 100, 3))
+    book.submit(order("second", "b", "buy", 100, 3))
+    fills = book.submit(order("ask", "c", "sell", 99, 4))
+    assert matches(fills) == [("first", 100, 3), ("second", 100, 1)]
+    assert book.depth(5) == ([(100, 2, 1)], [])
+
+
+def test_orders_do_not_match_their_own_user():
+    book = OrderBook("BTC/BRL")
+    book.submit(order("own", "a", "sell", 100, 2))
+    book.submit(order("other", "b", "sell", 100, 2))
+    fills = book.submit(order("bid", "a", "buy", 100, 3))
+    assert matches(fills) == [("other", 100, 2)]
+    # The skipped order keeps its place, and the rest of the bid rests
+    assert book.depth(5) == ([(100, 1, 1)], [(100, 2, 1)])
+    assert matches(book.submit(order("bid-2", "c", "buy", 100, 1))) == [("own", 100, 1)]
+
+
+def test_orders_that_do_not_cross_rest():
+    book = OrderBook("BTC/BRL")
+    book.submit(order("ask", "a", "sell", 101, 1))
+    assert book.submit(order("bid", "b", "buy", 100, 1)) == []
+    assert book.depth(5) == ([(100, 1, 1)], [(101, 1, 1)])
+
+
+def test_cancelled_orders_are_not_matched():
+    book = OrderBook("BTC/BRL")
+    book.submit(order("cancelled", "a", "sell", 100, 1))
+    book.submit(order("live", "b", "sell", 100, 1))
+    assert book.cancel("cancelled").id == "cancelled"
+    assert book.depth(5) == ([], [(100, 1, 1)])
+    assert matches(book.submit(order("bid", "c", "buy", 100, 2))) == [("live", 100, 1)]
+    assert book.cancel("cancelled") is None
+
+
+def test_fills_are_stored_with_users_ids():
+    async def run():
+        stub = PostgrestStub()
+        seller, buyer = seed(stub, 2, 0, "hash")
+        db = Database("http://supabase.test", "key", transport=stub.transport())
+        await db.connect()
+        engine = MatchingEngine(flush_interval=3600)
+        await engine.start(db.orders)
+        engine.submit(order_row("sell-1", seller["id"], "sell"))
+        engine.submit(order_row("buy-1", buyer["id"], "buy"))
+        await engine.stop()
+        await db.close()
+        return stub, seller, buyer, engine.written
+
+    stub, seller, buyer, written = asyncio.run(run())
+    escrows = stub.table("escrow_transactions").rows
+    assert written == 1
+    assert [(e["seller_id"], e["buyer_id"], e["transaction_id"], e["buy_transaction_id"]) for e in escrows] == [
+        (seller["id"], buyer["id"], "sell-1", "buy-1")
+    ]
+
+
+def test_fill_rejected_by_the_database_does_not_block_the_rest():
+    async def run():
+        stub = PostgrestStub()
+        seller, buyer = seed(stub, 2, 0, "hash")
+        db = Database("http://supabase.test", "key", transport=stub.transport())
+        await db.connect()
+        engine = MatchingEngine(flush_interval=3600, max_attempts=2)
+        await engine.start(db.orders)
+        # "ghost" is not in users, so its escrow fails the foreign key check
+        engine.submit(order_row("sell-1", "ghost", "sell"))
+        engine.submit(order_row("buy-1", buyer["id"], "buy"))
+        engine.submit(order_row("sell-2", seller["id"], "sell"))
+        engine.submit(order_row("buy-2", buyer["id"], "buy"))
+        for _ in range(3):
+            await engine.flush()
+        await engine.stop()
+        await db.close()
+        return stub, engine
+
+    stub, engine = asyncio.run(run())
+    assert [e["transaction_id"] for e in stub.table("escrow_transactions").rows] == ["sell-2"]
+    assert engine.stats()["dropped"] == 1
+    assert engine.stats()["pending"] == 0
+
+
+def test_a_full_backlog_defers_matching_and_keeps_orders_and_escrows_consistent():
+    class Outage:
+        """The order repository, with writes failing while ``down`` is set."""
+
+        def __init__(self, orders):
+            self.orders = orders
+            self.down = True
+
+        async def open_orders(self, limit, after=None):
+            return await self.orders.open_orders(limit, after=after)
+
+        async def apply_fills(self, orders, escrows):
+            if self.down:
+                raise RuntimeError("database unavailable")
+            await self.orders.apply_fills(orders, escrows)
+
+    async def run():
+        stub = PostgrestStub()
+        seller, buyer = seed(stub, 2, 0, "hash")
+        db = Database("http://supabase.test", "key", transport=stub.transport())
+        await db.connect()
+        repository = Outage(db.orders)
+        engine = MatchingEngine(flush_interval=3600, max_pending=1)
+        await engine.start(repository)
+        for n in range(2):
+            for order_id, user, side in ((f"sell-{n}", seller, "sell"), (f"buy-{n}", buyer, "buy")):
+                row = order_row(order_id, user["id"], side)
+                row["created_at"] = f"2026-01-01T00:00:0{n}+00:00"
+                stub.table("transactions").insert(dict(row))
+                engine.submit(row)
+        await engine.flush()
+        during = (sorted(engine.pending_orders), sorted(engine.book.orders), engine.stats())
+
+        repository.down = False
+        await engine.flush()
+        await engine.stop()
+        await db.close()
+        return stub, engine, during
+
+    stub, engine, (pending_orders, book_orders, stats) = asyncio.run(run())
+    # While the first fill could not be written, the second pair was neither matched nor booked
+    assert pending_orders == ["buy-0", "sell-0"]
+    assert book_orders == []
+    assert (stats["pending"], stats["deferred"], stats["dropped"]) == (1, 2, 0)
+    # Once it was written, the deferred pair was loaded again and matched
+    escrows = stub.table("escrow_transactions").rows
+    assert sorted(e["transaction_id"] for e in escrows) == ["sell-0", "sell-1"]
+    stored = {row["id"]: (row["status"], row["filled_btc"]) for row in stub.table("transactions").rows}
+    assert stored == {order_id: ("matched", 1.0) for order_id in ("sell-0", "buy-0", "sell-1", "buy-1")}
+    assert engine.stats()["pending"] == 0
@@ -0,0 +1,55 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from benchmarks.stubs import PostgrestStub, seed
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from repository import Database
+
+
+def raw_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    position = ("2026-01-01T12:00:00.123456+00:00", "0b7c3f6e-8d0e-4d8b-9a41-3c5b2f1d7e60")
+    assert decode_cursor(encode_cursor(*position)) == position
+    assert decode_cursor(None) is None
+    assert decode_cursor("") is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    raw_cursor("2026-01-01T00:00:00+00:00"),
+    raw_cursor(1, "0b7c3f6e-8d0e-4d8b-9a41-3c5b2f1d7e60"),
+    raw_cursor("2026-01-01T00:00:00+00:00,id.gt.0)", "0b7c3f6e-8d0e-4d8b-9a41-3c5b2f1d7e60"),
+    raw_cursor("2026-01-01T00:00:00+00:00", '0b7c3f6e")'),
+    raw_cursor("yesterday", "0b7c3f6e-8d0e-4d8b-9a41-3c5b2f1d7e60"),
+])
+def test_crafted_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_pages_follow_the_cursor():
+    async def run():
+        stub = PostgrestStub()
+        (user,) = seed(stub, 1, 5, "hash")
+        db = Database("http://supabase.test", "key", transport=stub.transport())
+        await db.connect()
+        pages, before = [], None
+        while True:
+            page = await db.transactions.list_for_user(user["id"], 2, before=before)
+            if not page:
+                break
+            pages.append([row["id"] for row in page])
+            before = decode_cursor(encode_cursor(page[-1]["created_at"], page[-1]["id"]))
+        everything = await db.transactions.list_for_user(user["id"], 10)
+        await db.close()
+        return pages, [row["id"] for row in everything]
+
+    pages, everything = asyncio.run(run())
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [row_id for page in pages for row_id in page] == everything
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timezone
+
+from models import BitcoinPriceResponse
+from price_history import CandleSeries, PriceHistory
+
+# A minute boundary, so the ticks below fall into known buckets
+T0 = 1_790_000_040
+
+
+def quote(ts, price):
+    return BitcoinPriceResponse(
+        price_brl=price,
+        price_usd=price / 5,
+        last_updated=datetime.fromtimestamp(ts, tz=timezone.utc),
+        change_24h=0.0,
+        volume_24h=0.0,
+        sources=["coingecko"],
+    )
+
+
+def isoformat(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+class Repository:
+    def __init__(self, stored=(), failures=0):
+        self.stored = list(stored)
+        self.failures = failures
+        self.ticks = []
+        self.candle_reads = 0
+
+    async def recent_candles(self, symbol, bucket_seconds, limit):
+        # Newest first, like the rollup table query
+        return [row for row in reversed(self.stored) if row["bucket_seconds"] == bucket_seconds][:limit]
+
+    async def candles(self, symbol, bucket_seconds, start, end):
+        self.candle_reads += 1
+        return [
+            row for row in self.stored
+            if row["bucket_seconds"] == bucket_seconds and start <= row["bucket_start"] < end
+        ]
+
+    async def insert_ticks(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unreachable")
+        self.ticks.extend(rows)
+
+    async def rollup(self, symbol, since):
+        pass
+
+
+def test_ticks_are_folded_into_ohlc_candles():
+    series = CandleSeries(60, 10)
+    for offset, price in ((0, 100.0), (10, 120.0), (20, 90.0), (50, 110.0), (60, 105.0)):
+        series.add(T0 + offset, price)
+
+    assert series.range(T0, T0 + 120) == [
+        (T0, [100.0, 120.0, 90.0, 110.0, 4]),
+        (T0 + 60, [105.0, 105.0, 105.0, 105.0, 1]),
+    ]
+
+
+def test_old_candles_come_from_the_rollup_table_and_recent_ones_from_memory():
+    async def run():
+        stored = [{
+            "bucket_seconds": 60,
+            "bucket_start": isoformat(T0 - 60),
+            "open": 80, "high": 95, "low": 70, "close": 90, "ticks": 12,
+        }]
+        repository = Repository(stored)
+        history = PriceHistory(persist=False)
+        await history.start(repository)
+        history.record(quote(T0 + 5, 100.0))
+        history.record(quote(T0 + 65, 101.0))
+
+        candles = await history.candles("1m", T0 - 60, T0 + 120)
+        assert [(int(c.start.timestamp()), c.open, c.close, c.ticks) for c in candles] == [
+            (T0 - 60, 80.0, 90.0, 12),
+            (T0, 100.0, 100.0, 1),
+            (T0 + 60, 101.0, 101.0, 1),
+        ]
+
+        # A recent window is answered from memory alone
+        reads = repository.candle_reads
+        recent = await history.candles("1m", T0 + 60, T0 + 120)
+        assert [c.close for c in recent] == [101.0]
+        assert repository.candle_reads == reads
+
+    asyncio.run(run())
+
+
+def test_unwritten_ticks_are_retried_and_capped():
+    async def run():
+        repository = Repository(failures=1)
+        history = PriceHistory(max_pending=2)
+        history.repository = repository
+        for n in range(3):
+            history.record(quote(T0 + n, 100.0 + n))
+        assert history.stats()["dropped"] == 1
+
+        assert await history.flush() == 0
+        assert await history.flush() == 2
+        assert [tick["price_brl"] for tick in repository.ticks] == [101.0, 102.0]
+
+    asyncio.run(run())
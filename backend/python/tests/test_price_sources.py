@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from price_sources import BinanceSource, CoinGeckoSource, MercadoBitcoinSource, PriceAggregator, PriceQuote, PriceSource
+
+
+def aggregator(method):
+    return PriceAggregator([CoinGeckoSource(), BinanceSource(), MercadoBitcoinSource()], method=method)
+
+
+def test_vwap_leaves_aggregator_volume_out_of_the_weights():
+    quotes = [
+        PriceQuote("coingecko", 400000.0, volume_24h=1e12, aggregate_volume=True),
+        PriceQuote("binance", 300000.0, volume_24h=3e6),
+        PriceQuote("mercadobitcoin", 340000.0, volume_24h=1e6),
+    ]
+    assert aggregator("vwap").combine(quotes).price_brl == 310000.0
+
+
+def test_vwap_without_exchange_volume_falls_back_to_the_median():
+    quotes = [
+        PriceQuote("coingecko", 400000.0, volume_24h=1e12, aggregate_volume=True),
+        PriceQuote("mercadobitcoin", 340000.0),
+    ]
+    assert aggregator("vwap").combine(quotes).price_brl == 370000.0
+
+
+class FakeSource(PriceSource):
+    def __init__(self, name, answer):
+        self.name = name
+        self.answer = answer
+        self.calls = 0
+
+    async def fetch(self, client):
+        self.calls += 1
+        return await self.answer()
+
+
+def test_hedge_cancelled_before_it_starts_gives_back_the_trial_slot():
+    async def run():
+        release = asyncio.Event()
+
+        async def quote():
+            return PriceQuote("fake", 300000.0)
+
+        async def fail_on_release():
+            await release.wait()
+            raise RuntimeError("source down")
+
+        async def release_and_quote():
+            release.set()
+            return await quote()
+
+        recovering = FakeSource("recovering", quote)
+        aggregator = PriceAggregator(
+            [FakeSource("first", quote), FakeSource("failing", fail_on_release), FakeSource("hedge", release_and_quote), recovering],
+            hedge_delay=0.01,
+            quorum=2,
+            failure_threshold=1,
+            reset_timeout=60.0,
+        )
+        breaker = aggregator.breakers["recovering"]
+        breaker.record_failure()
+        breaker.opened_at = time.monotonic() - 60.0
+        # "failing" fails as "hedge" completes the quorum, which launches "recovering" only to cancel it
+        await aggregator.fetch(None)
+        return recovering.calls, breaker.state, breaker.allow()
+
+    calls, state, allowed = asyncio.run(run())
+    assert calls == 0
+    assert state == "half_open"
+    assert allowed
@@ -0,0 +1,37 @@
+import asyncio
+
+import rate_limit
+from rate_limit import InMemoryBucketBackend, RatePolicy
+
+
+def test_bucket_refills_at_the_policy_rate(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: clock[0])
+    backend = InMemoryBucketBackend()
+    policy = RatePolicy.parse("auth", "2/10")
+
+    async def take():
+        return await backend.take("ip:1", policy)
+
+    assert asyncio.run(take()) == (True, 0.0)
+    assert asyncio.run(take()) == (True, 0.0)
+    assert asyncio.run(take()) == (False, 5.0)
+    clock[0] += 5
+    assert asyncio.run(take()) == (True, 0.0)
+    # A long pause refills the bucket only up to its capacity
+    clock[0] += 3600
+    assert [asyncio.run(take())[0] for _ in range(3)] == [True, True, False]
+
+
+def test_idle_keys_are_evicted_first():
+    backend = InMemoryBucketBackend(max_keys=2)
+    policy = RatePolicy.parse("default", "1/60")
+
+    async def run():
+        for key in ("a", "b", "a", "c"):
+            await backend.take(key, policy)
+        # "a" was used after "b", so "b" was evicted and starts with a full bucket again
+        return await backend.take("a", policy), await backend.take("b", policy)
+
+    (a_allowed, _), (b_allowed, _) = asyncio.run(run())
+    assert b_allowed and not a_allowed
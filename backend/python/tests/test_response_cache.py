@@ -0,0 +1,67 @@
+import asyncio
+
+import httpx
+
+import app as api
+from benchmarks.stubs import PostgrestStub, seed
+from repository import Database
+from response_cache import CachedResponse, ResponseCache, etag_matches, make_etag
+
+
+def test_invalidating_a_scope_hides_its_entries_but_not_others():
+    cache = ResponseCache(max_size=10, ttl=60)
+    mine = cache.key("user-1", "profile")
+    theirs = cache.key("user-2", "profile")
+    cache.set(mine, CachedResponse(b"{}", make_etag("user-1")))
+    cache.set(theirs, CachedResponse(b"{}", make_etag("user-2")))
+
+    cache.invalidate("user-1")
+    assert cache.get(cache.key("user-1", "profile")) is None
+    assert cache.get(cache.key("user-2", "profile")) is not None
+
+
+def test_a_key_taken_before_a_write_never_serves_the_older_body():
+    cache = ResponseCache(max_size=10, ttl=60)
+    # The request reads the key, then a write lands before it stores what it read
+    key = cache.key("user-1", "page-1")
+    cache.invalidate("user-1")
+    cache.set(key, CachedResponse(b"[]", make_etag("stale")))
+    assert cache.get(cache.key("user-1", "page-1")) is None
+
+
+def test_if_none_match_uses_weak_comparison():
+    etag = make_etag("profile", "user-1")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_a_repeated_profile_poll_is_answered_with_304(monkeypatch):
+    async def run():
+        stub = PostgrestStub()
+        user = seed(stub, 1, 0, "hash")[0]
+        monkeypatch.setattr(api, "db", Database("http://supabase.test", "key", transport=stub.transport()))
+        await api.db.connect()
+        headers = {"Authorization": f"Bearer {api.token_authority.issue({'sub': user['id']})}"}
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+                first = await client.get("/api/user/profile", headers=headers)
+                requests = stub.requests
+                second = await client.get(
+                    "/api/user/profile", headers={**headers, "If-None-Match": first.headers["etag"]}
+                )
+        finally:
+            api.user_cache.clear()
+            await api.db.close()
+
+        assert first.status_code == 200
+        assert first.json()["email"] == user["email"]
+        assert first.headers["cache-control"] == "private, no-cache"
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["etag"] == first.headers["etag"]
+        assert stub.requests == requests
+
+    asyncio.run(run())
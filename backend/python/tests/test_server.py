@@ -0,0 +1,79 @@
+import os
+import signal
+
+from server import Supervisor
+
+
+class FakeProcesses:
+    """Stands in for fork, kill and waitpid, so the supervisor's bookkeeping runs without real workers."""
+
+    def __init__(self, supervisor, monkeypatch):
+        self.supervisor = supervisor
+        self.next_pid = 100
+        self.killed = []
+        self.exited = []
+        monkeypatch.setattr(supervisor, "_spawn", self.spawn)
+        monkeypatch.setattr(os, "kill", lambda pid, sig: self.killed.append((pid, sig)))
+        monkeypatch.setattr(os, "waitpid", self.waitpid)
+        monkeypatch.setattr(os, "waitstatus_to_exitcode", lambda status: status)
+
+    def spawn(self, index):
+        self.next_pid += 1
+        self.supervisor.children[self.next_pid] = index
+
+    def pid_of(self, index):
+        return max(pid for pid, i in self.supervisor.children.items() if i == index)
+
+    def waitpid(self, pid, options):
+        return self.exited.pop(0) if self.exited else (0, 0)
+
+
+def test_a_crash_during_scale_down_is_still_restarted(monkeypatch):
+    supervisor = Supervisor(app=None, workers=3)
+    processes = FakeProcesses(supervisor, monkeypatch)
+    for index in range(3):
+        processes.spawn(index)
+
+    supervisor._signals.append(signal.SIGTTOU)
+    supervisor._dispatch_signals()
+    retired = processes.pid_of(2)
+    assert processes.killed == [(retired, signal.SIGTERM)]
+    assert supervisor.workers == 2
+
+    # Worker 1 crashes while worker 2 drains; only worker 2's exit was asked for
+    crashed = processes.pid_of(1)
+    processes.exited = [(crashed, 1), (retired, 0)]
+    supervisor._reap()
+    assert sorted(supervisor.children.values()) == [0, 1]
+    assert crashed not in supervisor.children
+    assert supervisor.retiring == set()
+
+
+def test_scale_down_never_removes_worker_0(monkeypatch):
+    supervisor = Supervisor(app=None, workers=2)
+    processes = FakeProcesses(supervisor, monkeypatch)
+    for index in range(2):
+        processes.spawn(index)
+
+    supervisor._signals.extend([signal.SIGTTOU, signal.SIGTTOU])
+    supervisor._dispatch_signals()
+    assert processes.killed == [(processes.pid_of(1), signal.SIGTERM)]
+    assert supervisor.workers == 1
+
+
+def test_a_retired_worker_is_not_replaced_after_scaling_up_again(monkeypatch):
+    supervisor = Supervisor(app=None, workers=2)
+    processes = FakeProcesses(supervisor, monkeypatch)
+    for index in range(2):
+        processes.spawn(index)
+
+    supervisor._signals.append(signal.SIGTTOU)
+    supervisor._dispatch_signals()
+    retired = processes.pid_of(1)
+    supervisor._signals.append(signal.SIGTTIN)
+    supervisor._dispatch_signals()
+    assert supervisor.workers == 2
+
+    processes.exited = [(retired, 0)]
+    supervisor._reap()
+    assert sorted(supervisor.children.values()) == [0, 1]
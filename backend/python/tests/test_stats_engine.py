@@ -0,0 +1,36 @@
+import asyncio
+
+from stats_engine import StatsEngine
+
+
+class SlowRepository:
+    """Returns an empty platform, but only once ``release`` is set."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def platform_stats(self, since):
+        await self.release.wait()
+        return {"total_users": 0, "total_transactions": 0, "total_volume_brl": 0, "total_volume_btc": 0}
+
+    async def activity(self, since, bucket_seconds):
+        return []
+
+
+def test_writes_recorded_during_a_reconcile_are_kept():
+    async def run():
+        engine = StatsEngine()
+        engine.repository = SlowRepository()
+        reconciling = asyncio.create_task(engine.reconcile())
+        await asyncio.sleep(0)
+        engine.record_user()
+        engine.record_transaction("user-1", 100.0, 0.001)
+        engine.repository.release.set()
+        await reconciling
+        return engine.snapshot()
+
+    snapshot = asyncio.run(run())
+    assert snapshot["total_users"] == 1
+    assert snapshot["total_transactions"] == 1
+    assert snapshot["total_volume_brl"] == 100.0
+    assert snapshot["windows"]["1h"] == {"transactions": 1, "active_users": 1, "volume_brl": 100.0, "volume_btc": 0.001}
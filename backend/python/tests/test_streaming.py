@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import app as api
+from models import BitcoinPriceResponse
+from price_service import PRICE_CACHE_KEY
+from streaming import Broadcaster, transactions_topic
+
+# No lifespan: the streams only need the broadcaster and the token authority, not the database
+client = TestClient(api.app)
+
+
+def auth_headers(user_id):
+    return {"Authorization": f"Bearer {api.token_authority.issue({'sub': user_id})}"}
+
+
+def test_a_stream_ticket_opens_one_websocket():
+    ticket = client.post("/api/stream/ticket", headers=auth_headers("user-1")).json()["ticket"]
+
+    with client.websocket_connect(f"/api/stream/ws?topics=transactions&ticket={ticket}") as websocket:
+        websocket.portal.call(api.broadcaster.publish, transactions_topic("user-1"), "transaction", {"id": "tx-1"})
+        assert websocket.receive_json() == {"event": "transaction", "data": {"id": "tx-1"}}
+
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect(f"/api/stream/ws?topics=transactions&ticket={ticket}") as websocket:
+            websocket.receive_json()
+    assert refused.value.code == 1008
+
+
+def test_access_tokens_are_not_accepted_in_the_url():
+    token = api.token_authority.issue({"sub": "user-1"})
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect(f"/api/stream/ws?topics=transactions&ticket={token}") as websocket:
+            websocket.receive_json()
+    assert refused.value.code == 1008
+
+    response = client.get(f"/api/stream/events?topics=transactions&access_token={token}")
+    assert response.status_code == 401
+
+
+def test_price_streams_start_with_the_cached_quote():
+    quote = BitcoinPriceResponse(
+        price_brl=300000.0, price_usd=60000.0, last_updated=datetime.now(timezone.utc), change_24h=0.0, volume_24h=0.0
+    )
+    api.price_service.cache.set(PRICE_CACHE_KEY, quote)
+    try:
+        with client.websocket_connect("/api/stream/ws?topics=price") as websocket:
+            message = websocket.receive_json()
+        assert message["event"] == "price"
+        assert message["data"]["price_brl"] == 300000.0
+    finally:
+        api.price_service.cache.invalidate(PRICE_CACHE_KEY)
+
+
+def test_a_subscriber_that_falls_behind_is_dropped_without_slowing_the_others():
+    async def run():
+        broadcaster = Broadcaster(queue_size=2)
+        slow = broadcaster.subscribe(["price"])
+        fast = broadcaster.subscribe(["price"])
+        for n in range(3):
+            broadcaster.publish("price", "price", {"n": n})
+            if n < 2:
+                assert (await fast.get()).name == "price"
+        assert (await fast.get()).text == '{"event":"price","data":{"n":2}}'
+        assert await slow.get() is None
+        assert broadcaster.stats()["dropped"] == 1
+
+    asyncio.run(run())
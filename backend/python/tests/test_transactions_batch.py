@@ -0,0 +1,56 @@
+import asyncio
+
+import httpx
+
+import app as api
+from benchmarks.stubs import PostgrestStub, seed
+from repository import Database
+
+
+def order(amount_brl):
+    return {
+        "type": "buy",
+        "amount_brl": amount_brl,
+        "amount_btc": amount_brl / 300000,
+        "price_per_btc": 300000,
+        "payment_method": "pix",
+    }
+
+
+def test_a_batch_is_stored_in_one_insert_up_to_the_kyc_limits(monkeypatch):
+    async def run():
+        stub = PostgrestStub()
+        # The second seeded user is at KYC level 1: R$ 1,000 per transaction, R$ 5,000 per batch
+        user = seed(stub, 2, 0, "hash")[1]
+        inserts = []
+
+        async def handle(request):
+            if request.method == "POST" and request.url.path.endswith("/transactions"):
+                inserts.append(request)
+            return await stub.handle(request)
+
+        monkeypatch.setattr(api, "db", Database("http://supabase.test", "key", transport=httpx.MockTransport(handle)))
+        await api.db.connect()
+        headers = {"Authorization": f"Bearer {api.token_authority.issue({'sub': user['id']})}"}
+        batch = {"transactions": [order(900), order(1200), order(900), order(900), order(900), order(900), order(900)]}
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+                response = await client.post("/api/transactions/batch", json=batch, headers=headers)
+        finally:
+            api.user_cache.clear()
+            await api.db.close()
+
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["created"], body["existing"], body["rejected"]) == (5, 0, 2)
+        assert [r["index"] for r in body["results"]] == list(range(7))
+        assert [r["status"] for r in body["results"]] == [
+            "created", "rejected", "created", "created", "created", "created", "rejected",
+        ]
+        assert "KYC level 1 limit" in body["results"][1]["error"]
+        assert "batch limit" in body["results"][6]["error"]
+        assert len(inserts) == 1
+        stored = stub.table("transactions").rows
+        assert [row["id"] for row in stored] == [r["transaction"]["id"] for r in body["results"] if r["transaction"]]
+
+    asyncio.run(run())